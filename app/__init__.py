@@ -33,12 +33,123 @@ def create_app():
     app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     
+    # IoT ingestion configuration
+    app.config['IOT_MAX_BATCH_SIZE'] = int(os.environ.get('IOT_MAX_BATCH_SIZE') or 5000)
+    app.config['IOT_DEVICE_CACHE_SIZE'] = int(os.environ.get('IOT_DEVICE_CACHE_SIZE') or 10000)
+    app.config['IOT_STREAM_BATCH_SIZE'] = int(os.environ.get('IOT_STREAM_BATCH_SIZE') or 500)
+    app.config['IOT_STREAM_FLUSH_SECONDS'] = float(os.environ.get('IOT_STREAM_FLUSH_SECONDS') or 1.0)
+    app.config['IOT_LIVE_QUEUE_SIZE'] = int(os.environ.get('IOT_LIVE_QUEUE_SIZE') or 100)
+    app.config['IOT_LIVE_KEEPALIVE_SECONDS'] = int(os.environ.get('IOT_LIVE_KEEPALIVE_SECONDS') or 15)
+    app.config['IOT_LIVE_MAX_SUBSCRIBERS'] = int(os.environ.get('IOT_LIVE_MAX_SUBSCRIBERS') or 16)
+    
+    # Device liveness: offline after this long without readings; last_seen
+    # writes are batched and the sweeper runs every interval
+    app.config['IOT_DEVICE_OFFLINE_SECONDS'] = int(os.environ.get('IOT_DEVICE_OFFLINE_SECONDS') or 300)
+    app.config['IOT_LIVENESS_INTERVAL_SECONDS'] = int(os.environ.get('IOT_LIVENESS_INTERVAL_SECONDS') or 30)
+    app.config['IOT_LIVENESS_SWEEPER'] = os.environ.get('IOT_LIVENESS_SWEEPER', 'true').lower() in ['true', 'on', '1']
+    
+    # Actuator command long-polling
+    app.config['IOT_COMMAND_POLL_TIMEOUT'] = int(os.environ.get('IOT_COMMAND_POLL_TIMEOUT') or 25)
+    app.config['IOT_COMMAND_RECHECK_SECONDS'] = int(os.environ.get('IOT_COMMAND_RECHECK_SECONDS') or 60)
+    
+    # Alert rules evaluated on ingest
+    app.config['IOT_ALERTS_ENABLED'] = os.environ.get('IOT_ALERTS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    app.config['IOT_ALERT_WINDOW_SIZE'] = int(os.environ.get('IOT_ALERT_WINDOW_SIZE') or 60)
+    app.config['IOT_ALERT_MIN_SAMPLES'] = int(os.environ.get('IOT_ALERT_MIN_SAMPLES') or 10)
+    app.config['IOT_ALERT_RULES_RELOAD_SECONDS'] = int(os.environ.get('IOT_ALERT_RULES_RELOAD_SECONDS') or 30)
+    
+    # IoT history retention in days per storage tier (0 keeps forever)
+    app.config['IOT_RAW_RETENTION_DAYS'] = int(os.environ.get('IOT_RAW_RETENTION_DAYS') or 30)
+    app.config['IOT_MINUTE_RETENTION_DAYS'] = int(os.environ.get('IOT_MINUTE_RETENTION_DAYS') or 90)
+    app.config['IOT_HOURLY_RETENTION_DAYS'] = int(os.environ.get('IOT_HOURLY_RETENTION_DAYS') or 730)
+    app.config['IOT_DAILY_RETENTION_DAYS'] = int(os.environ.get('IOT_DAILY_RETENTION_DAYS') or 0)
+    
+    # Columnar archive of closed IoT history windows
+    app.config['IOT_ARCHIVE_ENABLED'] = os.environ.get('IOT_ARCHIVE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    app.config['IOT_ARCHIVE_DIR'] = os.environ.get('IOT_ARCHIVE_DIR') or os.path.join(app.instance_path, 'iot_archive')
+    app.config['IOT_ARCHIVE_DELAY_HOURS'] = int(os.environ.get('IOT_ARCHIVE_DELAY_HOURS') or 2)
+    
+    # Resampled multi-device series (/api/iot/series)
+    app.config['IOT_SERIES_MAX_DEVICES'] = int(os.environ.get('IOT_SERIES_MAX_DEVICES') or 20)
+    app.config['IOT_SERIES_MAX_BUCKETS'] = int(os.environ.get('IOT_SERIES_MAX_BUCKETS') or 5000)
+    app.config['IOT_SERIES_DEFAULT_POINTS'] = int(os.environ.get('IOT_SERIES_DEFAULT_POINTS') or 500)
+    
+    # Shared cache for upstream API responses: 'memory' (per process) or 'redis'
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND') or 'memory'
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES') or 1024)
+    
+    # Weather responses are fresh for the TTL, then served stale while refreshed
+    app.config['WEATHER_CACHE_TTL_SECONDS'] = int(os.environ.get('WEATHER_CACHE_TTL_SECONDS') or 600)
+    app.config['WEATHER_FORECAST_TTL_SECONDS'] = int(os.environ.get('WEATHER_FORECAST_TTL_SECONDS') or 3600)
+    app.config['WEATHER_CACHE_STALE_SECONDS'] = int(os.environ.get('WEATHER_CACHE_STALE_SECONDS') or 3600)
+    
+    # Background refresh of the weather locations users look at
+    app.config['WEATHER_REFRESHER'] = os.environ.get('WEATHER_REFRESHER', 'true').lower() in ['true', 'on', '1']
+    app.config['WEATHER_REFRESH_INTERVAL_SECONDS'] = int(os.environ.get('WEATHER_REFRESH_INTERVAL_SECONDS') or 600)
+    app.config['WEATHER_REFRESH_WORKERS'] = int(os.environ.get('WEATHER_REFRESH_WORKERS') or 4)
+    app.config['WEATHER_ACTIVE_LOCATION_HOURS'] = int(os.environ.get('WEATHER_ACTIVE_LOCATION_HOURS') or 24)
+    app.config['WEATHER_MAX_TRACKED_LOCATIONS'] = int(os.environ.get('WEATHER_MAX_TRACKED_LOCATIONS') or 500)
+    
+    # Nearby locations share weather per grid cell of WEATHER_GRID_DEGREES
+    app.config['WEATHER_GRID_DEGREES'] = float(os.environ.get('WEATHER_GRID_DEGREES') or 0.1)
+    app.config['GEOCODE_RETRY_HOURS'] = int(os.environ.get('GEOCODE_RETRY_HOURS') or 24)
+    
+    # Gemini is initialized on first use (or by a warm-up thread), never at startup
+    app.config['GEMINI_API_KEY'] = os.environ.get('GEMINI_API_KEY')
+    app.config['GEMINI_MODEL'] = os.environ.get('GEMINI_MODEL')
+    app.config['GEMINI_WARMUP'] = os.environ.get('GEMINI_WARMUP', 'true').lower() in ['true', 'on', '1']
+    app.config['GEMINI_MODEL_CACHE_FILE'] = os.environ.get('GEMINI_MODEL_CACHE_FILE') or os.path.join(app.instance_path, 'gemini_model.json')
+    app.config['GEMINI_MODEL_CACHE_TTL_SECONDS'] = int(os.environ.get('GEMINI_MODEL_CACHE_TTL_SECONDS') or 86400)
+    app.config['GEMINI_RETRY_SECONDS'] = int(os.environ.get('GEMINI_RETRY_SECONDS') or 300)
+    
+    # Chatbot answers reused for the same or a similar question (cosine similarity)
+    app.config['CHAT_CACHE_ENABLED'] = os.environ.get('CHAT_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    app.config['CHAT_CACHE_MAX_ENTRIES'] = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES') or 2000)
+    app.config['CHAT_CACHE_TTL_SECONDS'] = int(os.environ.get('CHAT_CACHE_TTL_SECONDS') or 86400)
+    app.config['CHAT_CACHE_SIMILARITY'] = float(os.environ.get('CHAT_CACHE_SIMILARITY') or 0.85)
+    
+    # Recent turns and a rolling summary per chat session, fitted into each prompt's token budget
+    app.config['CHAT_CONTEXT_ENABLED'] = os.environ.get('CHAT_CONTEXT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    app.config['CHAT_CONTEXT_TURNS'] = int(os.environ.get('CHAT_CONTEXT_TURNS') or 6)
+    app.config['CHAT_CONTEXT_TOKEN_BUDGET'] = int(os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET') or 2000)
+    app.config['CHAT_CONTEXT_SUMMARY_TOKENS'] = int(os.environ.get('CHAT_CONTEXT_SUMMARY_TOKENS') or 300)
+    app.config['CHAT_CONTEXT_MAX_SESSIONS'] = int(os.environ.get('CHAT_CONTEXT_MAX_SESSIONS') or 5000)
+    app.config['CHAT_CONTEXT_TTL_SECONDS'] = int(os.environ.get('CHAT_CONTEXT_TTL_SECONDS') or 86400)
+    
+    # LLM calls run on a bounded pool with a deadline and a circuit breaker (see app.utils.llm)
+    app.config['LLM_BACKEND'] = os.environ.get('LLM_BACKEND', 'gemini').lower()
+    app.config['LLM_HTTP_URL'] = os.environ.get('LLM_HTTP_URL')
+    app.config['LLM_MAX_CONCURRENCY'] = int(os.environ.get('LLM_MAX_CONCURRENCY') or 8)
+    app.config['LLM_MAX_QUEUED'] = int(os.environ.get('LLM_MAX_QUEUED') or 32)
+    app.config['LLM_DEADLINE_SECONDS'] = float(os.environ.get('LLM_DEADLINE_SECONDS') or 20)
+    app.config['LLM_SLOW_CALL_SECONDS'] = float(os.environ.get('LLM_SLOW_CALL_SECONDS') or 10)
+    app.config['LLM_BREAKER_FAILURES'] = int(os.environ.get('LLM_BREAKER_FAILURES') or 5)
+    app.config['LLM_BREAKER_COOLDOWN_SECONDS'] = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS') or 30)
+    
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)  # Initialize migrate here with app and db
     mail.init_app(app)
     
+    from app.utils.iot_registry import device_registry
+    from app.utils.iot_live import live_hub
+    from app.utils.iot_alerts import alert_engine
+    from app.utils.weather import weather_cache
+    from app.utils.gemini import gemini_client
+    from app.utils.chat_cache import chat_cache
+    from app.utils.chat_context import chat_context
+    from app.utils.llm import llm
+    device_registry.init_app(app)
+    live_hub.init_app(app)
+    alert_engine.init_app(app)
+    weather_cache.init_app(app)
+    gemini_client.init_app(app)
+    chat_cache.init_app(app)
+    chat_context.init_app(app)
+    llm.init_app(app)
+    
     # Configure login manager
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -3,8 +3,8 @@ from .product import Product, ProductCategory, ProductReview
 from .course import Course, CourseEnrollment, CourseModule, CourseProgress
 from .land import Land, LandInvestment, LandLease
 from .forum import ForumPost, ForumComment, ForumCategory
-from .weather import WeatherData, WeatherAlert
-from .iot import IoTDevice, IoTData, IoTAlert
+from .weather import WeatherData, WeatherForecastSlot, WeatherForecast, WeatherDailyStats, GeocodedLocation, WeatherAlert
+from .iot import IoTDevice, IoTData, IoTAlert, IoTAlertRule, IoTLatestReading, IoTDataMinute, IoTDataHourly, IoTDataDaily
 from .mentoring import Mentor, MentoringSession, MentoringRequest
 from .investment import Investment, InvestmentProposal
 from .chatbot import ChatSession, ChatMessage
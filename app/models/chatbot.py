@@ -29,6 +29,10 @@ class ChatSession(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        # Newest messages of a session, for rebuilding its chat context
+        db.Index('ix_chat_messages_session_id', 'session_id', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -36,6 +40,7 @@ class ChatMessage(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_helpful = db.Column(db.Boolean)  # User feedback on bot responses
     response_time_ms = db.Column(db.Integer)  # Bot response time in milliseconds
+    from_cache = db.Column(db.Boolean, default=False)  # Answered from the chat response cache
     
     # Foreign keys
     session_id = db.Column(db.Integer, db.ForeignKey('chat_sessions.id'), nullable=False)
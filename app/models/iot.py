@@ -1,8 +1,18 @@
 from datetime import datetime
+from sqlalchemy.orm import declared_attr
 from app import db
 
 class IoTDevice(db.Model):
     __tablename__ = 'iot_devices'
+    __table_args__ = (
+        # One gateway MAC reports several sensors, each stored as its own device
+        db.UniqueConstraint('mac_address', 'sensor_type', name='uq_iot_devices_mac_sensor'),
+        # NULL sensor types never collide above, so the base device needs its own index
+        db.Index('uq_iot_devices_mac_base', 'mac_address', unique=True,
+                 sqlite_where=db.text('sensor_type IS NULL'),
+                 postgresql_where=db.text('sensor_type IS NULL')),
+        db.Index('ix_iot_devices_owner_sensor', 'owner_id', 'sensor_type'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -11,7 +21,7 @@ class IoTDevice(db.Model):
     location = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
-    mac_address = db.Column(db.String(17), unique=True)
+    mac_address = db.Column(db.String(17))
     ip_address = db.Column(db.String(15))
     is_online = db.Column(db.Boolean, default=False)
     last_seen = db.Column(db.DateTime)
@@ -26,10 +36,21 @@ class IoTDevice(db.Model):
     # Relationships
     data_points = db.relationship('IoTData', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     alerts = db.relationship('IoTAlert', backref='device', lazy='dynamic', cascade='all, delete-orphan')
+    latest_reading = db.relationship('IoTLatestReading', backref='device', uselist=False, cascade='all, delete-orphan')
+    minute_rollups = db.relationship('IoTDataMinute', lazy='dynamic', cascade='all, delete-orphan')
+    hourly_rollups = db.relationship('IoTDataHourly', lazy='dynamic', cascade='all, delete-orphan')
+    daily_rollups = db.relationship('IoTDataDaily', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @classmethod
+    def query_with_latest(cls, owner_id):
+        """Query (device, latest reading) pairs for an owner in one statement"""
+        return db.session.query(cls, IoTLatestReading).outerjoin(
+            IoTLatestReading, IoTLatestReading.device_id == cls.id
+        ).filter(cls.owner_id == owner_id).order_by(cls.id)
     
     def get_latest_data(self):
         """Get the latest data point from this device"""
-        return self.data_points.order_by(IoTData.timestamp.desc()).first()
+        return self.latest_reading
     
     def get_data_count(self):
         """Get total number of data points"""
@@ -59,6 +80,11 @@ class IoTData(db.Model):
     # Foreign keys
     device_id = db.Column(db.Integer, db.ForeignKey('iot_devices.id'), nullable=False)
     
+    # One reading per device and instant, so replayed readings are dropped
+    __table_args__ = (
+        db.Index('uq_iot_data_device_timestamp', device_id, timestamp, unique=True),
+    )
+    
     def get_value_with_unit(self):
         """Get formatted value with unit"""
         return f"{self.value} {self.unit}"
@@ -66,8 +92,63 @@ class IoTData(db.Model):
     def __repr__(self):
         return f'<IoTData {self.device.name} - {self.value} {self.unit}>'
 
+class IoTLatestReading(db.Model):
+    """Most recent reading per device, upserted on every ingest"""
+    __tablename__ = 'iot_latest_readings'
+    
+    device_id = db.Column(db.Integer, db.ForeignKey('iot_devices.id'), primary_key=True)
+    value = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(20), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    quality_score = db.Column(db.Float, default=1.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def get_value_with_unit(self):
+        """Get formatted value with unit"""
+        return f"{self.value} {self.unit}"
+    
+    def __repr__(self):
+        return f'<IoTLatestReading {self.device_id} - {self.value} {self.unit}>'
+
+class IoTRollupMixin:
+    """Columns shared by the downsampled IoTData tiers"""
+    bucket_seconds = None
+    
+    @declared_attr
+    def __table_args__(cls):
+        return (db.PrimaryKeyConstraint('device_id', 'bucket_start'),)
+    
+    @declared_attr
+    def device_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('iot_devices.id'), nullable=False)
+    
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    avg_value = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    avg_quality = db.Column(db.Float)
+    
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.device_id} @ {self.bucket_start} - {self.avg_value}>'
+
+class IoTDataMinute(IoTRollupMixin, db.Model):
+    __tablename__ = 'iot_data_1m'
+    bucket_seconds = 60
+
+class IoTDataHourly(IoTRollupMixin, db.Model):
+    __tablename__ = 'iot_data_1h'
+    bucket_seconds = 3600
+
+class IoTDataDaily(IoTRollupMixin, db.Model):
+    __tablename__ = 'iot_data_1d'
+    bucket_seconds = 86400
+
 class IoTAlert(db.Model):
     __tablename__ = 'iot_alerts'
+    __table_args__ = (
+        db.Index('ix_iot_alerts_device_resolved_created', 'device_id', 'is_resolved', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -109,8 +190,34 @@ class IoTAlert(db.Model):
     def __repr__(self):
         return f'<IoTAlert {self.title} - {self.severity}>'
 
+class IoTAlertRule(db.Model):
+    """Alerting rule for one device, evaluated on every ingested reading"""
+    __tablename__ = 'iot_alert_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    min_value = db.Column(db.Float)  # threshold_exceeded below this
+    max_value = db.Column(db.Float)  # threshold_exceeded above this
+    max_rate = db.Column(db.Float)  # data_anomaly when |change| per second exceeds this
+    zscore_threshold = db.Column(db.Float)  # data_anomaly when |z| over the rolling window exceeds this
+    severity = db.Column(db.Enum('low', 'medium', 'high', 'critical'), default='medium')
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Foreign keys
+    device_id = db.Column(db.Integer, db.ForeignKey('iot_devices.id'), nullable=False, unique=True)
+    
+    # Relationships
+    device = db.relationship('IoTDevice', backref=db.backref('alert_rule', uselist=False, cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<IoTAlertRule device {self.device_id}>'
+
 class IoTCommand(db.Model):
     __tablename__ = 'iot_commands'
+    __table_args__ = (
+        db.Index('ix_iot_commands_device_created', 'device_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     command = db.Column(db.String(100), nullable=False)  # e.g., 'pump_on', 'pump_off', 'set_irrigation_time'
@@ -21,6 +21,11 @@ class WeatherData(db.Model):
     weather_description = db.Column(db.String(200))
     recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # One observation per location and fetch, so concurrent saves of it insert once
+    __table_args__ = (
+        db.Index('uq_weather_data_location_recorded_at', location, recorded_at, unique=True),
+    )
+    
     def get_weather_icon(self):
         """Get appropriate weather icon based on condition"""
         condition_map = {
@@ -57,6 +62,97 @@ class WeatherData(db.Model):
     def __repr__(self):
         return f'<WeatherData {self.location} - {self.temperature}°C>'
 
+class WeatherForecastSlot(db.Model):
+    """One 3-hourly forecast slot, as fetched from the provider"""
+    __tablename__ = 'weather_forecast_slots'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'forecast_time', name='uq_weather_forecast_slots_location_time'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100), nullable=False)
+    forecast_time = db.Column(db.DateTime, nullable=False)
+    temperature = db.Column(db.Float, nullable=False)
+    humidity = db.Column(db.Float, nullable=False)
+    precipitation = db.Column(db.Float, default=0.0)
+    weather_condition = db.Column(db.String(100), nullable=False)
+    weather_description = db.Column(db.String(200))
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<WeatherForecastSlot {self.location} {self.forecast_time}>'
+
+class WeatherForecast(db.Model):
+    """Daily forecast rolled up from the slots of one refresh"""
+    __tablename__ = 'weather_forecasts'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'forecast_date', name='uq_weather_forecasts_location_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100), nullable=False)
+    forecast_date = db.Column(db.Date, nullable=False)
+    temp_min = db.Column(db.Float, nullable=False)
+    temp_max = db.Column(db.Float, nullable=False)
+    temp_avg = db.Column(db.Float, nullable=False)
+    humidity = db.Column(db.Float, nullable=False)
+    precipitation = db.Column(db.Float, default=0.0)
+    weather_condition = db.Column(db.String(100), nullable=False)
+    weather_description = db.Column(db.String(200))
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Forecast day in the shape the weather pages and API expect"""
+        return {
+            'date': self.forecast_date.isoformat(),
+            'temperature': {
+                'min': self.temp_min,
+                'max': self.temp_max,
+                'avg': self.temp_avg
+            },
+            'humidity': self.humidity,
+            'precipitation': self.precipitation,
+            'weather_condition': self.weather_condition,
+            'weather_description': self.weather_description
+        }
+    
+    def __repr__(self):
+        return f'<WeatherForecast {self.location} {self.forecast_date}>'
+
+class WeatherDailyStats(db.Model):
+    """Running totals of one location's observations over one UTC day"""
+    __tablename__ = 'weather_daily_stats'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'date', name='uq_weather_daily_stats_location_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    temperature_sum = db.Column(db.Float, nullable=False)
+    temperature_min = db.Column(db.Float, nullable=False)
+    temperature_max = db.Column(db.Float, nullable=False)
+    humidity_sum = db.Column(db.Float, nullable=False)
+    precipitation_sum = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<WeatherDailyStats {self.location} {self.date}>'
+
+class GeocodedLocation(db.Model):
+    """Coordinates a typed location name resolved to, or a failed lookup"""
+    __tablename__ = 'geocoded_locations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location_key = db.Column(db.String(200), nullable=False, unique=True)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    source = db.Column(db.String(20))
+    resolved_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GeocodedLocation {self.location_key}>'
+
 class WeatherAlert(db.Model):
     __tablename__ = 'weather_alerts'
     
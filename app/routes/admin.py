@@ -10,6 +10,9 @@ from app.models.weather import WeatherAlert
 from app.models.iot import IoTDevice, IoTAlert
 from app.models.investment import Investment
 from app.models.mentoring import Mentor
+from app.utils.iot_registry import device_registry
+from app.utils.chat_cache import chat_cache
+from app.utils.llm import llm
 from sqlalchemy import desc, func
 from datetime import datetime, timedelta
 
@@ -361,7 +364,38 @@ def iot_devices():
     
     return render_template('admin/iot_devices.html',
                          devices=devices,
-                         device_type=device_type)
+                         device_type=device_type,
+                         registry_stats=device_registry.stats())
+
+@admin_bp.route('/iot-devices/registry')
+@login_required
+@admin_required
+def iot_device_registry():
+    """Device registry cache counters"""
+    return jsonify(device_registry.stats())
+
+@admin_bp.route('/iot-devices/registry/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_iot_device_registry():
+    """Drop every cached device entry"""
+    device_registry.clear()
+    flash('IoT device cache cleared.', 'success')
+    return redirect(url_for('admin.iot_devices'))
+
+@admin_bp.route('/chat-cache')
+@login_required
+@admin_required
+def chat_cache_stats():
+    """Chatbot response cache counters"""
+    return jsonify(chat_cache.stats())
+
+@admin_bp.route('/llm')
+@login_required
+@admin_required
+def llm_stats():
+    """LLM pool, queue depth and circuit breaker state"""
+    return jsonify(llm.stats())
 
 @admin_bp.route('/analytics')
 @login_required
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context, session as browser_session
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User
@@ -7,15 +7,22 @@ from app.models.course import Course
 from app.models.land import Land
 from app.models.forum import ForumPost
 from app.models.weather import WeatherData, WeatherAlert
-from app.models.iot import IoTDevice, IoTData, IoTAlert
+from app.models.iot import IoTDevice, IoTAlert, IoTAlertRule
 from app.models.investment import Investment
 from app.models.mentoring import Mentor
 from app.models.chatbot import ChatSession, ChatMessage
-from app.utils.chatbot import get_ai_response
+from app.utils.chatbot import get_ai_reply, stream_ai_reply
+from app.utils.chat_stream import format_event
+from app.utils.iot_rollups import choose_tier, max_history_hours, query_history, TIER_NAMES
+from app.utils.iot_ingest import SENSOR_META, parse_timestamp
+from app.utils.iot_series import SERIES_AGGREGATES, auto_bucket, downsample, query_series, to_json_list
+from app.utils.geo import weather_station
 from app.models.course import CourseEnrollment
 from app.models.land import LandInvestment, LandLease
 from sqlalchemy import desc, or_
 import json
+import math
+import secrets
 import time
 
 api_bp = Blueprint('api', __name__)
@@ -132,6 +139,37 @@ def search():
     
     return jsonify(results)
 
+# Anonymous chat sessions a browser may continue, newest last
+ANONYMOUS_CHAT_SESSIONS = 20
+
+def get_or_create_chat_session(session_id, language):
+    """The caller's chat session named `session_id`, or a new one (committed).
+
+    A session belongs to its user, or for anonymous callers to the browser
+    it was issued to. Any other id starts a fresh session with a new,
+    unguessable id, so no one else's conversation is continued or read.
+    """
+    session = None
+    if session_id and current_user.is_authenticated:
+        session = ChatSession.query.filter_by(session_id=session_id, user_id=current_user.id).first()
+    elif session_id and session_id in browser_session.get('chat_sessions', []):
+        session = ChatSession.query.filter_by(session_id=session_id, user_id=None).first()
+    
+    if not session:
+        owner = current_user.id if current_user.is_authenticated else 'anonymous'
+        session = ChatSession(
+            session_id=f"session_{owner}_{secrets.token_urlsafe(16)}",
+            language=language,
+            user_id=current_user.id if current_user.is_authenticated else None
+        )
+        db.session.add(session)
+        db.session.commit()
+        if not current_user.is_authenticated:
+            issued = browser_session.get('chat_sessions', []) + [session.session_id]
+            browser_session['chat_sessions'] = issued[-ANONYMOUS_CHAT_SESSIONS:]
+    
+    return session
+
 @api_bp.route('/chat', methods=['POST'])
 def chat():
     """AI Chatbot API"""
@@ -162,20 +200,7 @@ def chat():
         print("❌ Message is required")
         return jsonify({'error': 'Message is required'}), 400
     
-    # Get or create chat session
-    if session_id:
-        session = ChatSession.query.filter_by(session_id=session_id).first()
-    else:
-        session = None
-    
-    if not session:
-        session = ChatSession(
-            session_id=session_id or f"session_{current_user.id if current_user.is_authenticated else 'anonymous'}_{int(time.time())}",
-            language=language,
-            user_id=current_user.id if current_user.is_authenticated else None
-        )
-        db.session.add(session)
-        db.session.commit()
+    session = get_or_create_chat_session(session_id, language)
     
     # Save user message
     user_message = ChatMessage(
@@ -190,7 +215,8 @@ def chat():
         start_time = time.time()
         print(f"🧠 Processing chat message: '{message}' (language: {language})")
         
-        ai_response = get_ai_response(message, language, session.id)
+        # LLM calls are bounded by the LLM layer's pool and deadline, with a mock fallback
+        ai_response, from_cache = get_ai_reply(message, language, session.id)
         response_time = int((time.time() - start_time) * 1000)
         
         print(f"✅ AI response generated in {response_time}ms")
@@ -204,7 +230,8 @@ def chat():
             content=ai_response,
             message_type='bot',
             session_id=session.id,
-            response_time_ms=response_time
+            response_time_ms=response_time,
+            from_cache=from_cache
         )
         db.session.add(bot_message)
         db.session.commit()
@@ -212,7 +239,8 @@ def chat():
         return jsonify({
             'response': ai_response,
             'session_id': session.session_id,
-            'response_time': response_time
+            'response_time': response_time,
+            'from_cache': from_cache
         })
         
     except Exception as e:
@@ -238,16 +266,74 @@ def chat():
             'response_time': 0
         })
 
+@api_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """AI Chatbot API streaming the reply as Server-Sent Events.
+    
+    Takes the same JSON body as /api/chat. Sends a `meta` event (session_id,
+    from_cache), `chunk` events with pieces of text, then `done` with the
+    stored message's id and response_time, or `error`.
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('message'):
+        return jsonify({'error': 'Message is required'}), 400
+    
+    message = data['message']
+    language = data.get('language', 'en')
+    session = get_or_create_chat_session(data.get('session_id', ''), language)
+    
+    db.session.add(ChatMessage(content=message, message_type='user', session_id=session.id))
+    db.session.commit()
+    
+    start_time = time.time()
+    chunks, from_cache = stream_ai_reply(message, language, session.id)
+    
+    def events():
+        pieces = []
+        error = None
+        try:
+            yield format_event('meta', {'session_id': session.session_id, 'from_cache': from_cache})
+            for chunk in chunks:
+                pieces.append(chunk)
+                yield format_event('chunk', {'text': chunk})
+        except Exception as e:
+            print(f"❌ Chat stream error: {e}")
+            error = "Sorry, I encountered an error. Please try again."
+            yield format_event('error', {'error': error})
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()  # Stops the LLM call if the client left
+            # Stored once the reply is complete, or with what was sent if the client left
+            bot_message = ChatMessage(
+                content=''.join(pieces).strip() or error or '',
+                message_type='bot',
+                session_id=session.id,
+                response_time_ms=int((time.time() - start_time) * 1000),
+                from_cache=from_cache
+            )
+            if bot_message.content:
+                db.session.add(bot_message)
+                db.session.commit()
+        
+        yield format_event('done', {'message_id': bot_message.id, 'response_time': bot_message.response_time_ms})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
 @api_bp.route('/weather/current')
 def weather_current():
     """Current weather API"""
     location = request.args.get('location', 'Tunisia')
+    station = weather_station(location)
     
-    weather_data = WeatherData.query.filter_by(location=location).order_by(desc(WeatherData.recorded_at)).first()
+    weather_data = WeatherData.query.filter_by(location=station).order_by(desc(WeatherData.recorded_at)).first()
     
     if weather_data:
         return jsonify({
-            'location': weather_data.location,
+            'location': location,
+            'station': station,
             'temperature': weather_data.temperature,
             'humidity': weather_data.humidity,
             'pressure': weather_data.pressure,
@@ -295,11 +381,8 @@ def weather_alerts():
 @login_required
 def iot_devices():
     """User's IoT devices API"""
-    devices = IoTDevice.query.filter_by(owner_id=current_user.id).all()
-    
     devices_data = []
-    for device in devices:
-        latest_data = device.get_latest_data()
+    for device, latest_data in IoTDevice.query_with_latest(current_user.id).all():
         devices_data.append({
             'id': device.id,
             'name': device.name,
@@ -318,6 +401,20 @@ def iot_devices():
     
     return jsonify(devices_data)
 
+def history_hours(default=24):
+    """The `hours` query argument, or None unless it is a positive window the history still covers"""
+    try:
+        hours = float(request.args.get('hours', default))
+    except ValueError:
+        return None
+    if not math.isfinite(hours) or hours <= 0 or hours > max_history_hours():
+        return None
+    return hours
+
+def hours_error():
+    """400 response for an unusable `hours` argument"""
+    return jsonify({'error': f'hours must be a positive number of at most {max_history_hours()}'}), 400
+
 @api_bp.route('/iot/device/<int:device_id>/data')
 @login_required
 def iot_device_data(device_id):
@@ -326,24 +423,23 @@ def iot_device_data(device_id):
     
     # Get data points
     limit = request.args.get('limit', 100, type=int)
-    hours = request.args.get('hours', 24, type=int)
+    hours = history_hours()
+    if hours is None:
+        return hours_error()
+    
+    # Optional bucket width in seconds, or 'auto' to fit the window into `limit` points
+    resolution = request.args.get('resolution', '')
     
     from datetime import datetime, timedelta
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    
-    data_points = IoTData.query.filter(
-        IoTData.device_id == device_id,
-        IoTData.timestamp >= start_time
-    ).order_by(desc(IoTData.timestamp)).limit(limit).all()
-    
-    data = []
-    for point in data_points:
-        data.append({
-            'value': point.value,
-            'unit': point.unit,
-            'timestamp': point.timestamp.isoformat(),
-            'quality_score': point.quality_score
-        })
+    now = datetime.utcnow()
+    start_time = now - timedelta(hours=hours)
+    
+    if resolution == 'auto':
+        tier = choose_tier(hours * 3600, max_points=limit, now=now)
+    else:
+        tier = choose_tier(hours * 3600, resolution=int(resolution) if resolution.isdigit() else None, now=now)
+    
+    data = query_history(device_id, start_time, limit, tier, now)
     
     return jsonify({
         'device': {
@@ -352,9 +448,175 @@ def iot_device_data(device_id):
             'device_type': device.device_type,
             'sensor_type': device.sensor_type
         },
+        'resolution': TIER_NAMES[tier],
         'data': data
     })
 
+@api_bp.route('/iot/series')
+@login_required
+def iot_series():
+    """Resampled history of several devices on one shared time axis"""
+    from flask import current_app
+    from datetime import datetime, timedelta
+    
+    # ?device_id=1&device_id=2 or ?device_ids=1,2
+    raw_ids = request.args.getlist('device_id') + request.args.get('device_ids', '').split(',')
+    try:
+        device_ids = list(dict.fromkeys(int(value) for value in raw_ids if value.strip()))
+    except ValueError:
+        return jsonify({'error': 'Device ids must be integers'}), 400
+    if not device_ids:
+        return jsonify({'error': 'At least one device_id is required'}), 400
+    if len(device_ids) > current_app.config['IOT_SERIES_MAX_DEVICES']:
+        return jsonify({'error': f"At most {current_app.config['IOT_SERIES_MAX_DEVICES']} devices per request"}), 400
+    
+    devices = {
+        device.id: device
+        for device in IoTDevice.query.filter(
+            IoTDevice.id.in_(device_ids),
+            IoTDevice.owner_id == current_user.id
+        ).all()
+    }
+    missing = [device_id for device_id in device_ids if device_id not in devices]
+    if missing:
+        return jsonify({'error': f'Unknown devices: {missing}'}), 404
+    
+    # Range: ISO-8601 or epoch start/end, defaulting to the last `hours`
+    now = datetime.utcnow()
+    try:
+        end = parse_timestamp(request.args['end'], now, max_skew=None) if 'end' in request.args else now
+        start = parse_timestamp(request.args['start'], now, max_skew=None) if 'start' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if start is None:
+        hours = history_hours()
+        if hours is None:
+            return hours_error()
+        try:
+            start = end - timedelta(hours=hours)
+        except OverflowError:
+            return jsonify({'error': 'start is out of range'}), 400
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+    
+    aggregates = [name for name in request.args.get('agg', 'avg').split(',') if name]
+    unknown = [name for name in aggregates if name not in SERIES_AGGREGATES]
+    if unknown or not aggregates:
+        return jsonify({'error': f"agg must be a comma-separated list of {', '.join(SERIES_AGGREGATES)}"}), 400
+    aggregates = list(dict.fromkeys(aggregates))
+    
+    # Point budget per series; an explicit finer bucket is thinned with LTTB
+    points = request.args.get('points', current_app.config['IOT_SERIES_DEFAULT_POINTS'], type=int)
+    if points < 1:
+        return jsonify({'error': 'points must be a positive integer'}), 400
+    bucket = request.args.get('bucket', 'auto')
+    if bucket == 'auto':
+        bucket_seconds = auto_bucket(start, end, points)
+    elif bucket.isdigit() and int(bucket) > 0:
+        bucket_seconds = int(bucket)
+    else:
+        return jsonify({'error': "bucket must be a number of seconds or 'auto'"}), 400
+    
+    max_buckets = current_app.config['IOT_SERIES_MAX_BUCKETS']
+    if (end - start).total_seconds() / bucket_seconds > max_buckets:
+        return jsonify({'error': f'Too many buckets (max {max_buckets}); use a wider bucket'}), 400
+    
+    timestamps, values, source = query_series(device_ids, start, end, bucket_seconds, aggregates, now)
+    thin = points >= 3 and len(timestamps) > points
+    by = 'avg' if 'avg' in aggregates else aggregates[0]
+    
+    series = []
+    for index, device_id in enumerate(device_ids):
+        device = devices[device_id]
+        entry = {
+            'device_id': device.id,
+            'name': device.name,
+            'sensor_type': device.sensor_type,
+            'unit': SENSOR_META[device.sensor_type][1] if device.sensor_type in SENSOR_META else None
+        }
+        if thin:
+            keep = downsample(timestamps, values, index, by, points)
+            entry['timestamps'] = timestamps[keep].tolist()
+            entry.update({name: to_json_list(values[name][index][keep], name) for name in aggregates})
+        else:
+            entry.update({name: to_json_list(values[name][index], name) for name in aggregates})
+        series.append(entry)
+    
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket': bucket_seconds,
+        'resolution': TIER_NAMES[source],
+        'aggregates': aggregates,
+        'downsampled': thin,
+        # Shared bucket starts (epoch ms); thinned series carry their own
+        'timestamps': None if thin else timestamps.tolist(),
+        'series': series
+    })
+
+# Numeric IoTAlertRule fields accepted from the API
+ALERT_RULE_FIELDS = ['min_value', 'max_value', 'max_rate', 'zscore_threshold']
+
+def alert_rule_data(rule):
+    return {
+        'id': rule.id,
+        'device_id': rule.device_id,
+        'min_value': rule.min_value,
+        'max_value': rule.max_value,
+        'max_rate': rule.max_rate,
+        'zscore_threshold': rule.zscore_threshold,
+        'severity': rule.severity,
+        'is_active': rule.is_active
+    }
+
+@api_bp.route('/iot/device/<int:device_id>/alert-rule', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+def iot_device_alert_rule(device_id):
+    """Read, set or remove the alerting rule of one device"""
+    device = IoTDevice.query.filter_by(id=device_id, owner_id=current_user.id).first_or_404()
+    rule = device.alert_rule
+    
+    if request.method == 'GET':
+        return jsonify(alert_rule_data(rule) if rule else None)
+    
+    if request.method == 'DELETE':
+        if rule:
+            db.session.delete(rule)
+            db.session.commit()
+        return jsonify({'status': 'deleted'})
+    
+    data = request.get_json() or {}
+    values = {}
+    for field in ALERT_RULE_FIELDS:
+        if field in data:
+            try:
+                values[field] = None if data[field] is None else float(data[field])
+            except (TypeError, ValueError):
+                return jsonify({'error': f'Invalid value for {field}'}), 400
+            if values[field] is not None and not math.isfinite(values[field]):
+                return jsonify({'error': f'Invalid value for {field}'}), 400
+    
+    # Limits left out of the request keep their stored value
+    min_value = values.get('min_value', rule.min_value if rule else None)
+    max_value = values.get('max_value', rule.max_value if rule else None)
+    if min_value is not None and max_value is not None and min_value > max_value:
+        return jsonify({'error': 'min_value must not be above max_value'}), 400
+    if 'severity' in data:
+        if data['severity'] not in ['low', 'medium', 'high', 'critical']:
+            return jsonify({'error': 'Invalid severity'}), 400
+        values['severity'] = data['severity']
+    if 'is_active' in data:
+        values['is_active'] = bool(data['is_active'])
+    
+    if rule is None:
+        rule = IoTAlertRule(device_id=device.id)
+        db.session.add(rule)
+    for field, value in values.items():
+        setattr(rule, field, value)
+    db.session.commit()
+    
+    return jsonify(alert_rule_data(rule))
+
 @api_bp.route('/dashboard/stats')
 @login_required
 def dashboard_stats():
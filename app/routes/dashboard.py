@@ -9,7 +9,9 @@ from app.models.weather import WeatherData, WeatherAlert
 from app.models.iot import IoTDevice, IoTAlert
 from app.models.investment import Investment
 from app.models.mentoring import MentoringSession
+from app.utils.geo import weather_station
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -50,7 +52,7 @@ def index():
     recent_forum_posts = ForumPost.query.order_by(desc(ForumPost.created_at)).limit(5).all()
     
     # Get weather data for user's location
-    weather_data = WeatherData.query.filter_by(location=current_user.location).order_by(desc(WeatherData.recorded_at)).first()
+    weather_data = WeatherData.query.filter_by(location=weather_station(current_user.location)).order_by(desc(WeatherData.recorded_at)).first()
     
     # Get active weather alerts
     weather_alerts = WeatherAlert.query.filter_by(is_active=True).all()
@@ -59,7 +61,10 @@ def index():
     iot_devices = []
     iot_alerts = []
     if current_user.is_farmer():
-        iot_devices = IoTDevice.query.filter_by(owner_id=current_user.id).all()
+        # Eager-load latest readings so the template's get_latest_data() calls are free
+        iot_devices = IoTDevice.query.filter_by(owner_id=current_user.id).options(
+            joinedload(IoTDevice.latest_reading)
+        ).all()
         iot_alerts = IoTAlert.query.filter_by(is_resolved=False).join(IoTDevice).filter(IoTDevice.owner_id == current_user.id).all()
     
     return render_template('dashboard/index.html',
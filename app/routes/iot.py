@@ -1,23 +1,57 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, Response
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import desc, and_
-from app import db
-from app.models.iot import IoTDevice, IoTData, IoTAlert, IoTCommand
+from app import db, csrf
+from app.models.iot import IoTDevice, IoTAlert, IoTCommand
 from app.models.user import User
+from app.utils.iot_frames import FRAME_CONTENT_TYPE, FRAME_MAX_SIZE, is_single_frame
+from app.utils.iot_ingest import ingest_payloads, ingest_frames
+from app.utils.iot_commands import poll_commands, notify_after_commit
+from app.utils.iot_live import LiveFeedFull, live_hub, iter_events, reading_event
+from app.utils.iot_liveness import liveness
+from app.utils.iot_registry import lookup_device
+from app.utils.iot_stream import StreamIngestor
 
 iot_bp = Blueprint('iot', __name__, url_prefix='/iot')
 
+# Keys used by the monitoring page for each environmental sensor type
+LATEST_DATA_KEYS = {
+    'temp': 'temperature',
+    'humidity': 'humidity',
+    'soil': 'soil_moisture'
+}
+
+def first_sensor_readings(device_rows):
+    """Pick the first device of each sensor type from (device, latest) rows"""
+    sensors = {}
+    for device, latest in device_rows:
+        if device.sensor_type and device.sensor_type not in sensors:
+            sensors[device.sensor_type] = (device, latest)
+    return sensors
+
+def authenticated_device(device_id, mac_address):
+    """The device's registry entry if `mac_address` is its MAC, else None.
+
+    Actuators prove who they are with the MAC their gateway ingests
+    readings under; a device without a MAC cannot use the command API.
+    """
+    device = lookup_device(device_id) if device_id is not None else None
+    if device is None or not device.mac_address or mac_address != device.mac_address:
+        return None
+    return device
+
 @iot_bp.route('/')
 @login_required
 def dashboard():
     """IoT Dashboard - Main monitoring interface"""
-    devices = IoTDevice.query.filter_by(owner_id=current_user.id).all()
+    # Devices and their latest readings in a single query
+    device_rows = IoTDevice.query_with_latest(current_user.id).all()
+    devices = [device for device, _ in device_rows]
     
     # Get latest sensor readings for dashboard
     latest_data = {}
-    for device in devices:
-        latest = device.get_latest_data()
+    for device, latest in device_rows:
         if latest:
             latest_data[device.sensor_type] = {
                 'value': latest.value,
@@ -47,48 +81,23 @@ def dashboard():
 def monitoring():
     """Advanced monitoring interface - Verdiva style"""
     # Get environmental sensors (temperature, humidity, soil moisture)
-    temp_device = IoTDevice.query.filter_by(
-        owner_id=current_user.id, 
-        sensor_type='temperature'
-    ).first()
+    # and their latest readings in a single query
+    device_rows = IoTDevice.query_with_latest(current_user.id).all()
+    sensors = first_sensor_readings(device_rows)
     
-    humidity_device = IoTDevice.query.filter_by(
-        owner_id=current_user.id, 
-        sensor_type='humidity'
-    ).first()
-    
-    soil_device = IoTDevice.query.filter_by(
-        owner_id=current_user.id, 
-        sensor_type='soil_moisture'
-    ).first()
+    temp_device, temp_reading = sensors.get('temperature', (None, None))
+    humidity_device, humidity_reading = sensors.get('humidity', (None, None))
+    soil_device, soil_reading = sensors.get('soil_moisture', (None, None))
     
     # Get latest readings
     latest_data = {
-        'temp': 0,
-        'humidity': 0,
-        'soil': 0
+        'temp': temp_reading.value if temp_reading else 0,
+        'humidity': humidity_reading.value if humidity_reading else 0,
+        'soil': soil_reading.value if soil_reading else 0
     }
     
-    if temp_device:
-        temp_reading = temp_device.get_latest_data()
-        if temp_reading:
-            latest_data['temp'] = temp_reading.value
-    
-    if humidity_device:
-        humidity_reading = humidity_device.get_latest_data()
-        if humidity_reading:
-            latest_data['humidity'] = humidity_reading.value
-    
-    if soil_device:
-        soil_reading = soil_device.get_latest_data()
-        if soil_reading:
-            latest_data['soil'] = soil_reading.value
-    
     # Get pump/actuator devices
-    actuators = IoTDevice.query.filter_by(
-        owner_id=current_user.id,
-        device_type='actuator'
-    ).all()
+    actuators = [device for device, _ in device_rows if device.device_type == 'actuator']
     
     return render_template('iot/monitoring.html', 
                          latest_data=latest_data,
@@ -98,130 +107,93 @@ def monitoring():
                          soil_device=soil_device)
 
 # API Endpoints for IoT devices (similar to your original code)
+# Devices post without a browser session, so these are exempt from CSRF
 @iot_bp.route('/api/data', methods=['POST'])
+@csrf.exempt
 def receive_data():
     """Receive sensor data from IoT devices"""
     try:
-        data = request.get_json()
+        owner_id = current_user.id if current_user.is_authenticated else 1  # Default to first user
         
-        # Find device by MAC address or create if needed
-        device_mac = data.get('mac_address', 'unknown')
-        device = IoTDevice.query.filter_by(mac_address=device_mac).first()
+        if request.mimetype == FRAME_CONTENT_TYPE:
+            body = request.get_data()
+            if not is_single_frame(body):
+                return jsonify({'error': 'Expected exactly one frame'}), 400
+            stored, results = ingest_frames(body, owner_id)
+        else:
+            stored, results = ingest_payloads([request.get_json()], owner_id)
         
-        if not device:
-            # Auto-register device (you may want to change this for security)
-            device = IoTDevice(
-                name=f"Auto Device {device_mac[-6:]}",
-                device_type='sensor',
-                location='Auto-detected',
-                mac_address=device_mac,
-                owner_id=current_user.id if current_user.is_authenticated else 1,  # Default to first user
-                is_online=True,
-                last_seen=datetime.utcnow()
-            )
-            db.session.add(device)
-            db.session.flush()
+        if results[0]['status'] == 'error':
+            return jsonify({'error': results[0]['error']}), 400
         
-        # Update device status
-        device.is_online = True
-        device.last_seen = datetime.utcnow()
+        return jsonify({'status': 'ok'}), 200
         
-        # Store sensor data
-        for sensor_type, value in data.items():
-            if sensor_type in ['temp', 'temperature']:
-                # Create/update temperature device
-                temp_device = IoTDevice.query.filter_by(
-                    mac_address=device_mac,
-                    sensor_type='temperature'
-                ).first()
-                
-                if not temp_device:
-                    temp_device = IoTDevice(
-                        name=f"Temperature Sensor {device_mac[-6:]}",
-                        device_type='sensor',
-                        sensor_type='temperature',
-                        location=device.location,
-                        mac_address=device_mac,
-                        owner_id=device.owner_id,
-                        is_online=True,
-                        last_seen=datetime.utcnow()
-                    )
-                    db.session.add(temp_device)
-                    db.session.flush()
-                
-                # Store data
-                data_point = IoTData(
-                    device_id=temp_device.id,
-                    value=float(value),
-                    unit='°C'
-                )
-                db.session.add(data_point)
-            
-            elif sensor_type in ['humidity']:
-                # Create/update humidity device
-                humidity_device = IoTDevice.query.filter_by(
-                    mac_address=device_mac,
-                    sensor_type='humidity'
-                ).first()
-                
-                if not humidity_device:
-                    humidity_device = IoTDevice(
-                        name=f"Humidity Sensor {device_mac[-6:]}",
-                        device_type='sensor',
-                        sensor_type='humidity',
-                        location=device.location,
-                        mac_address=device_mac,
-                        owner_id=device.owner_id,
-                        is_online=True,
-                        last_seen=datetime.utcnow()
-                    )
-                    db.session.add(humidity_device)
-                    db.session.flush()
-                
-                # Store data
-                data_point = IoTData(
-                    device_id=humidity_device.id,
-                    value=float(value),
-                    unit='%'
-                )
-                db.session.add(data_point)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@iot_bp.route('/api/data/batch', methods=['POST'])
+@csrf.exempt
+def receive_data_batch():
+    """Receive readings from many gateways in one request and one transaction"""
+    try:
+        owner_id = current_user.id if current_user.is_authenticated else 1  # Default to first user
+        
+        if request.mimetype == FRAME_CONTENT_TYPE:
+            body = request.get_data()
+            max_bytes = current_app.config['IOT_MAX_BATCH_SIZE'] * FRAME_MAX_SIZE
+            if len(body) > max_bytes:
+                return jsonify({'error': f'Batch too large (max {max_bytes} bytes)'}), 413
             
-            elif sensor_type in ['soil', 'soil_moisture']:
-                # Create/update soil moisture device
-                soil_device = IoTDevice.query.filter_by(
-                    mac_address=device_mac,
-                    sensor_type='soil_moisture'
-                ).first()
-                
-                if not soil_device:
-                    soil_device = IoTDevice(
-                        name=f"Soil Sensor {device_mac[-6:]}",
-                        device_type='sensor',
-                        sensor_type='soil_moisture',
-                        location=device.location,
-                        mac_address=device_mac,
-                        owner_id=device.owner_id,
-                        is_online=True,
-                        last_seen=datetime.utcnow()
-                    )
-                    db.session.add(soil_device)
-                    db.session.flush()
-                
-                # Store data
-                data_point = IoTData(
-                    device_id=soil_device.id,
-                    value=float(value),
-                    unit='units'
-                )
-                db.session.add(data_point)
+            stored, results = ingest_frames(body, owner_id)
+            return jsonify({
+                'status': 'ok',
+                'stored': stored,
+                'results': results
+            }), 200
         
-        db.session.commit()
-        return jsonify({'status': 'ok'}), 200
+        data = request.get_json()
+        
+        # Accept either a bare array or {"readings": [...]}
+        readings = data.get('readings') if isinstance(data, dict) else data
+        if not isinstance(readings, list):
+            return jsonify({'error': 'Expected an array of readings'}), 400
+        
+        max_batch = current_app.config['IOT_MAX_BATCH_SIZE']
+        if len(readings) > max_batch:
+            return jsonify({'error': f'Batch too large (max {max_batch} readings)'}), 413
+        
+        stored, results = ingest_payloads(readings, owner_id)
+        
+        return jsonify({
+            'status': 'ok',
+            'stored': stored,
+            'results': results
+        }), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@iot_bp.route('/api/data/stream', methods=['POST'])
+@csrf.exempt
+def receive_data_stream():
+    """Receive a long-lived stream of newline-delimited JSON readings"""
+    owner_id = current_user.id if current_user.is_authenticated else 1  # Default to first user
+    ingestor = StreamIngestor(
+        owner_id,
+        batch_size=current_app.config['IOT_STREAM_BATCH_SIZE'],
+        flush_seconds=current_app.config['IOT_STREAM_FLUSH_SECONDS']
+    )
+
+    try:
+        ingestor.consume(request.stream)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(dict(ingestor.summary(), error=str(e))), 500
+
+    return jsonify(dict(ingestor.summary(), status='ok')), 200
+
 @iot_bp.route('/api/data/latest')
 def get_latest_data():
     """Get latest sensor readings"""
@@ -235,41 +207,42 @@ def get_latest_data():
         
         if current_user.is_authenticated:
             # Get real data from user's devices
-            temp_device = IoTDevice.query.filter_by(
-                owner_id=current_user.id,
-                sensor_type='temperature'
-            ).first()
-            
-            if temp_device:
-                temp_reading = temp_device.get_latest_data()
-                if temp_reading:
-                    latest_data['temp'] = temp_reading.value
-            
-            humidity_device = IoTDevice.query.filter_by(
-                owner_id=current_user.id,
-                sensor_type='humidity'
-            ).first()
-            
-            if humidity_device:
-                humidity_reading = humidity_device.get_latest_data()
-                if humidity_reading:
-                    latest_data['humidity'] = humidity_reading.value
-            
-            soil_device = IoTDevice.query.filter_by(
-                owner_id=current_user.id,
-                sensor_type='soil_moisture'
-            ).first()
-            
-            if soil_device:
-                soil_reading = soil_device.get_latest_data()
-                if soil_reading:
-                    latest_data['soil'] = soil_reading.value
+            sensors = first_sensor_readings(IoTDevice.query_with_latest(current_user.id).all())
+            for key, sensor_type in LATEST_DATA_KEYS.items():
+                _, reading = sensors.get(sensor_type, (None, None))
+                if reading:
+                    latest_data[key] = reading.value
         
         return jsonify(latest_data)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@iot_bp.route('/api/live')
+@login_required
+def live_feed():
+    """Server-Sent Events feed of new readings from the user's devices"""
+    owner_id = current_user.id
+    
+    def load_snapshot():
+        return [
+            reading_event(device.id, device.sensor_type, latest.value, latest.unit, latest.timestamp)
+            for device, latest in IoTDevice.query_with_latest(owner_id).all()
+            if latest
+        ]
+    
+    try:
+        subscription, snapshot = live_hub.subscribe(owner_id, load_snapshot)
+    except LiveFeedFull:
+        # EventSource gives up on an error status and the page polls instead
+        return jsonify({'error': 'Too many live connections, poll /api/iot/devices instead'}), 503, {'Retry-After': '60'}
+    events = iter_events(owner_id, subscription, snapshot, current_app.config['IOT_LIVE_KEEPALIVE_SECONDS'])
+    
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
 @iot_bp.route('/api/command', methods=['GET', 'POST'])
 @login_required
 def handle_command():
@@ -279,13 +252,17 @@ def handle_command():
             command_data = request.get_json()
             action = command_data.get('action', 'none')
             device_id = command_data.get('device_id')
+            if device_id:
+                try:
+                    device_id = int(device_id)
+                except (TypeError, ValueError):
+                    return jsonify({'error': 'device_id must be an integer'}), 400
             
             # Find actuator device or create default
             if device_id:
-                device = IoTDevice.query.filter_by(
-                    id=device_id,
-                    owner_id=current_user.id
-                ).first()
+                device = lookup_device(device_id)
+                if device and device.owner_id != current_user.id:
+                    device = None
             else:
                 # Find first actuator device
                 device = IoTDevice.query.filter_by(
@@ -309,16 +286,19 @@ def handle_command():
             
             if device:
                 # Create command record
+                # Queued until the device long-polls for it
                 command = IoTCommand(
                     device_id=device.id,
                     user_id=current_user.id,
                     command=action,
                     parameters=command_data,
-                    status='sent',
-                    sent_at=datetime.utcnow()
+                    status='pending'
                 )
                 db.session.add(command)
+                notify_after_commit(db.session, device.id)
                 db.session.commit()
+                
+                return jsonify({'status': 'command set', 'action': action, 'command_id': command.id})
             
             return jsonify({'status': 'command set', 'action': action})
             
@@ -329,13 +309,14 @@ def handle_command():
     else:
         # GET - Return latest command for device
         try:
-            device_id = request.args.get('device_id')
+            device_id = request.args.get('device_id', type=int)
+            if device_id is None and request.args.get('device_id'):
+                return jsonify({'error': 'device_id must be an integer'}), 400
             
             if device_id:
-                device = IoTDevice.query.filter_by(
-                    id=device_id,
-                    owner_id=current_user.id
-                ).first()
+                device = lookup_device(device_id)
+                if device and device.owner_id != current_user.id:
+                    device = None
             else:
                 device = IoTDevice.query.filter_by(
                     owner_id=current_user.id,
@@ -359,6 +340,61 @@ def handle_command():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+@iot_bp.route('/api/devices/<int:device_id>/commands')
+def poll_device_commands(device_id):
+    """Long-poll for an actuator's undelivered commands"""
+    device = authenticated_device(device_id, request.args.get('mac_address'))
+    if device is None:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    max_timeout = current_app.config['IOT_COMMAND_POLL_TIMEOUT']
+    timeout = min(max(request.args.get('timeout', max_timeout, type=float), 0), max_timeout)
+    
+    try:
+        # Polling is how actuators show they are alive
+        liveness.mark_seen([device], datetime.utcnow())
+        db.session.commit()
+        
+        commands = poll_commands(device_id, timeout, current_app.config['IOT_COMMAND_RECHECK_SECONDS'])
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'commands': [
+            {
+                'id': command.id,
+                'action': command.command,
+                'parameters': command.parameters,
+                'created_at': command.created_at.isoformat()
+            }
+            for command in commands
+        ]
+    })
+
+@iot_bp.route('/api/commands/<int:command_id>/ack', methods=['POST'])
+@csrf.exempt
+def acknowledge_command(command_id):
+    """Record whether a device executed a delivered command"""
+    data = request.get_json() or {}
+    status = data.get('status')
+    if status not in ['executed', 'failed']:
+        return jsonify({'error': "status must be 'executed' or 'failed'"}), 400
+    
+    command = IoTCommand.query.get(command_id)
+    if (command is None or str(data.get('device_id')) != str(command.device_id)
+            or authenticated_device(command.device_id, data.get('mac_address')) is None):
+        return jsonify({'error': 'Command not found'}), 404
+    if command.status in ['executed', 'failed']:
+        return jsonify({'error': f'Command already {command.status}'}), 409
+    
+    command.status = status
+    command.executed_at = datetime.utcnow()
+    command.response = data.get('response')
+    db.session.commit()
+    
+    return jsonify({'status': 'ok', 'command_id': command.id, 'command_status': command.status})
+
 @iot_bp.route('/devices')
 @login_required
 def devices():
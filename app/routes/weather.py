@@ -2,9 +2,11 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models.weather import WeatherData, WeatherAlert
-from app.utils.weather import get_weather_data, get_weather_forecast
+from app.utils.weather import get_weather_data, get_weather_forecast, weather_history
+from app.utils.geo import weather_station
+from app.utils.weather_refresh import weather_refresher
 from sqlalchemy import desc, func
-from datetime import datetime, timedelta
+from datetime import datetime
 
 weather_bp = Blueprint('weather', __name__)
 
@@ -12,20 +14,20 @@ weather_bp = Blueprint('weather', __name__)
 def index():
     """Weather dashboard"""
     location = request.args.get('location', current_user.location if current_user.is_authenticated else 'Tunisia')
+    station = weather_station(location)
+    weather_refresher.track(station)
     
     # Get current weather data
-    weather_data = WeatherData.query.filter_by(location=location).order_by(desc(WeatherData.recorded_at)).first()
+    weather_data = WeatherData.query.filter_by(location=station).order_by(desc(WeatherData.recorded_at)).first()
     
     # Get weather forecast (next 7 days)
-    forecast_data = get_weather_forecast(location)
+    forecast_data = get_weather_forecast(station)
     
     # Get active weather alerts
     alerts = WeatherAlert.query.filter_by(is_active=True).all()
     
-    # Get historical weather data for charts
-    historical_data = WeatherData.query.filter_by(location=location).filter(
-        WeatherData.recorded_at >= datetime.utcnow() - timedelta(days=7)
-    ).order_by(WeatherData.recorded_at).all()
+    # Get daily weather series for charts
+    _, historical_data = weather_history(station, 7)
     
     return render_template('weather/index.html',
                          weather_data=weather_data,
@@ -38,17 +40,19 @@ def index():
 def api_current_weather():
     """API endpoint for current weather"""
     location = request.args.get('location', 'Tunisia')
+    station = weather_station(location)
+    weather_refresher.track(station)
     
-    # Try to get from database first
-    weather_data = WeatherData.query.filter_by(location=location).order_by(desc(WeatherData.recorded_at)).first()
-    
-    # If no recent data or data is older than 1 hour, fetch from API
-    if not weather_data or (datetime.utcnow() - weather_data.recorded_at).seconds > 3600:
-        weather_data = get_weather_data(location)
+    # The background refresher keeps tracked locations current, so only a
+    # location never seen before is fetched inline
+    weather_data = WeatherData.query.filter_by(location=station).order_by(desc(WeatherData.recorded_at)).first()
+    if not weather_data:
+        weather_data = get_weather_data(station)
     
     if weather_data:
         return jsonify({
-            'location': weather_data.location,
+            'location': location,
+            'station': station,
             'temperature': weather_data.temperature,
             'humidity': weather_data.humidity,
             'pressure': weather_data.pressure,
@@ -60,7 +64,8 @@ def api_current_weather():
             'cloud_cover': weather_data.cloud_cover,
             'weather_condition': weather_data.weather_condition,
             'weather_description': weather_data.weather_description,
-            'recorded_at': weather_data.recorded_at.isoformat()
+            'recorded_at': weather_data.recorded_at.isoformat(),
+            'age_seconds': int((datetime.utcnow() - weather_data.recorded_at).total_seconds())
         })
     
     return jsonify({'error': 'Weather data not available'}), 404
@@ -70,11 +75,30 @@ def api_forecast():
     """API endpoint for weather forecast"""
     location = request.args.get('location', 'Tunisia')
     days = request.args.get('days', 7, type=int)
+    station = weather_station(location)
+    weather_refresher.track(station)
     
-    forecast_data = get_weather_forecast(location, days)
+    forecast_data = get_weather_forecast(station, days)
     
     return jsonify(forecast_data)
 
+@weather_bp.route('/api/historical')
+def api_historical():
+    """API endpoint for historical weather statistics and daily series"""
+    location = request.args.get('location', 'Tunisia')
+    days = request.args.get('days', 30, type=int)
+    
+    station = weather_station(location)
+    stats, daily = weather_history(station, days)
+    
+    return jsonify({
+        'location': location,
+        'station': station,
+        'days': days,
+        'stats': stats,
+        'daily': daily
+    })
+
 @weather_bp.route('/api/alerts')
 def api_alerts():
     """API endpoint for weather alerts"""
@@ -132,29 +156,8 @@ def historical():
     location = request.args.get('location', current_user.location if current_user.is_authenticated else 'Tunisia')
     days = request.args.get('days', 30, type=int)
     
-    # Get historical data
-    start_date = datetime.utcnow() - timedelta(days=days)
-    historical_data = WeatherData.query.filter(
-        WeatherData.location == location,
-        WeatherData.recorded_at >= start_date
-    ).order_by(WeatherData.recorded_at).all()
-    
-    # Calculate statistics
-    if historical_data:
-        temperatures = [data.temperature for data in historical_data]
-        humidities = [data.humidity for data in historical_data]
-        precipitations = [data.precipitation for data in historical_data]
-        
-        stats = {
-            'avg_temperature': sum(temperatures) / len(temperatures),
-            'max_temperature': max(temperatures),
-            'min_temperature': min(temperatures),
-            'avg_humidity': sum(humidities) / len(humidities),
-            'total_precipitation': sum(precipitations),
-            'data_points': len(historical_data)
-        }
-    else:
-        stats = None
+    # Summary and daily chart series, both read from the daily rollups
+    stats, historical_data = weather_history(weather_station(location), days)
     
     return render_template('weather/historical.html',
                          historical_data=historical_data,
@@ -166,9 +169,11 @@ def historical():
 def agricultural_advice():
     """Agricultural advice based on weather conditions"""
     location = request.args.get('location', current_user.location if current_user.is_authenticated else 'Tunisia')
+    station = weather_station(location)
+    weather_refresher.track(station)
     
     # Get current weather
-    weather_data = WeatherData.query.filter_by(location=location).order_by(desc(WeatherData.recorded_at)).first()
+    weather_data = WeatherData.query.filter_by(location=station).order_by(desc(WeatherData.recorded_at)).first()
     
     advice = []
     
@@ -97,8 +97,10 @@ function initializeRealTimeUpdates() {
     // Update weather data every 10 minutes
     setInterval(updateWeatherData, 600000);
     
-    // Update IoT data every 30 seconds
-    setInterval(updateIoTData, 30000);
+    // Push IoT readings to any widget on the page that displays them
+    if (typeof updateIoTDisplay === 'function') {
+        subscribeIoTFeed(updateIoTDisplay);
+    }
     
     // Update notifications every minute
     setInterval(updateNotifications, 60000);
@@ -115,11 +117,85 @@ function updateWeatherData() {
         .catch(error => console.error('Error updating weather:', error));
 }
 
+// Live IoT feed: one EventSource per page, shared by every subscriber.
+// Listeners receive arrays of {device_id, sensor_type, value, unit, timestamp}.
+// Whenever the stream stays quiet for a poll interval (a server worker that
+// does not see every reading, or no readings at all), /api/iot/devices is
+// polled instead until the stream delivers again.
+const iotFeed = {
+    source: null,
+    pollTimer: null,
+    quietTimer: null,
+    pollInterval: 30000,
+    listeners: []
+};
+
+function subscribeIoTFeed(listener, pollInterval = 30000) {
+    iotFeed.listeners.push(listener);
+    iotFeed.pollInterval = Math.min(iotFeed.pollInterval, pollInterval);
+    
+    if (!iotFeed.source && !iotFeed.pollTimer) {
+        startIoTFeed();
+    }
+}
+
+function notifyIoTListeners(readings) {
+    iotFeed.listeners.forEach(listener => listener(readings));
+}
+
+function startIoTFeed() {
+    if (!window.EventSource) {
+        startIoTPolling();
+        return;
+    }
+    
+    const source = new EventSource('/iot/api/live');
+    iotFeed.source = source;
+    
+    const handleEvent = event => {
+        resetIoTQuietTimer();
+        notifyIoTListeners(JSON.parse(event.data));
+    };
+    source.addEventListener('snapshot', handleEvent);
+    source.addEventListener('readings', handleEvent);
+    resetIoTQuietTimer();
+    
+    source.onerror = function() {
+        // The browser reconnects on its own unless the server refused the stream
+        if (source.readyState === EventSource.CLOSED) {
+            iotFeed.source = null;
+            clearTimeout(iotFeed.quietTimer);
+            startIoTPolling();
+        }
+    };
+}
+
+function resetIoTQuietTimer() {
+    clearTimeout(iotFeed.quietTimer);
+    iotFeed.quietTimer = setTimeout(function pollWhileQuiet() {
+        updateIoTData();
+        iotFeed.quietTimer = setTimeout(pollWhileQuiet, iotFeed.pollInterval);
+    }, iotFeed.pollInterval);
+}
+
+function startIoTPolling() {
+    updateIoTData();
+    iotFeed.pollTimer = setInterval(updateIoTData, iotFeed.pollInterval);
+}
+
 function updateIoTData() {
     fetch('/api/iot/devices')
         .then(response => response.json())
-        .then(data => {
-            updateIoTDisplay(data);
+        .then(devices => {
+            notifyIoTListeners(devices
+                .filter(device => device.latest_data.value !== null)
+                .map(device => ({
+                    device_id: device.id,
+                    sensor_type: device.sensor_type,
+                    value: device.latest_data.value,
+                    unit: device.latest_data.unit,
+                    timestamp: device.latest_data.timestamp
+                })));
         })
         .catch(error => console.error('Error updating IoT data:', error));
 }
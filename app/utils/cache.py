@@ -0,0 +1,300 @@
+"""
+Response cache for slow upstream calls in AgriConnect
+
+ResponseCache keeps JSON-serializable values under string keys with two
+deadlines: a value is fresh for `ttl` seconds, then served stale for up to
+`stale_ttl` more while one background refresh replaces it. Only a cold miss
+makes the caller wait, and concurrent misses for one key are coalesced so a
+single call reaches upstream (single-flight).
+
+Values live in an in-process LRU (MemoryBackend), or in Redis at REDIS_URL
+(RedisBackend) so several workers share them; with Redis, a short lock key
+also coalesces misses across processes. CACHE_BACKEND picks one.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class MemoryBackend:
+    """Bounded in-process store of (value, fresh_until, expires_at) entries"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def _store(self, key, value, fresh_until, expires_at):
+        self._entries[key] = (value, fresh_until, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key, value, fresh_until, expires_at):
+        with self._lock:
+            self._store(key, value, fresh_until, expires_at)
+
+    def update(self, key, change, fresh_until, expires_at):
+        """Atomically replace `key`'s value with change(value), or change(None) when missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+            current = entry[0] if entry is not None and entry[2] > time.time() else None
+            value = change(current)
+            self._store(key, value, fresh_until, expires_at)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def acquire(self, key, seconds):
+        # In-process coalescing already lets a single caller through
+        return True
+
+    def release(self, key):
+        pass
+
+class RedisBackend:
+    """Entries as JSON strings in Redis, expiring when they stop being servable"""
+
+    def __init__(self, url, prefix='agriconnect:cache:'):
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry['value'], entry['fresh_until']
+
+    def set(self, key, value, fresh_until, expires_at):
+        milliseconds = max(1, int((expires_at - time.time()) * 1000))
+        self._client.set(
+            self.prefix + key,
+            json.dumps({'value': value, 'fresh_until': fresh_until}),
+            px=milliseconds
+        )
+
+    def update(self, key, change, fresh_until, expires_at):
+        """Atomically replace `key`'s value with change(value), or change(None) when missing.
+
+        Optimistic: `change` runs again whenever another client wrote the
+        key between our read and our write.
+        """
+        from redis.exceptions import WatchError
+
+        name = self.prefix + key
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    value = change(json.loads(raw)['value'] if raw is not None else None)
+                    milliseconds = max(1, int((expires_at - time.time()) * 1000))
+                    pipe.multi()
+                    pipe.set(name, json.dumps({'value': value, 'fresh_until': fresh_until}), px=milliseconds)
+                    pipe.execute()
+                    return value
+                except WatchError:
+                    continue
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def acquire(self, key, seconds):
+        """Claim the right to load `key` across processes for `seconds`"""
+        return bool(self._client.set(self.prefix + key + ':lock', '1', nx=True, px=int(seconds * 1000)))
+
+    def release(self, key):
+        self._client.delete(self.prefix + key + ':lock')
+
+def make_backend(app):
+    """The backend named by CACHE_BACKEND: 'memory' or 'redis'"""
+    if app.config['CACHE_BACKEND'] == 'redis':
+        return RedisBackend(app.config['REDIS_URL'])
+    return MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+
+class _Flight:
+    """One in-progress load that other callers of the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ResponseCache:
+    """TTL cache with stale-while-revalidate and single-flight loading"""
+
+    def __init__(self, namespace, ttl_setting=None, stale_setting=None, ttl=300, stale_ttl=3600, load_timeout=30):
+        self.namespace = namespace
+        self.ttl_setting = ttl_setting
+        self.stale_setting = stale_setting
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.load_timeout = load_timeout
+        self.backend = MemoryBackend()
+        self._app = None
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0, 'coalesced': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self._app = app
+        self.backend = make_backend(app)
+        if self.ttl_setting:
+            self.ttl = app.config[self.ttl_setting]
+        if self.stale_setting:
+            self.stale_ttl = app.config[self.stale_setting]
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception:
+            # An unreachable Redis behaves like an empty cache
+            logger.exception('Cache read failed for %s', key)
+            return None
+
+    def _store(self, key, value, ttl):
+        now = time.time()
+        try:
+            self.backend.set(key, value, now + ttl, now + ttl + self.stale_ttl)
+        except Exception:
+            logger.exception('Cache write failed for %s', key)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` to fill it.
+
+        Fresh values are returned as is. Stale ones are returned at once while
+        a background thread reloads them. On a miss the caller runs the
+        loader, or waits for the caller already running it; loader errors
+        reach every waiting caller and nothing is cached.
+        """
+        key = self._key(key)
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until > time.time():
+                self._count('hits')
+            else:
+                self._count('stale_hits')
+                self._refresh(key, loader, ttl)
+            return value
+
+        self._count('misses')
+        return self._load(key, loader, ttl)
+
+    def _load(self, key, loader, ttl):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait(self.load_timeout)
+            if flight.error is not None:
+                raise flight.error
+            if not flight.done.is_set():
+                raise TimeoutError(f'Timed out waiting for {key}')
+            return flight.value
+
+        try:
+            flight.value = self._load_once(key, loader, ttl)
+        except Exception as e:
+            flight.error = e
+            self._count('errors')
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def _load_once(self, key, loader, ttl):
+        """Run the loader, unless another process is already loading `key`"""
+        if not self._acquire(key):
+            deadline = time.monotonic() + self.load_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = self._get(key)
+                if entry is not None:
+                    return entry[0]
+            # The other process gave up or died; load it ourselves
+
+        try:
+            self._count('loads')
+            value = loader()
+            self._store(key, value, ttl)
+            return value
+        finally:
+            self._release(key)
+
+    def _acquire(self, key):
+        try:
+            return self.backend.acquire(key, self.load_timeout)
+        except Exception:
+            logger.exception('Cache lock failed for %s', key)
+            return True
+
+    def _release(self, key):
+        try:
+            self.backend.release(key)
+        except Exception:
+            logger.exception('Cache unlock failed for %s', key)
+
+    def _refresh(self, key, loader, ttl):
+        """Reload a stale key in the background, once per key at a time"""
+        with self._lock:
+            if key in self._flights:
+                return
+
+        def run():
+            try:
+                if self._app is not None:
+                    with self._app.app_context():
+                        self._load(key, loader, ttl)
+                else:
+                    self._load(key, loader, ttl)
+            except Exception:
+                # The stale value keeps being served until a reload succeeds
+                logger.exception('Background refresh failed for %s', key)
+
+        threading.Thread(target=run, name=f'cache-refresh-{key}', daemon=True).start()
+
+    def refresh(self, key, loader, ttl=None):
+        """Reload `key` now, joining any load already in flight; returns the value"""
+        return self._load(self._key(key), loader, self.ttl if ttl is None else ttl)
+
+    def invalidate(self, key):
+        try:
+            self.backend.delete(self._key(key))
+        except Exception:
+            logger.exception('Cache delete failed for %s', key)
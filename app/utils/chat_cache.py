@@ -0,0 +1,189 @@
+"""
+Chatbot response cache for AgriConnect
+
+Farmers ask the same few questions in many spellings, so Gemini answers
+are kept per language and looked up in two tiers:
+
+- exact: the normalized question (case, punctuation, Arabic diacritics and
+  extra spaces removed) was answered before;
+- similar: a cached question's TF-IDF vector, over words and character
+  trigrams, is within CHAT_CACHE_SIMILARITY cosine of the new one. Trigrams
+  let "tomatoes"/"tomato" or "nazre3"/"nazra3" still match.
+
+The index is in-process and offline: an inverted index from term to cached
+questions, so a lookup only scores questions sharing a term with the new
+one. A cached question's weights use the document frequencies of when it
+was stored. Entries expire after CHAT_CACHE_TTL_SECONDS and the least
+recently used are evicted beyond CHAT_CACHE_MAX_ENTRIES.
+"""
+
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+_ARABIC_MARKS = re.compile('[\u064b-\u065f\u0670\u0640]')  # Harakat, superscript alef, tatweel
+_NON_WORD = re.compile(r'[^\w]+')
+
+def normalize_query(text):
+    """Lowercase words of `text`, without punctuation or Arabic diacritics"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = _ARABIC_MARKS.sub('', text)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+def query_terms(normalized):
+    """Term counts of a normalized question: its words and their character trigrams"""
+    terms = Counter()
+    for word in normalized.split():
+        terms['w:' + word] += 1
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            terms[padded[i:i + 3]] += 1
+    return terms
+
+class _Entry:
+    __slots__ = ('language', 'normalized', 'response', 'stored_at', 'weights', 'norm')
+
+    def __init__(self, language, normalized, response, stored_at, weights):
+        self.language = language
+        self.normalized = normalized
+        self.response = response
+        self.stored_at = stored_at
+        self.weights = weights
+        self.norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+
+    @property
+    def key(self):
+        return self.language, self.normalized
+
+class ChatResponseCache:
+    """Exact and TF-IDF similarity lookups of earlier chatbot answers"""
+
+    def __init__(self, max_entries=2000, ttl=86400, threshold=0.85):
+        self.enabled = True
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._document_frequency = Counter()
+        self._stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config['CHAT_CACHE_ENABLED']
+        self.max_entries = app.config['CHAT_CACHE_MAX_ENTRIES']
+        self.ttl = app.config['CHAT_CACHE_TTL_SECONDS']
+        self.threshold = app.config['CHAT_CACHE_SIMILARITY']
+
+    def _idf(self, term):
+        # Smoothed, so terms no cached question has still count
+        return math.log((1 + len(self._entries)) / (1 + self._document_frequency[term])) + 1
+
+    def _weights(self, terms):
+        return {term: count * self._idf(term) for term, count in terms.items()}
+
+    def lookup(self, message, language, similar=True):
+        """Cached answer to `message` as (response, 'exact' or 'similar'), or (None, None)"""
+        if not self.enabled:
+            return None, None
+        normalized = normalize_query(message)
+        if not normalized:
+            return None, None
+
+        with self._lock:
+            self._expire()
+            entry = self._entries.get((language, normalized))
+            if entry is not None:
+                self._entries.move_to_end(entry.key)
+                self._stats['exact_hits'] += 1
+                return entry.response, 'exact'
+
+            best, score = self._most_similar(language, query_terms(normalized)) if similar else (None, 0.0)
+            if best is not None and score >= self.threshold:
+                self._entries.move_to_end(best.key)
+                self._stats['similar_hits'] += 1
+                return best.response, 'similar'
+
+            self._stats['misses'] += 1
+            return None, None
+
+    def _most_similar(self, language, terms):
+        weights = self._weights(terms)
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        dots = Counter()
+        for term, weight in weights.items():
+            for key in self._postings.get(term, ()):
+                if key[0] == language:
+                    dots[key] += weight * self._entries[key].weights[term]
+
+        best, score = None, 0.0
+        for key, dot in dots.items():
+            entry = self._entries[key]
+            similarity = dot / (norm * entry.norm)
+            if similarity > score:
+                best, score = entry, similarity
+        return best, score
+
+    def store(self, message, language, response):
+        """Remember `response` as the answer to `message`"""
+        if not self.enabled:
+            return
+        normalized = normalize_query(message)
+        if not normalized:
+            return
+
+        with self._lock:
+            key = (language, normalized)
+            if key in self._entries:
+                self._remove(key)
+            terms = query_terms(normalized)
+            for term in terms:
+                self._document_frequency[term] += 1
+                self._postings.setdefault(term, set()).add(key)
+            self._entries[key] = _Entry(language, normalized, response, time.monotonic(), self._weights(terms))
+            self._stats['stores'] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for term in entry.weights:
+            self._document_frequency[term] -= 1
+            if not self._document_frequency[term]:
+                del self._document_frequency[term]
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._postings[term]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        # Entries are in use order, not insertion order, so check them all
+        for key in [key for key, entry in self._entries.items() if entry.stored_at < cutoff]:
+            self._remove(key)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._document_frequency.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['exact_hits'] + self._stats['similar_hits'] + self._stats['misses']
+            hits = self._stats['exact_hits'] + self._stats['similar_hits']
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                terms=len(self._postings),
+                hit_rate=hits / lookups if lookups else 0.0
+            )
+
+chat_cache = ChatResponseCache()
@@ -0,0 +1,192 @@
+"""
+Conversation context for AgriConnect chat sessions
+
+Each ChatSession's last CHAT_CONTEXT_TURNS question/answer pairs, plus a
+rolling summary of the turns before them, are kept in the cache backends of
+app.utils.cache: an in-process LRU of CHAT_CONTEXT_MAX_SESSIONS sessions,
+or Redis when CACHE_BACKEND is 'redis' so every worker sees the same
+context. A turn is recorded once its reply is known, so building a prompt
+never reads the session's messages from the database. Only a session
+missing from the cache (new process, evicted, expired after
+CHAT_CONTEXT_TTL_SECONDS) is rebuilt, from its newest messages.
+
+The summary is extractive: the gist of each older question and the start
+of its answer, with the oldest notes dropped beyond
+CHAT_CONTEXT_SUMMARY_TOKENS. build_prompt() fits recent turns, newest
+first, and then the summary around the question's own prompt, within
+CHAT_CONTEXT_TOKEN_BUDGET.
+"""
+
+import logging
+import re
+import threading
+import time
+from app.utils.cache import MemoryBackend, RedisBackend
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?؟])\s')
+
+def estimate_tokens(text):
+    """Rough token count of `text`: about four characters per token"""
+    return (len(text) + 3) // 4
+
+def clip(text, max_tokens):
+    """`text` cut to about `max_tokens` tokens, at a word boundary"""
+    text = ' '.join(text.split())
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4].rsplit(' ', 1)[0]
+    return cut + '…'
+
+def summary_note(question, answer):
+    """One line of the rolling summary for an older turn"""
+    first_sentence = _SENTENCE_END.split(' '.join(answer.split()), 1)[0]
+    return f"Q: {clip(question, 30)} A: {clip(first_sentence, 30)}"
+
+class ChatContextStore:
+    """Recent turns and a rolling summary per chat session"""
+
+    def __init__(self, turns=6, token_budget=2000, summary_tokens=300, ttl=86400):
+        self.enabled = True
+        self.turns = turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.ttl = ttl
+        self.backend = MemoryBackend()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'rebuilds': 0, 'turns_recorded': 0, 'turns_summarized': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config['CHAT_CONTEXT_ENABLED']
+        self.turns = app.config['CHAT_CONTEXT_TURNS']
+        self.token_budget = app.config['CHAT_CONTEXT_TOKEN_BUDGET']
+        self.summary_tokens = app.config['CHAT_CONTEXT_SUMMARY_TOKENS']
+        self.ttl = app.config['CHAT_CONTEXT_TTL_SECONDS']
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['REDIS_URL'], prefix='agriconnect:chat-context:')
+        else:
+            self.backend = MemoryBackend(app.config['CHAT_CONTEXT_MAX_SESSIONS'])
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, session_id):
+        """The session's context: {'turns': [[question, answer], ...], 'summary': [note, ...]}"""
+        if not self.enabled or session_id is None:
+            return {'turns': [], 'summary': []}
+        key = str(session_id)
+        try:
+            entry = self.backend.get(key)
+        except Exception:
+            # An unreachable Redis means rebuilding from the database
+            logger.exception('Chat context read failed for session %s', session_id)
+            entry = None
+        if entry is not None:
+            self._count('hits')
+            return entry[0]
+        self._count('rebuilds')
+        return self._rebuild(session_id)
+
+    def _rebuild(self, session_id):
+        """Context from the session's newest messages: one bounded, indexed query"""
+        from app.models.chatbot import ChatMessage
+
+        messages = (
+            ChatMessage.query
+            .filter_by(session_id=session_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(self.turns * 2 + 1)
+            .all()
+        )
+        turns = []
+        question = None
+        for message in reversed(messages):
+            if message.message_type == 'user':
+                question = message.content
+            elif message.message_type == 'bot' and question is not None:
+                turns.append([question, message.content])
+                question = None
+        # A trailing question without an answer is the turn being asked now
+        context = {'turns': turns[-self.turns:], 'summary': []}
+        self._save(session_id, context)
+        return context
+
+    def _save(self, session_id, context):
+        now = time.time()
+        try:
+            self.backend.set(str(session_id), context, now + self.ttl, now + self.ttl)
+        except Exception:
+            logger.exception('Chat context write failed for session %s', session_id)
+
+    def record(self, session_id, question, answer):
+        """Add a finished turn, folding the oldest recent turn into the summary.
+
+        The turn is added with the backend's atomic update, so replies
+        finishing together in one session each keep their turn.
+        """
+        if not self.enabled or session_id is None or not answer:
+            return
+        # Rebuilds a missing session first, outside the backend's lock
+        context = self.get(session_id)
+        summarized = 0
+
+        def add_turn(current):
+            nonlocal summarized
+            current = current or context
+            summarized = 0
+            turns = current['turns'] + [[question, answer]]
+            summary = list(current['summary'])
+            while len(turns) > self.turns:
+                summary.append(summary_note(*turns.pop(0)))
+                summarized += 1
+            while summary and sum(estimate_tokens(note) for note in summary) > self.summary_tokens:
+                summary.pop(0)
+            return {'turns': turns, 'summary': summary}
+
+        now = time.time()
+        try:
+            self.backend.update(str(session_id), add_turn, now + self.ttl, now + self.ttl)
+        except Exception:
+            logger.exception('Chat context write failed for session %s', session_id)
+            return
+        with self._lock:
+            self.stats['turns_recorded'] += 1
+            self.stats['turns_summarized'] += summarized
+
+    def build_prompt(self, context, prompt):
+        """`prompt` preceded by as much of a session's context as fits the token budget"""
+        budget = self.token_budget - estimate_tokens(prompt)
+
+        recent = []
+        older = list(context['turns'])
+        while older:
+            lines = "Farmer: {}\nAssistant: {}".format(*older[-1])
+            cost = estimate_tokens(lines)
+            if cost > budget:
+                break
+            recent.insert(0, lines)
+            older.pop()
+            budget -= cost
+
+        # Turns too long to quote join the summary, newest notes first
+        notes = []
+        for note in reversed(context['summary'] + [summary_note(*turn) for turn in older]):
+            cost = estimate_tokens(note)
+            if cost > budget:
+                break
+            notes.insert(0, note)
+            budget -= cost
+
+        if not recent and not notes:
+            return prompt
+        parts = []
+        if notes:
+            parts.append("Summary of the earlier conversation:\n" + '\n'.join(notes))
+        if recent:
+            parts.append("Most recent exchanges:\n" + '\n\n'.join(recent))
+        parts.append("Answer the new question below, taking this conversation into account.\n\n" + prompt)
+        return '\n\n'.join(parts)
+
+chat_context = ChatContextStore()
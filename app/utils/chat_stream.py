@@ -0,0 +1,13 @@
+"""
+Server-Sent Events for the AgriConnect chatbot
+
+/api/chat/stream sends each reply as a `meta` event, `chunk` events as the
+LLM produces text, then `done` or `error`. Bounding and timing out the LLM
+calls behind it is app.utils.llm's job.
+"""
+
+import json
+
+def format_event(name, data):
+    """One Server-Sent Events message carrying `data` as JSON"""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
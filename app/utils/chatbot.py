@@ -1,84 +1,12 @@
-import openai
-import os
 import json
 import re
 import random
 from datetime import datetime
 from app import db
 from app.models.chatbot import ChatSession, ChatMessage
-
-# Gemini AI Integration
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = False
-    
-    # Configure Gemini API
-    GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-    
-    if GEMINI_API_KEY:
-        print("🔧 Initializing Gemini API...")
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Find available models and use the first working one
-        try:
-            print("🔍 Checking available Gemini models...")
-            available_models = list(genai.list_models())
-            
-            # Print available models for debugging
-            print(f"📋 Found {len(available_models)} models")
-            for model in available_models[:5]:  # Show first 5
-                if 'generateContent' in model.supported_generation_methods:
-                    print(f"   ✅ Available: {model.name}")
-            
-            # Try to use the latest available models first
-            preferred_models = [
-                "models/gemini-2.5-flash",
-                "models/gemini-2.5-pro-preview-03-25",
-                "models/gemini-1.5-pro", 
-                "models/gemini-1.5-flash",
-                "gemini-2.5-flash",
-                "gemini-1.5-pro",
-                "gemini-1.5-flash"
-            ]
-            
-            gemini_model = None
-            for model_name in preferred_models:
-                try:
-                    print(f"🧪 Testing model: {model_name}")
-                    gemini_model = genai.GenerativeModel(model_name)
-                    
-                    # Simple test without content generation
-                    if gemini_model:
-                        print(f"✅ Successfully initialized: {model_name}")
-                        GEMINI_AVAILABLE = True
-                        break
-                        
-                except Exception as model_error:
-                    print(f"❌ Model {model_name} failed: {model_error}")
-                    continue
-                    
-            if not GEMINI_AVAILABLE:
-                print("❌ No working Gemini models found")
-                # Try one more time with any available model
-                for model in available_models:
-                    if 'generateContent' in model.supported_generation_methods:
-                        try:
-                            print(f"🔄 Trying fallback model: {model.name}")
-                            gemini_model = genai.GenerativeModel(model.name)
-                            GEMINI_AVAILABLE = True
-                            print(f"✅ Using fallback model: {model.name}")
-                            break
-                        except:
-                            continue
-                
-        except Exception as e:
-            print(f"❌ Gemini API error: {e}")
-            GEMINI_AVAILABLE = False
-            
-except ImportError:
-    print("⚠️ Google Generative AI not installed. Using fallback to OpenAI/mock responses.")
-    GEMINI_AVAILABLE = False
-    gemini_model = None
+from app.utils.chat_cache import chat_cache
+from app.utils.chat_context import chat_context, estimate_tokens
+from app.utils.llm import LLMUnavailable, llm
 
 def detect_language(text):
     """Detect language from user input"""
@@ -110,15 +38,11 @@ def detect_language(text):
     # Default to Arabic for MENA region
     return 'ar'
 
-def get_gemini_response(query, language='ar'):
-    """Get response from Gemini AI with agriculture focus"""
-    if not GEMINI_AVAILABLE or not gemini_model:
-        return None
-    
-    try:
-        # Create agriculture-focused prompts based on language
-        if language == 'ar':
-            prompt = f"""أنت خبير زراعي متخصص في الزراعة في تونس والمنطقة المغاربية. أجب على هذا السؤال باللغة العربية:
+def build_gemini_prompt(query, language):
+    """Agriculture-focused Gemini prompt for a question, in the asker's language"""
+    # Create agriculture-focused prompts based on language
+    if language == 'ar':
+        prompt = f"""أنت خبير زراعي متخصص في الزراعة في تونس والمنطقة المغاربية. أجب على هذا السؤال باللغة العربية:
 
 السؤال: {query}
 
@@ -132,8 +56,8 @@ def get_gemini_response(query, language='ar'):
 
 استخدم معلومات حديثة ومناسبة للمزارعين في تونس."""
 
-        elif language == 'tn':
-            prompt = f"""Enta khabir zer3i motakhassis fel zer3a f Tounes w el mantaqa el maghribiya. Jaweb 3la hedha sou2al bil lahja tounisiya:
+    elif language == 'tn':
+        prompt = f"""Enta khabir zer3i motakhassis fel zer3a f Tounes w el mantaqa el maghribiya. Jaweb 3la hedha sou2al bil lahja tounisiya:
 
 Sou2al: {query}
 
@@ -147,8 +71,8 @@ Sou2al: {query}
 
 Ista3mal ma3loumet 7aditha w monasba lil fellahin f Tounes."""
 
-        elif language == 'fr':
-            prompt = f"""Vous êtes un expert agricole spécialisé dans l'agriculture en Tunisie et au Maghreb. Répondez à cette question en français:
+    elif language == 'fr':
+        prompt = f"""Vous êtes un expert agricole spécialisé dans l'agriculture en Tunisie et au Maghreb. Répondez à cette question en français:
 
 Question: {query}
 
@@ -162,8 +86,8 @@ Fournissez une réponse utile et détaillée sur:
 
 Utilisez des informations récentes et adaptées aux agriculteurs tunisiens."""
 
-        else:  # English
-            prompt = f"""You are an agricultural expert specializing in farming in Tunisia and North Africa. Answer this question in English:
+    else:  # English
+        prompt = f"""You are an agricultural expert specializing in farming in Tunisia and North Africa. Answer this question in English:
 
 Question: {query}
 
@@ -176,93 +100,149 @@ Provide a helpful and detailed answer about:
 - Practical applicable advice
 
 Use current information suitable for farmers in Tunisia."""
+    
+    return prompt
 
-        print(f"🤖 Sending prompt to Gemini (language: {language})")
-        print(f"🔍 Gemini model available: {gemini_model is not None}")
-        
-        # Generate response with better error handling
-        try:
-            print("🔄 Calling gemini_model.generate_content...")
-            response = gemini_model.generate_content(prompt)
-            print(f"🔍 Response object type: {type(response)}")
-            print(f"🔍 Response object: {response}")
-            
-            if response and hasattr(response, 'text'):
-                print(f"🔍 Response has text attribute: {hasattr(response, 'text')}")
-                if response.text:
-                    print(f"✅ Gemini response received ({len(response.text)} chars)")
-                    print(f"🔍 Response preview: {response.text[:100]}...")
-                    return response.text.strip()
-                else:
-                    print(f"❌ Response.text is empty: '{response.text}'")
-            elif response and hasattr(response, 'parts'):
-                print(f"🔍 Response has parts: {len(response.parts) if response.parts else 0}")
-                # Handle structured response
-                text_parts = []
-                for part in response.parts:
-                    if hasattr(part, 'text'):
-                        text_parts.append(part.text)
-                        print(f"🔍 Part text: {part.text[:50]}...")
-                if text_parts:
-                    result = ' '.join(text_parts).strip()
-                    print(f"✅ Gemini structured response received ({len(result)} chars)")
-                    return result
-                else:
-                    print("❌ No text parts found in structured response")
-            else:
-                print(f"❌ Response has no text or parts attributes")
-                print(f"🔍 Available attributes: {dir(response) if response else 'None'}")
-            
-            print("❌ No valid response text from Gemini")
-            return None
-            
-        except Exception as api_error:
-            print(f"❌ Gemini content generation error: {type(api_error).__name__}: {api_error}")
-            import traceback
-            traceback.print_exc()
-            return None
-            
-    except Exception as e:
-        print(f"❌ Gemini function error: {e}")
+def get_gemini_response(query, language='ar', context=None):
+    """Get response from the LLM with agriculture focus; None when it cannot answer in time"""
+    prompt = build_gemini_prompt(query, language)
+    if context:
+        prompt = chat_context.build_prompt(context, prompt)
+    try:
+        print(f"🤖 Sending prompt to {llm.backend.name} (language: {language}, ~{estimate_tokens(prompt)} tokens)")
+        response = llm.generate(prompt)
+    except LLMUnavailable as e:
+        print(f"⚠️ LLM unavailable ({e.reason}), using fallback")
         return None
+    
+    if response and response.strip():
+        print(f"✅ LLM response received ({len(response)} chars)")
+        return response.strip()
+    
+    print("❌ No valid response text from LLM")
+    return None
 
 def get_ai_response(message, language=None, session_id=None):
     """Enhanced AI response with Gemini integration"""
+    return get_ai_reply(message, language, session_id)[0]
+
+def get_ai_reply(message, language=None, session_id=None):
+    """AI response as (text, from_cache), in the context of the chat session `session_id` (ChatSession.id)"""
     
     # Auto-detect language if not provided
     if not language:
         language = detect_language(message)
     
+    context = chat_context.get(session_id)
+    response, from_cache = _answer(message, language, context)
+    chat_context.record(session_id, message, response)
+    return response, from_cache
+
+def _is_follow_up(context):
+    return bool(context['turns'] or context['summary'])
+
+def _cached_answer(message, language, context):
+    # Only answers to opening questions are cached, and a follow-up such as
+    # "and for potatoes?" only looks like another question, so it needs an exact match
+    cached_response, match = chat_cache.lookup(message, language, similar=not _is_follow_up(context))
+    if cached_response:
+        print(f"⚡ Chat cache {match} hit (language: {language})")
+    return cached_response
+
+def _answer(message, language, context):
+    # Near-identical questions were already answered
+    cached_response = _cached_answer(message, language, context)
+    if cached_response:
+        return cached_response, True
+    
+    llm_configured = llm.configured()
     print(f"🧠 Processing message: '{message}' (detected language: {language})")
-    print(f"🔍 GEMINI_AVAILABLE: {GEMINI_AVAILABLE}")
+    print(f"🔍 LLM configured: {llm_configured}")
     print(f"🔍 is_agriculture_related: {is_agriculture_related(message)}")
     
-    # Try Gemini first for agriculture questions
-    if GEMINI_AVAILABLE and is_agriculture_related(message):
-        print("🌱 Trying Gemini for agriculture response...")
-        try:
-            gemini_response = get_gemini_response(message, language)
-            print(f"🔍 Gemini raw response: '{gemini_response}'")
-            print(f"🔍 Gemini response length: {len(gemini_response.strip()) if gemini_response else 0}")
-            
-            if gemini_response and len(gemini_response.strip()) > 10:  # Valid response
-                print(f"✅ Returning Gemini response: {gemini_response[:100]}...")
-                return gemini_response
-            else:
-                print("⚠️ Gemini response too short or empty, trying fallback...")
-        except Exception as e:
-            print(f"⚠️ Gemini failed: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+    # Try the LLM first for agriculture questions
+    if llm_configured and is_agriculture_related(message):
+        print("🌱 Trying LLM for agriculture response...")
+        gemini_response = get_gemini_response(message, language, context)
+        
+        if gemini_response and len(gemini_response.strip()) > 10:  # Valid response
+            print(f"✅ Returning LLM response: {gemini_response[:100]}...")
+            if not _is_follow_up(context):
+                chat_cache.store(message, language, gemini_response)
+            return gemini_response, False
+        else:
+            print("⚠️ LLM response too short or empty, trying fallback...")
     else:
-        if not GEMINI_AVAILABLE:
-            print("❌ Gemini not available")
+        if not llm_configured:
+            print("❌ LLM not configured")
         if not is_agriculture_related(message):
             print("❌ Message not agriculture-related")
     
-    # Final fallback to enhanced mock response
+    # Final fallback to enhanced mock response (never cached)
     print("📝 Using enhanced mock response...")
-    return get_enhanced_mock_response(message, language)
+    return get_enhanced_mock_response(message, language), False
+
+def stream_ai_reply(message, language=None, session_id=None):
+    """AI response as (chunks, from_cache), where chunks yields the text piece by piece.
+    
+    LLM answers stream as they are generated and are cached once complete;
+    cached and mock answers come as a single chunk. The reply, or as much
+    of it as was read, becomes part of the session's context.
+    """
+    if not language:
+        language = detect_language(message)
+    
+    context = chat_context.get(session_id)
+    chunks, from_cache = _stream_answer(message, language, context)
+    return _recorded(chunks, session_id, message), from_cache
+
+def _stream_answer(message, language, context):
+    cached_response = _cached_answer(message, language, context)
+    if cached_response:
+        return iter([cached_response]), True
+    
+    if llm.configured() and is_agriculture_related(message):
+        prompt = chat_context.build_prompt(context, build_gemini_prompt(message, language))
+        try:
+            print(f"🤖 Streaming prompt to {llm.backend.name} (language: {language}, ~{estimate_tokens(prompt)} tokens)")
+            chunks = llm.stream(prompt)
+            return _stream_llm(chunks, message, language, cache=not _is_follow_up(context)), False
+        except LLMUnavailable as e:
+            print(f"⚠️ LLM unavailable ({e.reason}), using fallback")
+    
+    print("📝 Using enhanced mock response...")
+    return iter([get_enhanced_mock_response(message, language)]), False
+
+def _recorded(chunks, session_id, message):
+    pieces = []
+    try:
+        for text in chunks:
+            pieces.append(text)
+            yield text
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        chat_context.record(session_id, message, ''.join(pieces).strip())
+
+def _stream_llm(chunks, message, language, cache=True):
+    pieces = []
+    try:
+        for text in chunks:
+            pieces.append(text)
+            yield text
+    except LLMUnavailable as e:
+        print(f"⚠️ LLM streaming failed ({e.reason})")
+        if pieces:
+            return
+    finally:
+        chunks.close()  # Stops the call if the client went away
+    
+    response = ''.join(pieces).strip()
+    if len(response) > 10:
+        if cache:
+            chat_cache.store(message, language, response)
+    elif not pieces:
+        yield get_enhanced_mock_response(message, language)
 
 def is_agriculture_related(query):
     """Check if query is agriculture related"""
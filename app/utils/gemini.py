@@ -0,0 +1,128 @@
+"""
+Gemini client for the AgriConnect chatbot
+
+Nothing touches the network, or even imports the SDK, when the app is
+created. The first call to gemini_client.model() does that: from a chat
+request, or from the warm-up thread create_app starts when GEMINI_WARMUP
+is on. Concurrent first callers wait for one initialization.
+
+Choosing a model means listing the models the API key can use, which is a
+network round-trip, so the choice is saved to GEMINI_MODEL_CACHE_FILE and
+reused by every worker for GEMINI_MODEL_CACHE_TTL_SECONDS. Setting
+GEMINI_MODEL skips the listing altogether. When initialization fails the
+chatbot falls back to mock responses, and it is retried after
+GEMINI_RETRY_SECONDS.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Tried in order; the first one the API key can use wins
+PREFERRED_MODELS = [
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro-preview-03-25",
+    "models/gemini-1.5-pro",
+    "models/gemini-1.5-flash"
+]
+
+def choose_model(models):
+    """Name of the first preferred model that can generate content, else of any that can"""
+    names = [model.name for model in models if 'generateContent' in model.supported_generation_methods]
+    for name in PREFERRED_MODELS:
+        if name in names:
+            return name
+    return names[0] if names else None
+
+class GeminiClient:
+    """Lazily built, shared GenerativeModel"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._failed_at = None
+        self._warm_up_thread = None
+        self.api_key = None
+        self.model_name = None
+        self.pinned_model = None
+        self.cache_file = None
+        self.cache_ttl = 86400
+        self.retry_seconds = 300
+
+    def init_app(self, app):
+        self.api_key = app.config['GEMINI_API_KEY']
+        self.pinned_model = app.config['GEMINI_MODEL']
+        self.cache_file = app.config['GEMINI_MODEL_CACHE_FILE']
+        self.cache_ttl = app.config['GEMINI_MODEL_CACHE_TTL_SECONDS']
+        self.retry_seconds = app.config['GEMINI_RETRY_SECONDS']
+        if self.api_key and app.config['GEMINI_WARMUP']:
+            self.warm_up()
+
+    def model(self):
+        """The shared GenerativeModel, built on first use; None when Gemini is unavailable"""
+        if self._model is not None or not self.api_key:
+            return self._model
+        with self._lock:
+            if self._model is None and not self._backing_off():
+                try:
+                    self._model = self._build()
+                    self._failed_at = None
+                except Exception as e:
+                    self._failed_at = time.monotonic()
+                    print(f"❌ Gemini initialization failed: {e}")
+        return self._model
+
+    def _backing_off(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_seconds
+
+    def _build(self):
+        print("🔧 Initializing Gemini API...")
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+        name = self.pinned_model or self._cached_choice()
+        if not name:
+            print("🔍 Checking available Gemini models...")
+            name = choose_model(genai.list_models())
+            if not name:
+                raise RuntimeError('No Gemini model supports generateContent')
+            self._save_choice(name)
+
+        model = genai.GenerativeModel(name)
+        self.model_name = name
+        print(f"✅ Using Gemini model: {name}")
+        return model
+
+    def _key_hash(self):
+        # Different keys may see different models; the key itself is not stored
+        return hashlib.sha256(self.api_key.encode()).hexdigest()[:16]
+
+    def _cached_choice(self):
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('key') != self._key_hash() or time.time() - cached.get('chosen_at', 0) > self.cache_ttl:
+            return None
+        return cached.get('model')
+
+    def _save_choice(self, name):
+        tmp_path = f'{self.cache_file}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'model': name, 'key': self._key_hash(), 'chosen_at': time.time()}, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"⚠️ Could not cache Gemini model choice: {e}")
+
+    def warm_up(self):
+        """Initialize in a background thread, so the first chat request finds the model ready"""
+        if self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(target=self.model, name='gemini-warm-up', daemon=True)
+            self._warm_up_thread.start()
+
+gemini_client = GeminiClient()
@@ -0,0 +1,238 @@
+"""
+Location resolution for AgriConnect weather
+
+Weather is fetched, cached and stored per grid cell rather than per typed
+location name, so "Tunis", "tunis " and a farm a few kilometres away share
+one observation stream. A cell is the WEATHER_GRID_DEGREES square holding a
+point, named 'cell:<size>:<row>:<col>'. Mapping a coordinate to its cell is
+plain arithmetic, so the grid is its own spatial index.
+
+Names are resolved to coordinates once and remembered in memory and in
+geocoded_locations: "lat,lon" strings directly, then coordinates already
+stored for the name (lands, IoT devices, earlier observations), then the
+OpenWeatherMap geocoding API. Requests only read what is remembered; a new
+name is resolved by a background thread with its own session, and keeps
+its own stream until then. A name that cannot be resolved keeps it for
+good, and is looked up again after GEOCODE_RETRY_HOURS.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from flask import current_app
+from sqlalchemy import desc, func, select
+from app import db
+from app.models.iot import IoTDevice
+from app.models.land import Land
+from app.models.weather import GeocodedLocation, WeatherData
+from app.utils.upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+CELL_PREFIX = 'cell:'
+
+_CELL = re.compile(r'^cell:(\d+(?:\.\d+)?):(-?\d+):(-?\d+)$')
+_COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+def location_key(location):
+    """Normalized spelling of a location, shared by every cache key"""
+    return ' '.join(location.lower().split())
+
+def cell_id(latitude, longitude, size=None):
+    """Name of the grid cell holding a point"""
+    size = size or current_app.config['WEATHER_GRID_DEGREES']
+    # Rounded first, so a point on a cell edge (36.8 / 0.1) is not put below it
+    row = math.floor(round(latitude / size, 9))
+    col = math.floor(round(longitude / size, 9))
+    return f'{CELL_PREFIX}{size:g}:{row}:{col}'
+
+def parse_cell(station):
+    """(size, row, col) of a cell name, or None for a plain location name"""
+    match = _CELL.match(station or '')
+    if not match:
+        return None
+    return float(match.group(1)), int(match.group(2)), int(match.group(3))
+
+def cell_center(station):
+    """(latitude, longitude) of the middle of a cell"""
+    size, row, col = parse_cell(station)
+    return round((row + 0.5) * size, 6), round((col + 0.5) * size, 6)
+
+def parse_coordinates(location):
+    """(latitude, longitude) from a "lat,lon" string, or None"""
+    match = _COORDINATES.match(location)
+    if not match:
+        return None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+def known_coordinates(key):
+    """Coordinates already stored under a location name, or None.
+
+    Lands and IoT devices are averaged per name; failing those, the newest
+    weather observation fetched for the name is used.
+    """
+    for model in (Land, IoTDevice):
+        latitude, longitude = db.session.execute(
+            select(func.avg(model.latitude), func.avg(model.longitude)).where(
+                func.lower(func.trim(model.location)) == key,
+                model.latitude.isnot(None),
+                model.longitude.isnot(None)
+            )
+        ).one()
+        if latitude is not None:
+            return latitude, longitude
+
+    row = db.session.execute(
+        select(WeatherData.latitude, WeatherData.longitude)
+        .where(func.lower(func.trim(WeatherData.location)) == key)
+        .order_by(desc(WeatherData.recorded_at))
+        .limit(1)
+    ).first()
+    return tuple(row) if row else None
+
+def geocode(location):
+    """Coordinates of a place name from the OpenWeatherMap geocoding API.
+
+    Returns None when the name is unknown or no API key is configured;
+    raises on API errors.
+    """
+    api_key = os.environ.get('WEATHER_API_KEY')
+    if not api_key:
+        return None
+
+    response = requests.get(
+        "http://api.openweathermap.org/geo/1.0/direct",
+        params={'q': location, 'limit': 1, 'appid': api_key},
+        timeout=10
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    return (data[0]['lat'], data[0]['lon']) if data else None
+
+class LocationResolver:
+    """Location names to weather stations, remembered per process and in the database"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._coordinates = OrderedDict()
+        self._pending = set()
+        self._executor = None
+
+    def station(self, location):
+        """The cell a location's weather is kept under, or the name itself if unresolved"""
+        location = (location or '').strip()
+        if not location or parse_cell(location):
+            return location
+        coordinates = parse_coordinates(location)
+        if coordinates is None:
+            coordinates = self.coordinates(location)
+        return cell_id(*coordinates) if coordinates else location
+
+    def coordinates(self, location):
+        """(latitude, longitude) of a location name, or None while it is unresolved.
+
+        Only reads memory and geocoded_locations; a name not resolved yet, or
+        due for another try, is queued for the background resolver.
+        """
+        key = location_key(location)
+        retry = timedelta(hours=current_app.config['GEOCODE_RETRY_HOURS'])
+        with self._lock:
+            entry = self._coordinates.get(key)
+            if entry is not None:
+                self._coordinates.move_to_end(key)
+
+        if entry is None:
+            stored = GeocodedLocation.query.filter_by(location_key=key).first()
+            if stored is not None:
+                coordinates = (stored.latitude, stored.longitude) if stored.latitude is not None else None
+                entry = (coordinates, stored.resolved_at)
+                self._remember(key, entry)
+
+        if entry is None or (entry[0] is None and datetime.utcnow() - entry[1] >= retry):
+            self._schedule(location, key)
+        return entry[0] if entry else None
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._coordinates[key] = entry
+            self._coordinates.move_to_end(key)
+            while len(self._coordinates) > self.max_entries:
+                self._coordinates.popitem(last=False)
+
+    def _schedule(self, location, key):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocode')
+        self._executor.submit(self._resolve_in_background, current_app._get_current_object(), location, key)
+
+    def _resolve_in_background(self, app, location, key):
+        # A fresh app context has its own session, so nothing here touches
+        # the state of the request that asked
+        with app.app_context():
+            try:
+                retry = timedelta(hours=app.config['GEOCODE_RETRY_HOURS'])
+                self._remember(key, self._resolve(location, key, retry))
+            except Exception:
+                db.session.rollback()
+                logger.exception('Resolving %s failed', location)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _resolve(self, location, key, retry):
+        stored = GeocodedLocation.query.filter_by(location_key=key).first()
+        if stored and (stored.latitude is not None or datetime.utcnow() - stored.resolved_at < retry):
+            if stored.latitude is None:
+                return None, stored.resolved_at
+            return (stored.latitude, stored.longitude), stored.resolved_at
+
+        coordinates, source = known_coordinates(key), 'local'
+        if coordinates is None:
+            try:
+                coordinates, source = geocode(location), 'geocoder'
+            except Exception:
+                # Not remembered, so the next request tries again
+                logger.exception('Geocoding failed for %s', location)
+                return None, datetime.utcnow() - retry
+
+        resolved_at = datetime.utcnow()
+        latitude, longitude = coordinates or (None, None)
+        upsert(
+            GeocodedLocation,
+            [{
+                'location_key': key,
+                'latitude': latitude,
+                'longitude': longitude,
+                'source': source if coordinates else None,
+                'resolved_at': resolved_at
+            }],
+            index_elements=['location_key'],
+            update_columns=['latitude', 'longitude', 'source', 'resolved_at']
+        )
+        db.session.commit()
+        return coordinates, resolved_at
+
+location_resolver = LocationResolver()
+
+def weather_station(location):
+    """Where a location's weather is fetched, cached and stored"""
+    return location_resolver.station(location)
+
+def station_at(latitude, longitude):
+    """Weather station of a point, such as a land's or a device's coordinates"""
+    return cell_id(latitude, longitude)
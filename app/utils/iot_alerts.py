@@ -0,0 +1,323 @@
+"""
+Ingest-time IoT alerting for AgriConnect
+
+Every ingested batch is checked against the devices' IoTAlertRule rows:
+
+    threshold_exceeded  value below min_value or above max_value
+    data_anomaly        |change| per second above max_rate, or |z-score|
+                        against the device's rolling window above
+                        zscore_threshold
+
+The recent values of each device with a rule are kept in a NumPy ring
+buffer (one row per device, IOT_ALERT_WINDOW_SIZE columns), and every check
+runs as array operations over the whole batch. Rules are cached in memory
+and reloaded after any IoTAlertRule change in this process, and at least
+every IOT_ALERT_RULES_RELOAD_SECONDS so changes made through other worker
+processes are picked up too. At most one alert per device
+and type is raised per batch, and none while an unresolved one is open.
+
+Rolling statistics are per process and start empty after a restart; a
+z-score is only computed once IOT_ALERT_MIN_SAMPLES values are buffered.
+A batch only enters the ring buffers once its ingest transaction commits,
+so a rolled back or retried batch is never buffered twice.
+"""
+
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models.iot import IoTDevice, IoTAlert, IoTAlertRule
+
+SENSOR_LABELS = {
+    'temperature': 'Temperature',
+    'humidity': 'Humidity',
+    'soil_moisture': 'Soil moisture'
+}
+
+def _label(sensor_type):
+    return SENSOR_LABELS.get(sensor_type, (sensor_type or 'Sensor').replace('_', ' ').capitalize())
+
+def _nan(value):
+    return np.nan if value is None else value
+
+class AlertEngine:
+    """Rule cache and per-device ring buffers, evaluated one batch at a time"""
+
+    def __init__(self, window_size=60, min_samples=10, reload_seconds=30):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._rules_loaded = False
+        self._loaded_at = 0.0
+        self._reset_rules([])
+
+    def init_app(self, app):
+        with self._lock:
+            self.window_size = app.config['IOT_ALERT_WINDOW_SIZE']
+            self.min_samples = app.config['IOT_ALERT_MIN_SAMPLES']
+            self.reload_seconds = app.config['IOT_ALERT_RULES_RELOAD_SECONDS']
+            self._rules_loaded = False
+
+    def invalidate_rules(self):
+        with self._lock:
+            self._rules_loaded = False
+
+    def _reset_rules(self, rules):
+        """Rebuild the rule arrays; buffered history of kept devices survives"""
+        old_slots = getattr(self, '_slots', {})
+        old_values = getattr(self, '_values', None)
+        old_state = (
+            getattr(self, '_head', None), getattr(self, '_fill', None),
+            getattr(self, '_last_value', None), getattr(self, '_last_time', None)
+        )
+
+        count = len(rules)
+        self._slots = {rule['device_id']: slot for slot, rule in enumerate(rules)}
+        self._device_ids = np.array([rule['device_id'] for rule in rules], dtype=np.int64)
+        self._sensor_types = [rule['sensor_type'] for rule in rules]
+        self._severities = [rule['severity'] or 'medium' for rule in rules]
+        self._min = np.array([_nan(rule['min_value']) for rule in rules], dtype=np.float64)
+        self._max = np.array([_nan(rule['max_value']) for rule in rules], dtype=np.float64)
+        self._max_rate = np.array([_nan(rule['max_rate']) for rule in rules], dtype=np.float64)
+        self._zscore = np.array([_nan(rule['zscore_threshold']) for rule in rules], dtype=np.float64)
+
+        self._values = np.full((count, self.window_size), np.nan)
+        self._head = np.zeros(count, dtype=np.int64)
+        self._fill = np.zeros(count, dtype=np.int64)
+        self._last_value = np.full(count, np.nan)
+        self._last_time = np.full(count, np.nan)
+
+        if old_values is not None and old_values.shape[1] == self.window_size:
+            for device_id, slot in self._slots.items():
+                old_slot = old_slots.get(device_id)
+                if old_slot is None:
+                    continue
+                self._values[slot] = old_values[old_slot]
+                self._head[slot] = old_state[0][old_slot]
+                self._fill[slot] = old_state[1][old_slot]
+                self._last_value[slot] = old_state[2][old_slot]
+                self._last_time[slot] = old_state[3][old_slot]
+
+    def _load_rules(self):
+        rows = db.session.execute(
+            select(
+                IoTAlertRule.device_id, IoTAlertRule.min_value, IoTAlertRule.max_value,
+                IoTAlertRule.max_rate, IoTAlertRule.zscore_threshold, IoTAlertRule.severity,
+                IoTDevice.sensor_type
+            ).join(IoTDevice, IoTDevice.id == IoTAlertRule.device_id)
+            .where(IoTAlertRule.is_active.is_(True))
+            .order_by(IoTAlertRule.device_id)
+        ).mappings().all()
+        self._reset_rules(rows)
+        self._rules_loaded = True
+        self._loaded_at = time.monotonic()
+
+    def evaluate(self, rows):
+        """Check IoTData row dicts against the rules; returns candidate alert dicts.
+
+        The ring buffers are left untouched; push() the rows once they are
+        stored for good.
+        """
+        with self._lock:
+            if not self._rules_loaded or time.monotonic() - self._loaded_at >= self.reload_seconds:
+                self._load_rules()
+            batch = self._sorted(rows)
+            if batch is None:
+                return []
+            return self._check(*batch)
+
+    def push(self, rows):
+        """Append committed IoTData row dicts to the ring buffers of devices with a rule"""
+        with self._lock:
+            batch = self._sorted(rows)
+            if batch is None:
+                return
+            slots, values, times, _ = batch
+            fresh_slots, fresh_values, fresh_times, first = self._fresh(slots, values, times)
+            self._push(fresh_slots, fresh_values, fresh_times, first)
+
+    def _sorted(self, rows):
+        """(slots, values, times, units) of the rows with a rule, or None if there are none"""
+        slot_of = self._slots
+        picked = [row for row in rows if row['device_id'] in slot_of]
+        if not picked:
+            return None
+
+        slots = np.fromiter((slot_of[row['device_id']] for row in picked), dtype=np.int64, count=len(picked))
+        values = np.fromiter((row['value'] for row in picked), dtype=np.float64, count=len(picked))
+        times = np.array([row['timestamp'] for row in picked], dtype='datetime64[us]').astype(np.int64) / 1e6
+
+        # Group each device's readings together, oldest first
+        order = np.lexsort((times, slots))
+        units = [picked[i]['unit'] for i in order]
+        return slots[order], values[order], times[order], units
+
+    def _fresh(self, slots, values, times):
+        """Readings no older than the last one buffered, and which of them start a device"""
+        fresh = ~(times < self._last_time[slots])
+        fresh_slots = slots[fresh]
+        first = np.ones(len(fresh_slots), dtype=bool)
+        first[1:] = fresh_slots[1:] != fresh_slots[:-1]
+        return fresh_slots, values[fresh], times[fresh], first
+
+    def _check(self, slots, values, times, units):
+        # Thresholds (NaN bounds never compare true)
+        below = values < self._min[slots]
+        above = values > self._max[slots]
+
+        # Readings older than the last one buffered arrived late: they are
+        # checked against thresholds and the window, but have no rate and
+        # never enter the ring buffer
+        fresh = ~(times < self._last_time[slots])
+        fresh_slots, fresh_values, fresh_times, first = self._fresh(slots, values, times)
+
+        # Rate of change against the previous reading of the same device,
+        # which is either earlier in this batch or the last one buffered
+        previous_value = np.empty_like(fresh_values)
+        previous_time = np.empty_like(fresh_times)
+        previous_value[1:], previous_time[1:] = fresh_values[:-1], fresh_times[:-1]
+        previous_value[first] = self._last_value[fresh_slots[first]]
+        previous_time[first] = self._last_time[fresh_slots[first]]
+        elapsed = fresh_times - previous_time
+        rate = np.full(len(slots), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate[fresh] = np.abs(fresh_values - previous_value) / elapsed
+        too_fast = np.zeros(len(slots), dtype=bool)
+        too_fast[fresh] = (elapsed > 0) & (rate[fresh] > self._max_rate[fresh_slots])
+
+        # Rolling z-score against each device's window before this batch
+        window = self._values[slots]
+        enough = self._fill[slots] >= self.min_samples
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.nanmean(np.where(enough[:, None], window, 0.0), axis=1)
+            std = np.nanstd(np.where(enough[:, None], window, 0.0), axis=1)
+            zscore = (values - mean) / std
+        anomalous = enough & (std > 0) & (np.abs(zscore) > self._zscore[slots])
+
+        candidates = []
+        for index in np.flatnonzero(below | above | too_fast | anomalous):
+            slot = slots[index]
+            device_id = int(self._device_ids[slot])
+            label = _label(self._sensor_types[slot])
+            value, unit = float(values[index]), units[index]
+            alert = {
+                'device_id': device_id,
+                'severity': self._severities[slot],
+                'actual_value': value,
+                'unit': unit
+            }
+            if above[index] or below[index]:
+                bound = float(self._max[slot] if above[index] else self._min[slot])
+                direction = 'above maximum' if above[index] else 'below minimum'
+                candidates.append(dict(
+                    alert,
+                    alert_type='threshold_exceeded',
+                    title=f"{label} {direction.split()[0]} threshold",
+                    message=f"{label} reading {value:g} {unit} is {direction} of {bound:g} {unit}.",
+                    threshold_value=bound
+                ))
+            elif too_fast[index]:
+                limit = float(self._max_rate[slot])
+                candidates.append(dict(
+                    alert,
+                    alert_type='data_anomaly',
+                    title=f"{label} changing too fast",
+                    message=f"{label} changed by {rate[index]:.3g} {unit}/s, more than the {limit:g} {unit}/s limit.",
+                    threshold_value=limit
+                ))
+            else:
+                limit = float(self._zscore[slot])
+                candidates.append(dict(
+                    alert,
+                    alert_type='data_anomaly',
+                    title=f"{label} reading out of pattern",
+                    message=(
+                        f"{label} reading {value:g} {unit} is {abs(zscore[index]):.1f} standard deviations "
+                        f"from the recent mean of {mean[index]:.3g} {unit}."
+                    ),
+                    threshold_value=limit
+                ))
+        return candidates
+
+    def _push(self, slots, values, times, first):
+        """Append a sorted batch to the ring buffers"""
+        if not len(slots):
+            return
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(slots)))
+        rank = np.arange(len(slots)) - np.repeat(starts, counts)
+        columns = (self._head[slots] + rank) % self.window_size
+
+        # A device sending more than a window per batch only keeps the newest
+        keep = rank >= np.repeat(counts, counts) - self.window_size
+        self._values[slots[keep], columns[keep]] = values[keep]
+
+        batch_slots = slots[starts]
+        self._head[batch_slots] = (self._head[batch_slots] + counts) % self.window_size
+        self._fill[batch_slots] = np.minimum(self._fill[batch_slots] + counts, self.window_size)
+        last = np.append(starts[1:], len(slots)) - 1
+        self._last_value[batch_slots] = values[last]
+        self._last_time[batch_slots] = times[last]
+
+alert_engine = AlertEngine()
+
+def raise_alerts(rows):
+    """Evaluate freshly inserted IoTData row dicts and insert new alerts.
+
+    Costs no queries unless a rule fires or the rules are due for a reload;
+    then one SELECT finds the alerts
+    already open and one bulk INSERT writes the rest. Returns the number of
+    alerts created.
+    """
+    if not current_app.config['IOT_ALERTS_ENABLED']:
+        return 0
+
+    push_after_commit(db.session, rows)
+    candidates = {}
+    for alert in alert_engine.evaluate(rows):
+        # The latest reading of a batch describes the alert best
+        candidates[(alert['device_id'], alert['alert_type'])] = alert
+    if not candidates:
+        return 0
+
+    open_alerts = set(db.session.execute(
+        select(IoTAlert.device_id, IoTAlert.alert_type).where(
+            IoTAlert.device_id.in_({device_id for device_id, _ in candidates}),
+            IoTAlert.is_resolved.is_(False)
+        ).distinct()
+    ).all())
+
+    now = datetime.utcnow()
+    new_alerts = [
+        dict(alert, is_resolved=False, created_at=now)
+        for key, alert in candidates.items() if key not in open_alerts
+    ]
+    if new_alerts:
+        db.session.execute(insert(IoTAlert), new_alerts)
+    return len(new_alerts)
+
+def push_after_commit(session, rows):
+    """Buffer rows evaluated in this transaction once it commits"""
+    session.info.setdefault('iot_alerts_pending', []).extend(rows)
+
+@event.listens_for(Session, 'after_commit')
+def _push_pending(session):
+    rows = session.info.pop('iot_alerts_pending', None)
+    if rows:
+        alert_engine.push(rows)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('iot_alerts_pending', None)
+
+def _rules_changed(mapper, connection, target):
+    alert_engine.invalidate_rules()
+
+event.listen(IoTAlertRule, 'after_insert', _rules_changed)
+event.listen(IoTAlertRule, 'after_update', _rules_changed)
+event.listen(IoTAlertRule, 'after_delete', _rules_changed)
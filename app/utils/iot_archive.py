@@ -0,0 +1,263 @@
+"""
+Columnar IoT history archive for AgriConnect
+
+Closed one-day windows of IoTData are compacted, per device, into two flat
+little-endian files that numpy.memmap can open directly:
+
+    <IOT_ARCHIVE_DIR>/<device_id>/<YYYYMMDD>.ts   int64 epoch milliseconds
+    <IOT_ARCHIVE_DIR>/<device_id>/<YYYYMMDD>.val  float32 values
+
+Reads slice the mapped files without copying and only go to SQL for the
+hot tail that has not been compacted yet.
+
+Readings that arrive late, for a day that has already closed, leave an
+empty <YYYYMMDD>.stale marker next to the window once committed. Reads of a
+stale window merge the archived columns with its rows in SQL, and the next
+compaction rewrites just that window the same way.
+"""
+
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from app import db
+from app.models.iot import IoTData
+
+EPOCH = datetime(1970, 1, 1)
+WINDOW = timedelta(days=1)
+TS_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f4')
+
+def archive_dir():
+    return current_app.config['IOT_ARCHIVE_DIR']
+
+def _device_dir(device_id):
+    return os.path.join(archive_dir(), str(device_id))
+
+def _window_paths(device_id, day):
+    stem = os.path.join(_device_dir(device_id), day.strftime('%Y%m%d'))
+    return stem + '.ts', stem + '.val'
+
+def _stale_path(device_id, day):
+    return os.path.join(_device_dir(device_id), day.strftime('%Y%m%d') + '.stale')
+
+def _day_of(timestamp):
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+def to_epoch_ms(timestamp):
+    return int((timestamp - EPOCH) / timedelta(milliseconds=1))
+
+def from_epoch_ms(milliseconds):
+    return EPOCH + timedelta(milliseconds=int(milliseconds))
+
+def archived_days(device_id):
+    """Sorted start datetimes of every compacted window for a device"""
+    directory = _device_dir(device_id)
+    if not os.path.isdir(directory):
+        return []
+    # The .ts file is written last, so it marks a complete window
+    return sorted(
+        datetime.strptime(name[:-3], '%Y%m%d')
+        for name in os.listdir(directory) if name.endswith('.ts')
+    )
+
+def stale_days(device_id):
+    """Sorted start datetimes of windows that received readings after closing"""
+    directory = _device_dir(device_id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        datetime.strptime(name[:-6], '%Y%m%d')
+        for name in os.listdir(directory) if name.endswith('.stale')
+    )
+
+def archive_watermark(device_id):
+    """End of the newest compacted window, or None if nothing is archived"""
+    days = archived_days(device_id)
+    return days[-1] + WINDOW if days else None
+
+def _write_atomic(path, array):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+def write_window(device_id, day, timestamps_ms, values):
+    """Write one window's columns; values first so a present .ts means complete"""
+    os.makedirs(_device_dir(device_id), exist_ok=True)
+    ts_path, val_path = _window_paths(device_id, day)
+    _write_atomic(val_path, np.asarray(values, dtype=VALUE_DTYPE))
+    _write_atomic(ts_path, np.asarray(timestamps_ms, dtype=TS_DTYPE))
+
+def _window_rows(device_id, day):
+    """One window's readings from SQL as (timestamps_ms, values) arrays"""
+    rows = db.session.execute(
+        select(IoTData.timestamp, IoTData.value).where(
+            IoTData.device_id == device_id,
+            IoTData.timestamp >= day,
+            IoTData.timestamp < day + WINDOW
+        ).order_by(IoTData.timestamp)
+    ).all()
+    return (
+        np.fromiter((to_epoch_ms(timestamp) for timestamp, _ in rows), dtype=TS_DTYPE, count=len(rows)),
+        np.fromiter((value for _, value in rows), dtype=VALUE_DTYPE, count=len(rows))
+    )
+
+def _merged_window(device_id, day):
+    """A stale window: its archived columns plus its rows still in SQL.
+
+    Readings present in both (same millisecond and value) are kept once.
+    """
+    timestamps, values = _window_rows(device_id, day)
+    if os.path.exists(_window_paths(device_id, day)[0]):
+        archived_timestamps, archived_values = _open_window(device_id, day)
+        timestamps = np.concatenate([archived_timestamps, timestamps])
+        values = np.concatenate([archived_values, values])
+
+    order = np.lexsort((values, timestamps))
+    timestamps, values = timestamps[order], values[order]
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[1:] = (timestamps[1:] != timestamps[:-1]) | (values[1:] != values[:-1])
+    return timestamps[keep], values[keep]
+
+def recompact_stale(device_id, closed_before):
+    """Rewrite a device's stale windows that end at or before `closed_before`.
+
+    Returns the number of readings in the rewritten windows.
+    """
+    written = 0
+    for day in stale_days(device_id):
+        if day + WINDOW > closed_before:
+            continue
+        # Clear the marker first, so readings committed meanwhile mark it again
+        os.remove(_stale_path(device_id, day))
+        timestamps, values = _merged_window(device_id, day)
+        write_window(device_id, day, timestamps, values)
+        written += len(timestamps)
+    return written
+
+def mark_late_after_commit(session, rows, now):
+    """Mark the closed windows that IoTData row dicts fall into as stale on commit"""
+    if not current_app.config['IOT_ARCHIVE_ENABLED']:
+        return
+    today = _day_of(now)
+    paths = {
+        _stale_path(row['device_id'], _day_of(row['timestamp']))
+        for row in rows if row['timestamp'] < today
+    }
+    if paths:
+        session.info.setdefault('iot_stale_windows', set()).update(paths)
+
+@event.listens_for(Session, 'after_commit')
+def _mark_stale(session):
+    for path in session.info.pop('iot_stale_windows', ()):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'a').close()
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_stale(session, previous_transaction):
+    session.info.pop('iot_stale_windows', None)
+
+def compact_device(device_id, closed_before):
+    """Archive every window of a device that ends at or before `closed_before`.
+
+    Stale windows are rewritten too. Returns the number of readings written.
+    """
+    day = archive_watermark(device_id) or EPOCH
+
+    written = 0
+    while True:
+        # Jump straight to the next window that actually holds readings
+        next_timestamp = db.session.execute(
+            select(func.min(IoTData.timestamp)).where(
+                IoTData.device_id == device_id,
+                IoTData.timestamp >= day
+            )
+        ).scalar()
+        if next_timestamp is None:
+            break
+        day = _day_of(next_timestamp)
+        if day + WINDOW > closed_before:
+            break
+
+        timestamps, values = _window_rows(device_id, day)
+        write_window(device_id, day, timestamps, values)
+        written += len(timestamps)
+        day += WINDOW
+
+    return written + recompact_stale(device_id, closed_before)
+
+def compact_archive(now=None):
+    """Compact closed windows for every device; returns {device_id: readings written}"""
+    now = now or datetime.utcnow()
+    closed_before = now - timedelta(hours=current_app.config['IOT_ARCHIVE_DELAY_HOURS'])
+
+    device_ids = db.session.execute(select(IoTData.device_id).distinct()).scalars().all()
+    written = {}
+    for device_id in device_ids:
+        count = compact_device(device_id, closed_before)
+        if count:
+            written[device_id] = count
+    return written
+
+def _open_window(device_id, day):
+    ts_path, val_path = _window_paths(device_id, day)
+    timestamps = np.memmap(ts_path, dtype=TS_DTYPE, mode='r')
+    values = np.memmap(val_path, dtype=VALUE_DTYPE, mode='r')
+    return timestamps, values
+
+def iter_history(device_id, start, end):
+    """Yield (timestamps_ms, values) array pairs covering [start, end) in order.
+
+    Archived windows are yielded as slices of the memory-mapped files, so no
+    data is copied. Stale windows are merged with SQL, and the
+    not-yet-compacted tail comes from a single SQL query.
+    """
+    start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+    watermark = archive_watermark(device_id)
+    stale = {day for day in stale_days(device_id) if watermark and day < watermark}
+
+    for day in sorted(set(archived_days(device_id)) | stale):
+        if day + WINDOW <= start or day >= end:
+            continue
+        if day in stale:
+            timestamps, values = _merged_window(device_id, day)
+        else:
+            timestamps, values = _open_window(device_id, day)
+        lo = np.searchsorted(timestamps, start_ms, side='left')
+        hi = np.searchsorted(timestamps, end_ms, side='left')
+        if hi > lo:
+            yield timestamps[lo:hi], values[lo:hi]
+
+    tail_start = max(start, watermark or start)
+    if tail_start < end:
+        rows = db.session.execute(
+            select(IoTData.timestamp, IoTData.value).where(
+                IoTData.device_id == device_id,
+                IoTData.timestamp >= tail_start,
+                IoTData.timestamp < end
+            ).order_by(IoTData.timestamp)
+        ).all()
+        if rows:
+            yield (
+                np.fromiter((to_epoch_ms(timestamp) for timestamp, _ in rows), dtype=TS_DTYPE, count=len(rows)),
+                np.fromiter((value for _, value in rows), dtype=VALUE_DTYPE, count=len(rows))
+            )
+
+def read_history(device_id, start, end):
+    """Timestamps (epoch ms) and values for [start, end) as two flat arrays.
+
+    A range served by a single window is returned as a zero-copy view;
+    ranges spanning several windows are concatenated.
+    """
+    segments = list(iter_history(device_id, start, end))
+    if not segments:
+        return np.empty(0, dtype=TS_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+    if len(segments) == 1:
+        return segments[0]
+    return (
+        np.concatenate([timestamps for timestamps, _ in segments]),
+        np.concatenate([values for _, values in segments])
+    )
@@ -0,0 +1,119 @@
+"""
+IoT command queue for AgriConnect
+
+Commands are created 'pending' and delivered to actuators through a
+long-poll: the device asks for its commands, and if none are pending the
+request blocks on an in-process condition until one is created or the poll
+times out. Delivery moves commands to 'sent' in one UPDATE ... RETURNING,
+so each command is handed out once, and the device then acknowledges it
+as 'executed' or 'failed'.
+
+Once the database has shown a device has nothing pending, its polls wait
+on the hub without querying. That knowledge is only trusted for
+IOT_COMMAND_RECHECK_SECONDS, so commands created by another worker process
+are still picked up.
+"""
+
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app import db
+from app.models.iot import IoTCommand
+
+class CommandHub:
+    """Per-device change counters that long-polling requests wait on"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = {}
+        self._idle_since = {}
+        self.waiting = 0
+
+    def version(self, device_id):
+        with self._condition:
+            return self._versions.get(device_id, 0)
+
+    def notify(self, device_ids):
+        """Wake every poll waiting on these devices"""
+        with self._condition:
+            for device_id in device_ids:
+                self._versions[device_id] = self._versions.get(device_id, 0) + 1
+                self._idle_since.pop(device_id, None)
+            self._condition.notify_all()
+
+    def mark_idle(self, device_id, version):
+        """Remember that nothing was pending as of `version`"""
+        with self._condition:
+            if self._versions.get(device_id, 0) == version:
+                self._idle_since[device_id] = time.monotonic()
+
+    def is_idle(self, device_id, recheck_seconds):
+        with self._condition:
+            since = self._idle_since.get(device_id)
+            return since is not None and time.monotonic() - since < recheck_seconds
+
+    def wait(self, device_id, version, timeout):
+        """Block until the device's version moves past `version`; False on timeout"""
+        with self._condition:
+            self.waiting += 1
+            try:
+                return self._condition.wait_for(
+                    lambda: self._versions.get(device_id, 0) != version, timeout
+                )
+            finally:
+                self.waiting -= 1
+
+command_hub = CommandHub()
+
+def claim_pending_commands(device_id):
+    """Mark a device's pending commands sent and return them, oldest first"""
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        update(IoTCommand).where(
+            IoTCommand.device_id == device_id,
+            IoTCommand.status == 'pending'
+        ).values(status='sent', sent_at=now).returning(
+            IoTCommand.id, IoTCommand.command, IoTCommand.parameters, IoTCommand.created_at
+        )
+    ).all()
+    db.session.commit()
+    return sorted(rows, key=lambda row: (row.created_at, row.id))
+
+def poll_commands(device_id, timeout, recheck_seconds):
+    """Long-poll for a device's undelivered commands.
+
+    Returns the claimed command rows, or an empty list once `timeout`
+    seconds pass without any.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        version = command_hub.version(device_id)
+        if not command_hub.is_idle(device_id, recheck_seconds):
+            commands = claim_pending_commands(device_id)
+            if commands:
+                return commands
+            command_hub.mark_idle(device_id, version)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return []
+        # Wake up in time to recheck the database if we are still waiting then
+        if not command_hub.wait(device_id, version, min(remaining, recheck_seconds)):
+            if time.monotonic() >= deadline:
+                return []
+
+def notify_after_commit(session, device_id):
+    """Wake the device's long-polls once the new command is committed"""
+    session.info.setdefault('iot_command_devices', set()).add(device_id)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_pending(session):
+    device_ids = session.info.pop('iot_command_devices', None)
+    if device_ids:
+        command_hub.notify(device_ids)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('iot_command_devices', None)
@@ -0,0 +1,108 @@
+"""
+Binary sensor frames for AgriConnect
+
+A compact alternative to JSON for constrained gateways, posted to
+/iot/api/data (one frame) or /iot/api/data/batch (frames back to back)
+with Content-Type application/vnd.agriconnect.frame. All fields are
+little-endian:
+
+    offset  size  field
+    0       1     version (1)
+    1       6     gateway MAC address, raw bytes
+    7       4     timestamp, uint32 seconds since the Unix epoch (0 = now)
+    11      1     reading count N
+    12      5*N   N x (uint8 sensor code, float32 value)
+
+Sensor codes: 1 temperature, 2 humidity, 3 soil moisture. A frame with
+three readings is 27 bytes. Frames are decoded straight into
+(mac_address, sensor_type, value, timestamp) readings.
+"""
+
+import math
+import struct
+from datetime import datetime, timedelta
+
+FRAME_CONTENT_TYPE = 'application/vnd.agriconnect.frame'
+FRAME_VERSION = 1
+
+HEADER = struct.Struct('<B6sIB')
+READING = struct.Struct('<Bf')
+
+# Largest possible frame: a header and 255 readings
+FRAME_MAX_SIZE = HEADER.size + 255 * READING.size
+
+SENSOR_CODES = {
+    1: 'temperature',
+    2: 'humidity',
+    3: 'soil_moisture'
+}
+SENSOR_CODE_BY_TYPE = {sensor_type: code for code, sensor_type in SENSOR_CODES.items()}
+
+EPOCH = datetime(1970, 1, 1)
+
+# Device clocks may run a little fast; anything further ahead is rejected
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+def _format_mac(raw):
+    return ':'.join(f'{byte:02X}' for byte in raw)
+
+def encode_frame(mac_address, readings, timestamp=None):
+    """Pack {sensor_type: value} readings from one gateway into a frame"""
+    mac = bytes.fromhex(mac_address.replace(':', '').replace('-', ''))
+    if len(mac) != 6:
+        raise ValueError(f'Invalid MAC address: {mac_address!r}')
+    seconds = int((timestamp - EPOCH).total_seconds()) if timestamp else 0
+    frame = bytearray(HEADER.pack(FRAME_VERSION, mac, seconds, len(readings)))
+    for sensor_type, value in readings.items():
+        frame += READING.pack(SENSOR_CODE_BY_TYPE[sensor_type], value)
+    return bytes(frame)
+
+def is_single_frame(body):
+    """Whether `body` is exactly one frame, judged from its header"""
+    if len(body) < HEADER.size:
+        return False
+    return len(body) == HEADER.size + body[HEADER.size - 1] * READING.size
+
+def decode_frames(body, now=None):
+    """Decode back-to-back frames; yields (readings, error) per frame, in order.
+
+    A frame with a bad sensor code or timestamp is reported and skipped. A
+    truncated frame or unknown version ends decoding, since the start of
+    the next frame can no longer be found.
+    """
+    now = now or datetime.utcnow()
+    view = memoryview(body)
+    offset = 0
+    while offset < len(view):
+        if len(view) - offset < HEADER.size:
+            yield None, 'Truncated frame header'
+            return
+        version, mac, seconds, count = HEADER.unpack_from(view, offset)
+        if version != FRAME_VERSION:
+            yield None, f'Unsupported frame version {version}'
+            return
+        start = offset + HEADER.size
+        offset = start + count * READING.size
+        if offset > len(view):
+            yield None, 'Truncated frame readings'
+            return
+
+        # No timestamp: stamped with the time of ingestion when stored
+        timestamp = EPOCH + timedelta(seconds=seconds) if seconds else None
+        if timestamp and timestamp > now + MAX_CLOCK_SKEW:
+            yield None, 'Timestamp is in the future'
+            continue
+
+        mac_address = _format_mac(mac)
+        try:
+            readings = [
+                (mac_address, SENSOR_CODES[code], value, timestamp)
+                for code, value in READING.iter_unpack(view[start:offset])
+            ]
+        except KeyError as e:
+            yield None, f'Unknown sensor code {e.args[0]}'
+            continue
+        if not all(math.isfinite(value) for _, _, value, _ in readings):
+            yield None, 'Reading value is not a finite number'
+            continue
+        yield readings, None
@@ -0,0 +1,319 @@
+"""
+IoT ingestion utilities for AgriConnect
+
+Turns gateway payloads into IoTData rows using a fixed number of queries
+per call, no matter how many gateways or sensors the call carries.
+"""
+
+import math
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.iot import IoTDevice, IoTData, IoTLatestReading
+from app.utils.iot_alerts import raise_alerts
+from app.utils.iot_archive import mark_late_after_commit
+from app.utils.iot_frames import EPOCH, MAX_CLOCK_SKEW, decode_frames
+from app.utils.iot_liveness import liveness
+from app.utils.iot_live import publish_after_commit, reading_event
+from app.utils.iot_registry import device_registry, entry_for, remember_after_commit
+from app.utils.iot_rollups import update_rollups
+from app.utils.upsert import insert_new, upsert
+
+# Payload keys accepted from gateways, mapped to the device sensor type
+SENSOR_FIELDS = {
+    'temp': 'temperature',
+    'temperature': 'temperature',
+    'humidity': 'humidity',
+    'soil': 'soil_moisture',
+    'soil_moisture': 'soil_moisture'
+}
+
+# Display name prefix and unit used for auto-registered sensor devices
+SENSOR_META = {
+    'temperature': ('Temperature Sensor', '°C'),
+    'humidity': ('Humidity Sensor', '%'),
+    'soil_moisture': ('Soil Sensor', 'units')
+}
+
+# Epoch timestamps above this are taken to be in milliseconds (year 5138 in seconds)
+EPOCH_MS_THRESHOLD = 1e11
+
+# Columns of the IoTData rows handed on after insert
+INSERTED_COLUMNS = (IoTData.device_id, IoTData.value, IoTData.unit, IoTData.timestamp, IoTData.quality_score)
+
+def parse_timestamp(value, now=None, max_skew=MAX_CLOCK_SKEW):
+    """Read a device timestamp as a naive UTC datetime.
+
+    Accepts epoch seconds (or milliseconds) and ISO-8601 strings; strings
+    without an offset are taken to be UTC. Timestamps further ahead of the
+    server clock than `max_skew` are rejected, unless it is None.
+    """
+    now = now or datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value) or value <= 0:
+            raise ValueError(f'Invalid timestamp: {value!r}')
+        seconds = value / 1000 if value > EPOCH_MS_THRESHOLD else value
+        try:
+            timestamp = EPOCH + timedelta(seconds=seconds)
+        except OverflowError:
+            raise ValueError(f'Invalid timestamp: {value!r}')
+    elif isinstance(value, str):
+        try:
+            timestamp = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'Invalid timestamp: {value!r}')
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        raise ValueError(f'Invalid timestamp: {value!r}')
+
+    if max_skew is not None and timestamp > now + max_skew:
+        raise ValueError('Timestamp is in the future')
+    return timestamp
+
+def flatten_payload(payload):
+    """Turn one gateway payload into (mac_address, sensor_type, value, timestamp) readings.
+
+    The optional 'timestamp' key is when the gateway took the readings;
+    without it the timestamp is None (the time of ingestion).
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Reading must be a JSON object')
+
+    device_mac = payload.get('mac_address', 'unknown')
+    timestamp = payload.get('timestamp')
+    if timestamp is not None:
+        timestamp = parse_timestamp(timestamp)
+
+    readings = []
+    for key, value in payload.items():
+        sensor_type = SENSOR_FIELDS.get(key)
+        if not sensor_type:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = math.nan
+        # NaN and infinities would poison rollups and alert statistics, as in binary frames
+        if not math.isfinite(number):
+            raise ValueError(f'Invalid value for {key}: {value!r}')
+        readings.append((device_mac, sensor_type, number, timestamp))
+
+    return readings
+
+def resolve_devices(keys, owner_id):
+    """Map (mac_address, sensor_type) keys to DeviceEntry objects, creating missing devices.
+
+    Keys found in the device registry cost nothing. The rest are resolved with
+    one SELECT for every device sharing their MACs, and one flush registers all
+    devices that still do not exist. The per-MAC base device (sensor_type NULL)
+    is registered alongside its sensors, as receive_data always did.
+    """
+    known = {}
+    for mac, sensor_type in keys:
+        entry = device_registry.get(mac, sensor_type)
+        if entry:
+            known[(mac, sensor_type)] = entry
+
+    missing_macs = {mac for mac, sensor_type in keys if (mac, sensor_type) not in known}
+    if not missing_macs:
+        return known
+
+    for device in IoTDevice.query.filter(IoTDevice.mac_address.in_(missing_macs)).all():
+        entry = entry_for(device)
+        known[(device.mac_address, device.sensor_type)] = entry
+        device_registry.put(entry)
+
+    now = datetime.utcnow()
+    created = []
+    for mac in sorted(missing_macs):
+        if (mac, None) in known:
+            continue
+        # Auto-register device (you may want to change this for security)
+        base = IoTDevice(
+            name=f"Auto Device {mac[-6:]}",
+            device_type='sensor',
+            location='Auto-detected',
+            mac_address=mac,
+            owner_id=owner_id,
+            is_online=True,
+            last_seen=now
+        )
+        known[(mac, None)] = base
+        created.append(base)
+
+    for mac, sensor_type in sorted(keys, key=lambda key: (key[0], key[1] or '')):
+        if (mac, sensor_type) in known:
+            continue
+        base = known[(mac, None)]
+        name_prefix, _ = SENSOR_META[sensor_type]
+        device = IoTDevice(
+            name=f"{name_prefix} {mac[-6:]}",
+            device_type='sensor',
+            sensor_type=sensor_type,
+            location=base.location,
+            mac_address=mac,
+            owner_id=base.owner_id,
+            is_online=True,
+            last_seen=now
+        )
+        known[(mac, sensor_type)] = device
+        created.append(device)
+
+    if created:
+        db.session.add_all(created)
+        db.session.flush()
+        remember_after_commit(db.session, [entry_for(device) for device in created])
+
+    return {key: entry_for(device) for key, device in known.items()}
+
+def store_readings(readings, owner_id):
+    """Bulk-insert (mac_address, sensor_type, value, timestamp) readings without committing.
+
+    Readings without a timestamp are stamped with the current time. A device
+    keeps one reading per timestamp: a reading replayed within the batch, or
+    one already stored, is skipped, and only newly inserted rows reach the
+    latest readings, rollups, alerts and live feed. Late readings correct
+    each of those incrementally. Returns the positions in `readings` of the
+    readings that were written as new IoTData rows.
+    """
+    if not readings:
+        return []
+
+    # Each gateway's base device is resolved too, so it is marked as seen
+    keys = {(mac, sensor_type) for mac, sensor_type, _, _ in readings}
+    devices = resolve_devices(keys | {(mac, None) for mac, _ in keys}, owner_id)
+    now = datetime.utcnow()
+
+    rows = {}
+    positions = {}
+    arrivals = {}
+    for position, (mac, sensor_type, value, timestamp) in enumerate(readings):
+        device_id = devices[(mac, sensor_type)].id
+        if timestamp is None:
+            # Space out a device's readings stamped on arrival, so they stay distinct
+            offset = arrivals[device_id] = arrivals.get(device_id, -1) + 1
+            timestamp = now + timedelta(microseconds=offset)
+        # The first of several readings for one instant wins, as against stored rows
+        positions.setdefault((device_id, timestamp), position)
+        rows.setdefault((device_id, timestamp), {
+            'device_id': device_id,
+            'value': value,
+            'unit': SENSOR_META[sensor_type][1],
+            'timestamp': timestamp,
+            'quality_score': 1.0
+        })
+
+    inserted = insert_new(IoTData, list(rows.values()), ['device_id', 'timestamp'], INSERTED_COLUMNS)
+    if inserted:
+        latest = update_latest_readings(inserted)
+        update_rollups(inserted)
+        raise_alerts(inserted)
+        mark_late_after_commit(db.session, inserted, now)
+        publish_latest(latest, devices)
+
+    # Every reporting device (and its base device) was seen; the write is
+    # coalesced unless a device is coming back online
+    liveness.mark_seen(devices.values(), now)
+
+    return sorted(positions[(row['device_id'], row['timestamp'])] for row in inserted)
+
+def update_latest_readings(rows):
+    """Upsert the newest of `rows` per device into iot_latest_readings.
+
+    An existing reading is only replaced by one at least as recent, so the
+    table never moves backwards in time. Returns the rows that were upserted;
+    late rows older than the stored reading are left out.
+    """
+    latest = {}
+    for row in rows:
+        current = latest.get(row['device_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[row['device_id']] = row
+
+    now = datetime.utcnow()
+    upserted = upsert(
+        IoTLatestReading,
+        [dict(row, updated_at=now) for row in latest.values()],
+        index_elements=['device_id'],
+        update_columns=['value', 'unit', 'timestamp', 'quality_score', 'updated_at'],
+        where=lambda stmt: stmt.excluded.timestamp >= IoTLatestReading.timestamp,
+        returning=[IoTLatestReading.device_id]
+    )
+    return [latest[device_id] for device_id, in upserted]
+
+def publish_latest(latest_rows, devices):
+    """Queue the newest reading of each device for the live feed, grouped by owner"""
+    entries = {entry.id: entry for entry in devices.values()}
+    by_owner = {}
+    for row in latest_rows:
+        entry = entries[row['device_id']]
+        by_owner.setdefault(entry.owner_id, []).append(reading_event(
+            entry.id, entry.sensor_type, row['value'], row['unit'], row['timestamp']
+        ))
+    for owner_id, readings in by_owner.items():
+        publish_after_commit(db.session, owner_id, readings)
+
+def ingest_payloads(payloads, owner_id):
+    """Validate and store many gateway payloads in a single transaction.
+
+    Returns (stored, results) where results holds one status dict per payload,
+    in request order. Invalid payloads are reported and skipped; they never
+    abort the rest of the batch.
+    """
+    results = []
+    readings = []
+    spans = []
+    for index, payload in enumerate(payloads):
+        try:
+            payload_readings = flatten_payload(payload)
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        results.append({'index': index, 'status': 'ok'})
+        spans.append((results[-1], len(readings), len(readings) + len(payload_readings)))
+        readings.extend(payload_readings)
+
+    written = store_and_commit(readings, owner_id)
+    count_stored(spans, written)
+    return len(written), results
+
+def ingest_frames(body, owner_id):
+    """Decode and store binary sensor frames in a single transaction.
+
+    Returns (stored, results) like ingest_payloads, with one result per frame.
+    """
+    results = []
+    readings = []
+    spans = []
+    for index, (frame_readings, error) in enumerate(decode_frames(body)):
+        if error:
+            results.append({'index': index, 'status': 'error', 'error': error})
+            continue
+        results.append({'index': index, 'status': 'ok'})
+        spans.append((results[-1], len(readings), len(readings) + len(frame_readings)))
+        readings.extend(frame_readings)
+
+    written = store_and_commit(readings, owner_id)
+    count_stored(spans, written)
+    return len(written), results
+
+def count_stored(spans, written):
+    """Set each result's 'stored' to how many of its readings[start:end] were written"""
+    written = set(written)
+    for result, start, end in spans:
+        result['stored'] = sum(1 for position in range(start, end) if position in written)
+
+def store_and_commit(readings, owner_id):
+    """Store readings and commit; returns the positions of the readings written"""
+    try:
+        written = store_readings(readings, owner_id)
+        db.session.commit()
+    except IntegrityError:
+        # Another request registered one of our devices first; retry once
+        # now that the device rows are visible
+        db.session.rollback()
+        written = store_readings(readings, owner_id)
+        db.session.commit()
+
+    return written
@@ -0,0 +1,227 @@
+"""
+Live IoT reading feed for AgriConnect
+
+An in-process fan-out hub: ingestion publishes the newest reading of every
+device it touched once its transaction commits, and each subscriber (one
+per open Server-Sent Events connection) receives them through its own
+bounded queue. The hub keeps the latest reading per device for every owner
+that has subscribers, so the initial snapshot is read from the database
+once per owner and shared by all of that owner's connections.
+
+With CACHE_BACKEND 'redis', readings are published on a Redis channel that
+every process's hub listens to, so each feed sees readings ingested by any
+worker. Otherwise a hub only sees its own process's readings. Either way
+the page also polls whenever its feed has been quiet for a while (see
+static/js/main.js). Each process serves at most IOT_LIVE_MAX_SUBSCRIBERS
+connections, so open feeds cannot take every worker thread.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'agriconnect:iot-live'
+
+# Queued in place of updates a slow subscriber could not keep up with;
+# the subscriber is sent a fresh snapshot instead
+RESYNC = object()
+
+def reading_event(device_id, sensor_type, value, unit, timestamp):
+    return {
+        'device_id': device_id,
+        'sensor_type': sensor_type,
+        'value': value,
+        'unit': unit,
+        'timestamp': timestamp
+    }
+
+def _newer(reading, current):
+    return current is None or reading['timestamp'] >= current['timestamp']
+
+def _encode(readings):
+    return [
+        dict(reading, timestamp=reading['timestamp'].isoformat() if reading['timestamp'] else None)
+        for reading in readings
+    ]
+
+def _decode(readings):
+    return [
+        dict(reading, timestamp=datetime.fromisoformat(reading['timestamp']) if reading['timestamp'] else None)
+        for reading in readings
+    ]
+
+class LiveFeedFull(Exception):
+    """The process already serves IOT_LIVE_MAX_SUBSCRIBERS live connections"""
+
+class LiveFeedHub:
+    """Fans published readings out to per-owner subscriber queues"""
+
+    def __init__(self, queue_size=100, max_subscribers=16):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._state = {}
+        self._active = 0
+        self._redis = None
+        self._listener = None
+
+    def init_app(self, app):
+        self.queue_size = app.config['IOT_LIVE_QUEUE_SIZE']
+        self.max_subscribers = app.config['IOT_LIVE_MAX_SUBSCRIBERS']
+        if app.config['CACHE_BACKEND'] == 'redis':
+            import redis
+
+            self._redis = redis.Redis.from_url(app.config['REDIS_URL'], socket_connect_timeout=1)
+
+    def _merge(self, state, readings):
+        for reading in readings:
+            if _newer(reading, state.get(reading['device_id'])):
+                state[reading['device_id']] = reading
+
+    def subscribe(self, owner_id, load_snapshot):
+        """Register a subscriber; returns (queue, snapshot readings).
+
+        `load_snapshot` is only called when the owner has no subscribers yet.
+        Raises LiveFeedFull when the process has no room for another one.
+        """
+        with self._lock:
+            if self._active >= self.max_subscribers:
+                raise LiveFeedFull()
+            self._active += 1
+            loaded = owner_id in self._state
+            # Track the owner before loading so nothing published meanwhile is lost
+            self._state.setdefault(owner_id, {})
+            self._subscribers.setdefault(owner_id, set())
+        self._start_listener()
+
+        if not loaded:
+            try:
+                readings = load_snapshot()
+            except Exception:
+                with self._lock:
+                    self._active -= 1
+                raise
+            with self._lock:
+                self._merge(self._state.setdefault(owner_id, {}), readings)
+
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(owner_id, set()).add(subscription)
+            snapshot = list(self._state.setdefault(owner_id, {}).values())
+        return subscription, snapshot
+
+    def unsubscribe(self, owner_id, subscription):
+        with self._lock:
+            self._active -= 1
+            subscribers = self._subscribers.get(owner_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[owner_id]
+                self._state.pop(owner_id, None)
+
+    def snapshot(self, owner_id):
+        with self._lock:
+            return list(self._state.get(owner_id, {}).values())
+
+    def publish(self, owner_id, readings):
+        """Push readings to every subscriber of an owner; no-op without any"""
+        with self._lock:
+            state = self._state.get(owner_id)
+            if state is None:
+                return
+            self._merge(state, readings)
+            for subscription in self._subscribers.get(owner_id, ()):
+                try:
+                    subscription.put_nowait(readings)
+                except queue.Full:
+                    # Drop the backlog; the subscriber catches up from a snapshot
+                    while True:
+                        try:
+                            subscription.get_nowait()
+                        except queue.Empty:
+                            break
+                    subscription.put_nowait(RESYNC)
+
+    def broadcast(self, owner_id, readings):
+        """Publish readings to every process's subscribers, through Redis when configured"""
+        if self._redis is not None:
+            try:
+                self._redis.publish(CHANNEL, json.dumps({'owner_id': owner_id, 'readings': _encode(readings)}))
+                return
+            except Exception:
+                logger.exception('Live feed publish to Redis failed; delivering in this process only')
+        self.publish(owner_id, readings)
+
+    def _start_listener(self):
+        """Start relaying the Redis channel into this hub, once per process"""
+        if self._redis is None or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name='iot-live-listener', daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    self.publish(payload['owner_id'], _decode(payload['readings']))
+            except Exception:
+                logger.exception('Live feed Redis listener failed; reconnecting')
+                time.sleep(5)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+live_hub = LiveFeedHub()
+
+def format_event(name, readings):
+    """One Server-Sent Events message carrying a JSON list of readings"""
+    data = json.dumps(_encode(readings))
+    return f"event: {name}\ndata: {data}\n\n"
+
+def iter_events(owner_id, subscription, snapshot, keepalive_seconds):
+    """Server-Sent Events stream for one subscriber, unsubscribing when closed"""
+    try:
+        yield 'retry: 5000\n' + format_event('snapshot', snapshot)
+        while True:
+            try:
+                item = subscription.get(timeout=keepalive_seconds)
+            except queue.Empty:
+                # Comment line; keeps proxies from timing the connection out
+                yield ': keepalive\n\n'
+                continue
+            if item is RESYNC:
+                yield format_event('snapshot', live_hub.snapshot(owner_id))
+            else:
+                yield format_event('readings', item)
+    finally:
+        live_hub.unsubscribe(owner_id, subscription)
+
+def publish_after_commit(session, owner_id, readings):
+    """Publish readings written in this transaction once it commits"""
+    session.info.setdefault('iot_live_pending', []).append((owner_id, readings))
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    for owner_id, readings in session.info.pop('iot_live_pending', []):
+        live_hub.broadcast(owner_id, readings)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('iot_live_pending', None)
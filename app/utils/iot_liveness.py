@@ -0,0 +1,230 @@
+"""
+IoT device liveness for AgriConnect
+
+Ingestion reports every device it hears from to the LivenessTracker instead
+of updating iot_devices each time. The tracker keeps each device's
+last_seen in memory with a deadline in a min-heap, and a background sweeper
+runs every IOT_LIVENESS_INTERVAL_SECONDS to:
+
+  * write the buffered last_seen values in one bulk UPDATE;
+  * mark devices not heard from for IOT_DEVICE_OFFLINE_SECONDS offline in
+    one UPDATE, and raise one device_offline alert per gateway in one INSERT.
+
+Devices that were offline are written through at once, and their open
+device_offline alerts are resolved, so coming back online is never delayed.
+The sweeper starts on the first reading, seeded with the devices the
+database lists as online. last_seen values buffered at shutdown are lost,
+so it may lag by up to one interval.
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, select, update
+from app import db
+from app.models.iot import IoTDevice, IoTAlert
+
+class LivenessTracker:
+    """last_seen buffer plus a min-heap holding one offline deadline per device"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._deadlines = []
+        self._scheduled = set()
+        self._pending = set()
+        self._online = set()
+        self._app = None
+        self._thread = None
+
+    def _schedule(self, device_id, last_seen, timeout):
+        # A device already in the heap keeps its entry; the sweeper pushes it
+        # back with the later deadline when the old one comes due
+        self._last_seen[device_id] = last_seen
+        if device_id not in self._scheduled:
+            self._scheduled.add(device_id)
+            heapq.heappush(self._deadlines, (last_seen + timeout, device_id))
+
+    def mark_seen(self, entries, now):
+        """Record readings from DeviceEntry objects in the current transaction.
+
+        Only devices this process does not know to be online are written
+        immediately; the rest wait for the next flush.
+        """
+        timeout = timedelta(seconds=current_app.config['IOT_DEVICE_OFFLINE_SECONDS'])
+        with self._lock:
+            returning = []
+            for entry in entries:
+                self._schedule(entry.id, now, timeout)
+                if entry.id in self._online:
+                    self._pending.add(entry.id)
+                else:
+                    self._online.add(entry.id)
+                    returning.append(entry.id)
+
+        if returning:
+            db.session.execute(
+                update(IoTDevice).where(IoTDevice.id.in_(returning)).values(is_online=True, last_seen=now)
+            )
+            db.session.execute(
+                update(IoTAlert).where(
+                    IoTAlert.device_id.in_(returning),
+                    IoTAlert.alert_type == 'device_offline',
+                    IoTAlert.is_resolved.is_(False)
+                ).values(is_resolved=True, resolved_at=now)
+            )
+
+        self.start(current_app._get_current_object())
+
+    def flush(self):
+        """Write buffered last_seen values in one bulk UPDATE; returns the row count"""
+        with self._lock:
+            rows = [
+                {'id': device_id, 'last_seen': self._last_seen[device_id], 'is_online': True}
+                for device_id in self._pending
+            ]
+            self._pending.clear()
+        if rows:
+            db.session.execute(update(IoTDevice), rows)
+            db.session.commit()
+        return len(rows)
+
+    def sweep(self, now=None):
+        """Mark devices past their deadline offline; returns their ids"""
+        now = now or datetime.utcnow()
+        timeout = timedelta(seconds=current_app.config['IOT_DEVICE_OFFLINE_SECONDS'])
+
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, device_id = heapq.heappop(self._deadlines)
+                deadline = self._last_seen[device_id] + timeout
+                if deadline > now:
+                    heapq.heappush(self._deadlines, (deadline, device_id))
+                    continue
+                self._scheduled.discard(device_id)
+                if device_id in self._online:
+                    expired.append(device_id)
+            for device_id in expired:
+                self._online.discard(device_id)
+                self._pending.discard(device_id)
+        if not expired:
+            return []
+
+        # Another worker may have heard from the device more recently
+        cutoff = now - timeout
+        offline = db.session.execute(
+            update(IoTDevice).where(
+                IoTDevice.id.in_(expired),
+                IoTDevice.is_online.is_(True),
+                (IoTDevice.last_seen < cutoff) | IoTDevice.last_seen.is_(None)
+            ).values(is_online=False).returning(IoTDevice.id, IoTDevice.mac_address, IoTDevice.sensor_type)
+        ).all()
+
+        raise_offline_alerts(offline, now)
+        db.session.commit()
+        return [device_id for device_id, _, _ in offline]
+
+    def load_online_devices(self):
+        """Seed deadlines from devices the database lists as online"""
+        timeout = timedelta(seconds=current_app.config['IOT_DEVICE_OFFLINE_SECONDS'])
+        rows = db.session.execute(
+            select(IoTDevice.id, IoTDevice.last_seen).where(
+                IoTDevice.is_online.is_(True),
+                IoTDevice.device_type != 'actuator'
+            )
+        ).all()
+        with self._lock:
+            for device_id, last_seen in rows:
+                if device_id in self._online:
+                    continue
+                self._online.add(device_id)
+                self._schedule(device_id, last_seen or datetime.min, timeout)
+
+    def start(self, app):
+        """Start the sweeper thread once per process"""
+        if self._thread is not None or not app.config['IOT_LIVENESS_SWEEPER']:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='iot-liveness', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        app = self._app
+        with app.app_context():
+            try:
+                self.load_online_devices()
+            except Exception:
+                app.logger.exception('Could not load online IoT devices')
+            finally:
+                db.session.remove()
+
+        while True:
+            time.sleep(app.config['IOT_LIVENESS_INTERVAL_SECONDS'])
+            with app.app_context():
+                try:
+                    self.flush()
+                    self.sweep()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('IoT liveness sweep failed')
+                finally:
+                    db.session.remove()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked': len(self._last_seen),
+                'online': len(self._online),
+                'pending_writes': len(self._pending),
+                'deadlines': len(self._deadlines),
+                'sweeper_running': self._thread is not None and self._thread.is_alive()
+            }
+
+liveness = LivenessTracker()
+
+def raise_offline_alerts(devices, now):
+    """Insert one device_offline alert per gateway for (id, mac, sensor_type) rows.
+
+    A gateway's base device (sensor_type NULL) carries the alert when it went
+    offline too. Gateways that already have an open alert are skipped.
+    """
+    by_gateway = {}
+    for device_id, mac_address, sensor_type in devices:
+        key = mac_address or device_id
+        current = by_gateway.get(key)
+        if current is None or (sensor_type is None and current[2] is not None):
+            by_gateway[key] = (device_id, mac_address, sensor_type)
+    if not by_gateway:
+        return 0
+
+    alerting = [device_id for device_id, _, _ in by_gateway.values()]
+    already_open = set(db.session.execute(
+        select(IoTAlert.device_id).where(
+            IoTAlert.device_id.in_(alerting),
+            IoTAlert.alert_type == 'device_offline',
+            IoTAlert.is_resolved.is_(False)
+        )
+    ).scalars())
+
+    minutes = current_app.config['IOT_DEVICE_OFFLINE_SECONDS'] // 60
+    alerts = [
+        {
+            'device_id': device_id,
+            'alert_type': 'device_offline',
+            'severity': 'high',
+            'title': 'Device offline',
+            'message': f"Device {mac_address or device_id} has not reported for more than {minutes} minutes.",
+            'is_resolved': False,
+            'created_at': now
+        }
+        for device_id, mac_address, _ in by_gateway.values() if device_id not in already_open
+    ]
+    if alerts:
+        db.session.execute(insert(IoTAlert), alerts)
+    return len(alerts)
@@ -0,0 +1,152 @@
+"""
+In-process IoT device registry for AgriConnect
+
+Caches device resolution, by (mac_address, sensor_type) and by device id, so
+steady-state ingestion does not need to look devices up in iot_devices.
+Entries are evicted least-recently-used, and dropped whenever the ORM
+inserts, updates or deletes a device.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models.iot import IoTDevice
+
+DeviceEntry = namedtuple('DeviceEntry', ['id', 'owner_id', 'mac_address', 'sensor_type', 'device_type', 'location'])
+
+def entry_for(device):
+    """Build a session-independent cache entry from an IoTDevice"""
+    return DeviceEntry(
+        id=device.id,
+        owner_id=device.owner_id,
+        mac_address=device.mac_address,
+        sensor_type=device.sensor_type,
+        device_type=device.device_type,
+        location=device.location
+    )
+
+class DeviceRegistry:
+    """Bounded LRU cache of DeviceEntry objects with hit/miss counters.
+
+    maxsize counts devices. Each is stored once under its id, in use order,
+    and its (mac_address, sensor_type) key points at that id, so a device is
+    always evicted or dropped under both keys at once.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._by_mac = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.maxsize = app.config['IOT_DEVICE_CACHE_SIZE']
+
+    def _get(self, device_id):
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(device_id)
+            self.hits += 1
+            return entry
+
+    def get(self, mac_address, sensor_type):
+        """Look up a device by gateway MAC and sensor type"""
+        return self._get(self._by_mac.get((mac_address, sensor_type)))
+
+    def get_by_id(self, device_id):
+        """Look up a device by primary key"""
+        return self._get(device_id)
+
+    def _forget_mac(self, entry):
+        key = (entry.mac_address, entry.sensor_type)
+        if self._by_mac.get(key) == entry.id:
+            del self._by_mac[key]
+
+    def put(self, entry):
+        """Cache an entry under both its MAC/sensor-type key and its id"""
+        with self._lock:
+            previous = self._entries.pop(entry.id, None)
+            if previous is not None:
+                self._forget_mac(previous)
+            self._entries[entry.id] = entry
+            if entry.mac_address:
+                self._by_mac[(entry.mac_address, entry.sensor_type)] = entry.id
+            while len(self._entries) > self.maxsize:
+                _, evicted = self._entries.popitem(last=False)
+                self._forget_mac(evicted)
+                self.evictions += 1
+
+    def invalidate(self, device_id, mac_addresses=(), sensor_types=()):
+        """Drop every key that may point at this device"""
+        with self._lock:
+            entry = self._entries.pop(device_id, None)
+            if entry is not None:
+                self._forget_mac(entry)
+            for mac in mac_addresses:
+                for sensor_type in sensor_types:
+                    self._by_mac.pop((mac, sensor_type), None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_mac.clear()
+
+    def stats(self):
+        """Counters for monitoring; hit_rate is over all lookups so far"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+device_registry = DeviceRegistry()
+
+def lookup_device(device_id):
+    """Resolve a device id through the registry, querying only on a miss"""
+    entry = device_registry.get_by_id(device_id)
+    if entry is None:
+        device = IoTDevice.query.get(device_id)
+        if device is None:
+            return None
+        entry = entry_for(device)
+        device_registry.put(entry)
+    return entry
+
+def remember_after_commit(session, entries):
+    """Cache entries for devices created in this transaction once it commits"""
+    session.info.setdefault('iot_registry_pending', []).extend(entries)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    for entry in session.info.pop('iot_registry_pending', []):
+        device_registry.put(entry)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('iot_registry_pending', None)
+
+def _invalidate_device(mapper, connection, target):
+    # Covers the old values too, so a renamed MAC/sensor type cannot linger
+    state = inspect(target)
+    macs = set(state.attrs.mac_address.history.sum()) | {target.mac_address}
+    sensor_types = set(state.attrs.sensor_type.history.sum()) | {target.sensor_type}
+    device_registry.invalidate(target.id, macs, sensor_types)
+
+event.listen(IoTDevice, 'after_insert', _invalidate_device)
+event.listen(IoTDevice, 'after_update', _invalidate_device)
+event.listen(IoTDevice, 'after_delete', _invalidate_device)
@@ -0,0 +1,302 @@
+"""
+Downsampled IoT history for AgriConnect
+
+Raw IoTData rows are folded into 1-minute, 1-hour and 1-day tiers as they
+are ingested. Each tier row keeps min, max, avg, count and the average
+quality score for one device and bucket. Long-range queries read the
+coarsest tier that is fine enough, and each tier is pruned on its own
+retention schedule.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select, delete
+from app import db
+from app.models.iot import IoTData, IoTDataMinute, IoTDataHourly, IoTDataDaily
+from app.utils.iot_archive import from_epoch_ms, read_history
+from app.utils.upsert import upsert
+
+EPOCH = datetime(1970, 1, 1)
+
+# Finest to coarsest
+ROLLUP_TIERS = [IoTDataMinute, IoTDataHourly, IoTDataDaily]
+
+# Config key holding each tier's retention in days (0 keeps data forever)
+RETENTION_SETTINGS = {
+    IoTData: 'IOT_RAW_RETENTION_DAYS',
+    IoTDataMinute: 'IOT_MINUTE_RETENTION_DAYS',
+    IoTDataHourly: 'IOT_HOURLY_RETENTION_DAYS',
+    IoTDataDaily: 'IOT_DAILY_RETENTION_DAYS'
+}
+
+# Longest history window offered when some tier keeps its data forever
+FOREVER_HOURS = 100 * 365 * 24
+
+TIER_NAMES = {
+    IoTData: 'raw',
+    IoTDataMinute: '1m',
+    IoTDataHourly: '1h',
+    IoTDataDaily: '1d'
+}
+
+PRUNE_CHUNK_SIZE = 10000
+
+def bucket_start(timestamp, seconds):
+    """Floor a naive UTC datetime to the start of its bucket"""
+    offset = int((timestamp - EPOCH).total_seconds()) // seconds * seconds
+    return EPOCH + timedelta(seconds=offset)
+
+def aggregate_rows(rows, seconds):
+    """Group IoTData row dicts into one rollup row per (device, bucket)"""
+    buckets = {}
+    for row in rows:
+        key = (row['device_id'], bucket_start(row['timestamp'], seconds))
+        value = row['value']
+        quality = row.get('quality_score')
+        quality = 1.0 if quality is None else quality
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [value, value, value, 1, quality]
+        else:
+            bucket[0] = min(bucket[0], value)
+            bucket[1] = max(bucket[1], value)
+            bucket[2] += value
+            bucket[3] += 1
+            bucket[4] += quality
+
+    return [
+        {
+            'device_id': device_id,
+            'bucket_start': start,
+            'min_value': low,
+            'max_value': high,
+            'avg_value': total / count,
+            'count': count,
+            'avg_quality': quality_total / count
+        }
+        for (device_id, start), (low, high, total, count, quality_total) in buckets.items()
+    ]
+
+def _merge_into(model):
+    """SET expressions that fold an incoming rollup row into the stored one"""
+    def merge(stmt):
+        new = stmt.excluded
+        total = model.count + new.count
+        return {
+            'min_value': case((new.min_value < model.min_value, new.min_value), else_=model.min_value),
+            'max_value': case((new.max_value > model.max_value, new.max_value), else_=model.max_value),
+            'avg_value': (model.avg_value * model.count + new.avg_value * new.count) / total,
+            'avg_quality': (
+                func.coalesce(model.avg_quality, 1.0) * model.count + new.avg_quality * new.count
+            ) / total,
+            'count': total
+        }
+    return merge
+
+def _fold_into(model, rows):
+    upsert(
+        model,
+        aggregate_rows(rows, model.bucket_seconds),
+        index_elements=['device_id', 'bucket_start'],
+        merge=_merge_into(model)
+    )
+
+def update_rollups(rows):
+    """Fold freshly inserted IoTData row dicts into every rollup tier"""
+    for model in ROLLUP_TIERS:
+        _fold_into(model, rows)
+
+def retention_cutoff(model, now=None):
+    """Oldest timestamp kept for a tier, or None when it is kept forever"""
+    days = current_app.config[RETENTION_SETTINGS[model]]
+    if not days:
+        return None
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+def max_history_hours():
+    """Longest window, in hours, that any tier still holds data for"""
+    days = [current_app.config[setting] for setting in RETENTION_SETTINGS.values()]
+    if not all(days):
+        return FOREVER_HOURS
+    return max(days) * 24
+
+def raw_rows_cover(start, now=None):
+    """Whether iot_data itself still holds raw readings from `start` on"""
+    cutoff = retention_cutoff(IoTData, now)
+    return cutoff is None or cutoff <= start
+
+def covers(model, start, now=None):
+    """Whether a tier can still serve history from `start` on.
+
+    Raw readings past iot_data's retention are read back from the columnar
+    archive when IOT_ARCHIVE_ENABLED.
+    """
+    if model is IoTData:
+        return current_app.config['IOT_ARCHIVE_ENABLED'] or raw_rows_cover(start, now)
+    cutoff = retention_cutoff(model, now)
+    return cutoff is None or cutoff <= start
+
+def choose_tier(window_seconds, resolution=None, max_points=None, now=None):
+    """Pick the table to serve a history query from.
+
+    With an explicit `resolution` (seconds), returns the coarsest tier whose
+    bucket is no wider than it. With `max_points`, returns the finest tier
+    that covers the window in at most that many buckets. Otherwise raw data
+    is preferred. Only tiers that still cover the whole window (see
+    covers()) are considered; if none do, the longest-kept tier wins.
+    """
+    now = now or datetime.utcnow()
+    start = now - timedelta(seconds=window_seconds)
+    tiers = [IoTData] + ROLLUP_TIERS
+
+    covering = [model for model in tiers if covers(model, start, now)]
+    if not covering:
+        return tiers[-1]
+
+    def width(model):
+        return getattr(model, 'bucket_seconds', 0)
+
+    if resolution:
+        fine_enough = [model for model in covering if width(model) <= resolution]
+        return fine_enough[-1] if fine_enough else covering[0]
+
+    if max_points:
+        for model in covering:
+            if width(model) and window_seconds / width(model) <= max_points:
+                return model
+        return covering[-1]
+
+    return covering[0]
+
+def _archived_history(device_id, start_time, limit, now):
+    """Newest-first raw points from the archive, plus the SQL tail it has not compacted yet"""
+    timestamps, values = read_history(device_id, start_time, now + timedelta(days=1))
+    # The archive keeps only timestamps and values
+    unit = db.session.execute(
+        select(IoTData.unit).where(IoTData.device_id == device_id).order_by(IoTData.id.desc()).limit(1)
+    ).scalar()
+    newest = range(len(timestamps) - 1, max(len(timestamps) - limit, 0) - 1, -1)
+    return [
+        {
+            'value': float(f'{values[i]:.7g}'),  # float32 in the archive
+            'unit': unit,
+            'timestamp': from_epoch_ms(timestamps[i]).isoformat(),
+            'quality_score': None
+        }
+        for i in newest
+    ]
+
+def query_history(device_id, start_time, limit, model, now=None):
+    """Newest-first points for one device from the given tier, as dicts"""
+    now = now or datetime.utcnow()
+    if model is IoTData and not raw_rows_cover(start_time, now) and current_app.config['IOT_ARCHIVE_ENABLED']:
+        return _archived_history(device_id, start_time, limit, now)
+
+    if model is IoTData:
+        points = IoTData.query.filter(
+            IoTData.device_id == device_id,
+            IoTData.timestamp >= start_time
+        ).order_by(IoTData.timestamp.desc()).limit(limit).all()
+
+        return [
+            {
+                'value': point.value,
+                'unit': point.unit,
+                'timestamp': point.timestamp.isoformat(),
+                'quality_score': point.quality_score
+            }
+            for point in points
+        ]
+
+    buckets = model.query.filter(
+        model.device_id == device_id,
+        model.bucket_start >= bucket_start(start_time, model.bucket_seconds)
+    ).order_by(model.bucket_start.desc()).limit(limit).all()
+
+    return [
+        {
+            'value': bucket.avg_value,
+            'min': bucket.min_value,
+            'max': bucket.max_value,
+            'count': bucket.count,
+            'timestamp': bucket.bucket_start.isoformat(),
+            'quality_score': bucket.avg_quality
+        }
+        for bucket in buckets
+    ]
+
+def prune_history(now=None):
+    """Delete rows older than each tier's retention; returns {tier: rows deleted}"""
+    now = now or datetime.utcnow()
+    deleted = {}
+
+    cutoff = retention_cutoff(IoTData, now)
+    if cutoff is not None:
+        # Raw history can be huge, so delete it in bounded chunks
+        total = 0
+        while True:
+            ids = db.session.execute(
+                select(IoTData.id).where(IoTData.timestamp < cutoff).limit(PRUNE_CHUNK_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete(IoTData).where(IoTData.id.in_(ids)))
+            db.session.commit()
+            total += len(ids)
+        deleted[TIER_NAMES[IoTData]] = total
+
+    for model in ROLLUP_TIERS:
+        cutoff = retention_cutoff(model, now)
+        if cutoff is None:
+            continue
+        result = db.session.execute(delete(model).where(model.bucket_start < cutoff))
+        db.session.commit()
+        deleted[TIER_NAMES[model]] = result.rowcount
+
+    return deleted
+
+def first_whole_bucket(timestamp, seconds):
+    """Start of the first bucket that begins at or after `timestamp`"""
+    start = bucket_start(timestamp, seconds)
+    return start if start == timestamp else start + timedelta(seconds=seconds)
+
+def rebuild_rollups(chunk_size=PRUNE_CHUNK_SIZE):
+    """Recompute the rollup buckets covered by the raw rows still in iot_data.
+
+    Raw rows are kept for less time than the hourly and daily tiers, so for
+    each device only buckets from its oldest raw reading on are replaced.
+    Older buckets, and the one that reading falls into when it is not on a
+    bucket boundary, hold history that no longer exists raw and are kept.
+    """
+    oldest = db.session.execute(
+        select(IoTData.device_id, func.min(IoTData.timestamp))
+        .where(IoTData.timestamp.isnot(None))
+        .group_by(IoTData.device_id)
+    ).all()
+    rebuild_from = {
+        model: {device_id: first_whole_bucket(timestamp, model.bucket_seconds) for device_id, timestamp in oldest}
+        for model in ROLLUP_TIERS
+    }
+    for model in ROLLUP_TIERS:
+        for device_id, start in rebuild_from[model].items():
+            db.session.execute(delete(model).where(model.device_id == device_id, model.bucket_start >= start))
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(IoTData.id, IoTData.device_id, IoTData.value, IoTData.timestamp, IoTData.quality_score)
+            .where(IoTData.id > last_id, IoTData.timestamp.isnot(None))
+            .order_by(IoTData.id)
+            .limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+        for model in ROLLUP_TIERS:
+            starts = rebuild_from[model]
+            _fold_into(model, [row for row in rows if row['timestamp'] >= starts[row['device_id']]])
+        last_id = rows[-1]['id']
+        total += len(rows)
+
+    db.session.commit()
+    return total
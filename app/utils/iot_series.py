@@ -0,0 +1,190 @@
+"""
+Resampled IoT time series for AgriConnect
+
+Serves /api/iot/series: several devices over one time range, cut into
+fixed-width buckets aligned to the Unix epoch, with a choice of aggregates
+per bucket. Every device and bucket comes from one grouped SQL query
+against the coarsest storage tier whose bucket width divides the requested
+one (raw iot_data otherwise), and is laid out in NumPy arrays that share a
+single timestamp axis.
+
+When the caller asks for a point budget smaller than the number of
+buckets, each series is thinned with Largest-Triangle-Three-Buckets, which
+keeps the peaks and troughs a line chart needs.
+"""
+
+import math
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import BigInteger, Integer, cast, func, select
+from app import db
+from app.models.iot import IoTData
+from app.utils.iot_archive import read_history, to_epoch_ms
+from app.utils.iot_rollups import EPOCH, ROLLUP_TIERS, bucket_start, covers, raw_rows_cover
+
+SERIES_AGGREGATES = ['avg', 'min', 'max', 'count', 'sum']
+
+# Bucket widths (seconds) tried in order when the caller leaves it to us
+AUTO_BUCKETS = [60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400]
+
+def auto_bucket(start, end, points):
+    """Narrowest AUTO_BUCKETS width that covers [start, end) in at most `points` buckets"""
+    seconds = (end - start).total_seconds()
+    for width in AUTO_BUCKETS:
+        if seconds / width <= points:
+            return width
+    return math.ceil(seconds / points / 86400) * 86400
+
+def choose_source(start, bucket_seconds, now=None):
+    """Coarsest table whose buckets tile `bucket_seconds` and still cover `start`.
+
+    Raw data tiles any width, and covers any start while the archive is
+    enabled. If nothing retains `start`, the longest-kept table that tiles
+    the width wins.
+    """
+    tiling = [IoTData] + [model for model in ROLLUP_TIERS if bucket_seconds % model.bucket_seconds == 0]
+    covering = [model for model in tiling if covers(model, start, now)]
+    return (covering or tiling)[-1]
+
+def _epoch_seconds(column):
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return cast(func.strftime('%s', column), Integer)
+    return cast(func.floor(func.extract('epoch', column)), BigInteger)
+
+def _aggregate_columns(model):
+    """SQL expression per SERIES_AGGREGATES name for one table"""
+    if model is IoTData:
+        return {
+            'avg': func.avg(IoTData.value),
+            'min': func.min(IoTData.value),
+            'max': func.max(IoTData.value),
+            'count': func.count(IoTData.value),
+            'sum': func.sum(IoTData.value)
+        }
+    # Rollup rows are combined, weighting each average by its count
+    total = func.sum(model.avg_value * model.count)
+    return {
+        'avg': total / func.sum(model.count),
+        'min': func.min(model.min_value),
+        'max': func.max(model.max_value),
+        'count': func.sum(model.count),
+        'sum': total
+    }
+
+def query_series(device_ids, start, end, bucket_seconds, aggregates, now=None):
+    """Resample devices over [start, end) into aligned bucket arrays.
+
+    Returns (timestamps_ms, values, source) where timestamps_ms holds each
+    bucket's start, values maps each aggregate to a (devices, buckets) array
+    in `device_ids` order (NaN, or 0 for counts, where a bucket is empty),
+    and source is the table that was read.
+    """
+    origin = bucket_start(start, bucket_seconds)
+    count = max(1, math.ceil((end - origin).total_seconds() / bucket_seconds))
+    stop = origin + timedelta(seconds=count * bucket_seconds)
+    timestamps = to_epoch_ms(origin) + np.arange(count, dtype=np.int64) * bucket_seconds * 1000
+    values = {
+        name: np.zeros((len(device_ids), count)) if name == 'count' else np.full((len(device_ids), count), np.nan)
+        for name in aggregates
+    }
+
+    source = choose_source(origin, bucket_seconds, now)
+    if source is IoTData and not raw_rows_cover(origin, now):
+        # Older raw readings are only left in the archive
+        for index, device_id in enumerate(device_ids):
+            _bucket_archived(values, index, device_id, origin, stop, bucket_seconds)
+        return timestamps, values, source
+
+    time_column = IoTData.timestamp if source is IoTData else source.bucket_start
+    offset = int((origin - EPOCH).total_seconds())
+    bucket = ((_epoch_seconds(time_column) - offset) // bucket_seconds).label('bucket')
+    columns = _aggregate_columns(source)
+
+    rows = db.session.execute(
+        select(source.device_id, bucket, *[columns[name].label(name) for name in aggregates])
+        .where(
+            source.device_id.in_(device_ids),
+            time_column >= origin,
+            time_column < stop
+        )
+        .group_by(source.device_id, bucket)
+    ).all()
+
+    row_of = {device_id: index for index, device_id in enumerate(device_ids)}
+    if rows:
+        device_rows = np.fromiter((row_of[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        buckets = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        for position, name in enumerate(aggregates, start=2):
+            values[name][device_rows, buckets] = np.array(
+                [row[position] for row in rows], dtype=np.float64
+            )
+    return timestamps, values, source
+
+def _bucket_archived(values, index, device_id, origin, stop, bucket_seconds):
+    """Fill row `index` of each aggregate array from a device's archived readings"""
+    timestamps, readings = read_history(device_id, origin, stop)
+    if not len(timestamps):
+        return
+    buckets = (timestamps - to_epoch_ms(origin)) // (bucket_seconds * 1000)
+    readings = readings.astype(np.float64)
+    width = values[next(iter(values))].shape[1]
+    counts = np.bincount(buckets, minlength=width)
+    sums = np.bincount(buckets, weights=readings, minlength=width)
+    filled = counts > 0
+
+    for name, array in values.items():
+        if name == 'count':
+            array[index] = counts
+        elif name == 'sum':
+            array[index, filled] = sums[filled]
+        elif name == 'avg':
+            array[index, filled] = sums[filled] / counts[filled]
+        else:
+            extreme = np.full(width, np.inf if name == 'min' else -np.inf)
+            (np.minimum if name == 'min' else np.maximum).at(extreme, buckets, readings)
+            array[index, filled] = extreme[filled]
+
+def lttb(x, y, threshold):
+    """Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps.
+
+    The first and last points are always kept. In between, each bucket keeps
+    the point forming the largest triangle with the point kept before it
+    and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    kept = 0
+    for i in range(threshold - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_hi = min(int((i + 2) * every) + 1, n)
+        next_x = x[hi:next_hi].mean()
+        next_y = y[hi:next_hi].mean()
+        area = np.abs(
+            (x[kept] - next_x) * (y[lo:hi] - y[kept]) - (x[kept] - x[lo:hi]) * (next_y - y[kept])
+        )
+        kept = lo + int(np.argmax(area))
+        picked[i + 1] = kept
+    return picked
+
+def downsample(timestamps, values, device_index, by, points):
+    """Indices of one device's buckets to keep for a `points` budget.
+
+    Empty buckets are dropped, and LTTB picks among the rest using the `by`
+    aggregate, so every aggregate of the device keeps the same buckets.
+    """
+    y = values[by][device_index]
+    present = np.flatnonzero(~np.isnan(y))
+    picked = lttb(timestamps[present].astype(np.float64), y[present], points)
+    return present[picked]
+
+def to_json_list(array, name):
+    """One aggregate's NumPy array as a JSON list, with NaN as None"""
+    if name == 'count':
+        return array.astype(np.int64).tolist()
+    return [None if math.isnan(value) else value for value in array.tolist()]
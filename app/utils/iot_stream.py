@@ -0,0 +1,127 @@
+"""
+Streaming IoT ingestion for AgriConnect
+
+Gateways keep one HTTP request open and write newline-delimited JSON
+payloads into its body. Payloads are buffered and flushed through
+ingest_payloads in micro-batches, whenever the buffer reaches
+IOT_STREAM_BATCH_SIZE or its oldest payload has waited
+IOT_STREAM_FLUSH_SECONDS, so a quiet gateway's readings are not held back.
+"""
+
+import json
+import queue
+import threading
+import time
+from app.utils.iot_ingest import ingest_payloads
+
+# Errors reported back per stream; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+_END = object()
+
+def _read_lines(stream, lines):
+    """Feed raw lines from the request body into a queue, then _END"""
+    try:
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+    except Exception as e:
+        lines.put(e)
+    lines.put(_END)
+
+class StreamIngestor:
+    """Buffers streamed payloads and stores them in size/time bounded batches"""
+
+    def __init__(self, owner_id, batch_size, flush_seconds):
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.received = 0
+        self.stored = 0
+        self.batches = 0
+        self.error_count = 0
+        self.errors = []
+        self._payloads = []
+        self._line_numbers = []
+        self._deadline = None
+
+    def _error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def add_line(self, line_number, line):
+        """Parse one NDJSON line into the buffer, flushing when it is full"""
+        line = line.strip()
+        if not line:
+            return
+        self.received += 1
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            self._error(line_number, 'Invalid JSON')
+            return
+
+        if not self._payloads:
+            self._deadline = time.monotonic() + self.flush_seconds
+        self._payloads.append(payload)
+        self._line_numbers.append(line_number)
+        if len(self._payloads) >= self.batch_size:
+            self.flush()
+
+    def timeout(self):
+        """Seconds until the buffered batch is due, or None when it is empty"""
+        if not self._payloads:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def flush(self):
+        """Store the buffered payloads in one transaction"""
+        if not self._payloads:
+            return
+        payloads, line_numbers = self._payloads, self._line_numbers
+        self._payloads, self._line_numbers = [], []
+        self._deadline = None
+
+        stored, results = ingest_payloads(payloads, self.owner_id)
+        self.stored += stored
+        self.batches += 1
+        for result in results:
+            if result['status'] == 'error':
+                self._error(line_numbers[result['index']], result['error'])
+
+    def consume(self, stream):
+        """Ingest NDJSON from a file-like body until the client closes it.
+
+        The body is read on a helper thread so that a partly filled batch is
+        still flushed on time while the gateway is idle between readings.
+        """
+        lines = queue.Queue(maxsize=self.batch_size * 4)
+        reader = threading.Thread(target=_read_lines, args=(stream, lines), daemon=True)
+        reader.start()
+
+        line_number = 0
+        while True:
+            try:
+                item = lines.get(timeout=self.timeout())
+            except queue.Empty:
+                self.flush()
+                continue
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                self.flush()
+                raise item
+            line_number += 1
+            self.add_line(line_number, item)
+
+        self.flush()
+        reader.join()
+
+    def summary(self):
+        return {
+            'received': self.received,
+            'stored': self.stored,
+            'batches': self.batches,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
@@ -0,0 +1,364 @@
+"""
+LLM execution layer for the AgriConnect chatbot
+
+Every call to the language model goes through llm.generate() or
+llm.stream(), which run it on a pool of LLM_MAX_CONCURRENCY threads with
+at most LLM_MAX_QUEUED more calls waiting. Callers wait no longer than
+LLM_DEADLINE_SECONDS for an answer (for a stream: for each next piece).
+When the pool is full, the deadline passes, the backend fails or the
+circuit breaker is open, LLMUnavailable is raised at once and the chatbot
+answers with its mock responses instead. Slow calls no longer hold up
+the rest of the site.
+
+The breaker opens after LLM_BREAKER_FAILURES consecutive failures. A call
+slower than LLM_SLOW_CALL_SECONDS counts as a failure; for a stream that is
+the wait for its first or any next piece, so a long but steady answer is
+healthy. While open, calls
+are refused for LLM_BREAKER_COOLDOWN_SECONDS; then one trial call is let
+through, and its outcome closes or reopens the breaker.
+
+LLM_BACKEND picks the model: 'gemini' (default) or 'http', a plain JSON
+API at LLM_HTTP_URL such as scripts/fake_llm_server.py, for exercising
+all of the above locally.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import requests
+from app.utils.gemini import gemini_client
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailable(Exception):
+    """The model cannot answer now; `reason` says why"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class GeminiBackend:
+    """The shared Gemini model from app.utils.gemini"""
+
+    name = 'gemini'
+
+    def configured(self):
+        return bool(gemini_client.api_key)
+
+    def _model(self):
+        model = gemini_client.model()
+        if model is None:
+            raise LLMUnavailable('gemini_unavailable')
+        return model
+
+    def generate(self, prompt, timeout):
+        # The SDK takes no timeout; the caller's deadline bounds the wait
+        response = self._model().generate_content(prompt)
+        try:
+            return response.text
+        except ValueError:
+            # No single text part, e.g. a blocked or multi-part answer
+            return ' '.join(part.text for part in response.parts if hasattr(part, 'text'))
+
+    def stream(self, prompt, timeout):
+        for chunk in self._model().generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+
+class HTTPBackend:
+    """A JSON model API: POST {"prompt", "stream"} to `url`.
+
+    Answers with {"text": ...}, or when streaming with one such object per
+    line.
+    """
+
+    name = 'http'
+
+    def __init__(self, url):
+        self.url = url
+
+    def configured(self):
+        return bool(self.url)
+
+    def generate(self, prompt, timeout):
+        response = requests.post(self.url, json={'prompt': prompt, 'stream': False}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()['text']
+
+    def stream(self, prompt, timeout):
+        with requests.post(self.url, json={'prompt': prompt, 'stream': True}, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    text = json.loads(line)['text']
+                    if text:
+                        yield text
+
+def make_backend(app):
+    """The backend named by LLM_BACKEND: 'gemini' or 'http'"""
+    if app.config['LLM_BACKEND'] == 'http':
+        return HTTPBackend(app.config['LLM_HTTP_URL'])
+    return GeminiBackend()
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a cooldown and a single trial call"""
+
+    def __init__(self, failures=5, cooldown=30):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """Give up a call allow() let through without learning anything about the backend"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failures:
+                if self.state != 'open':
+                    logger.warning('LLM circuit breaker opened after %d failures', self.consecutive_failures)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+_DONE = object()
+
+class LLMStream:
+    """A streamed call in progress, relaying pieces from the pool thread.
+
+    The call is judged once: by its outcome when the stream ends, fails or
+    times out, and not at all when the reader closes it first.
+    """
+
+    def __init__(self, service, slots, prompt):
+        self._service = service
+        self._pieces = queue.Queue()
+        self._stopped = threading.Event()
+        self._settled = threading.Lock()
+        self._done = False
+        # Longest wait for a piece, counted from submission so queueing shows too
+        self._timing = {'last': time.monotonic(), 'slowest': 0.0}
+        # The worker must not hold on to self, or dropping the stream unread
+        # would never reach __del__
+        pieces, stopped, timing = self._pieces, self._stopped, self._timing
+
+        def run():
+            try:
+                for piece in service.backend.stream(prompt, service.deadline):
+                    if stopped.is_set():
+                        service._count('cancelled')
+                        return
+                    now = time.monotonic()
+                    timing['slowest'] = max(timing['slowest'], now - timing['last'])
+                    timing['last'] = now
+                    pieces.put(piece)
+                pieces.put(_DONE)
+            except Exception as e:
+                pieces.put(e)
+
+        service._submit(slots, run)
+
+    def _settle(self):
+        """True the first time the call ends, however it ends"""
+        with self._settled:
+            if self._done:
+                return False
+            self._done = True
+            self._stopped.set()
+            return True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        try:
+            piece = self._pieces.get(timeout=self._service.deadline)
+        except queue.Empty:
+            error = LLMUnavailable('timeout')
+            if self._settle():
+                self._service._finish(self._service.deadline, error)
+            raise error
+        if piece is _DONE:
+            if self._settle():
+                self._service._finish(self._timing['slowest'])
+            raise StopIteration
+        if isinstance(piece, Exception):
+            logger.warning('LLM stream failed: %s: %s', type(piece).__name__, piece)
+            if self._settle():
+                self._service._finish(self._timing['slowest'], piece)
+            raise LLMUnavailable('error') from piece
+        return piece
+
+    def close(self):
+        """Stop reading; the backend call ends at its next piece"""
+        if self._settle():
+            # The reader gave up, which says nothing about the backend
+            self._service.breaker.release()
+
+    def __del__(self):
+        self.close()
+
+class LLMService:
+    """Bounded, deadline-limited, breaker-guarded calls to the configured model"""
+
+    def __init__(self):
+        self.backend = GeminiBackend()
+        self.breaker = CircuitBreaker()
+        self.max_workers = 8
+        self.max_queued = 32
+        self.deadline = 20
+        self.slow_call = 10
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queued)
+        self._running = 0
+        self._queued = 0
+        self.metrics = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'slow_calls': 0,
+            'rejected': 0, 'short_circuited': 0, 'cancelled': 0
+        }
+        self.last_latency = None
+
+    def init_app(self, app):
+        self.backend = make_backend(app)
+        self.breaker = CircuitBreaker(app.config['LLM_BREAKER_FAILURES'], app.config['LLM_BREAKER_COOLDOWN_SECONDS'])
+        self.max_workers = app.config['LLM_MAX_CONCURRENCY']
+        self.max_queued = app.config['LLM_MAX_QUEUED']
+        self.deadline = app.config['LLM_DEADLINE_SECONDS']
+        self.slow_call = app.config['LLM_SLOW_CALL_SECONDS']
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queued)
+
+    def _count(self, name):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def configured(self):
+        """Whether there is a model to call at all"""
+        return self.backend.configured()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm')
+            return self._executor
+
+    def _admit(self):
+        """Reserve a pool slot, or raise LLMUnavailable"""
+        if not self.configured():
+            raise LLMUnavailable('not_configured')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise LLMUnavailable('circuit_open')
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self._count('rejected')
+            self.breaker.release()
+            raise LLMUnavailable('busy')
+        with self._lock:
+            self.metrics['calls'] += 1
+            self._queued += 1
+        return slots
+
+    def _submit(self, slots, fn):
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                slots.release()
+        return self._pool().submit(run)
+
+    def _finish(self, latency, error=None):
+        self.last_latency = latency
+        if error is None and latency <= self.slow_call:
+            self._count('successes')
+            self.breaker.record_success()
+            return
+        if error is None:
+            self._count('slow_calls')
+        elif isinstance(error, LLMUnavailable) and error.reason == 'timeout':
+            self._count('timeouts')
+        else:
+            self._count('failures')
+        self.breaker.record_failure()
+
+    def generate(self, prompt):
+        """The model's answer to `prompt`; raises LLMUnavailable when there is none in time"""
+        slots = self._admit()
+        started = time.monotonic()
+        future = self._submit(slots, lambda: self.backend.generate(prompt, self.deadline))
+        try:
+            text = future.result(timeout=self.deadline)
+        except FutureTimeout:
+            error = LLMUnavailable('timeout')
+            self._finish(time.monotonic() - started, error)
+            raise error
+        except Exception as e:
+            logger.warning('LLM call failed: %s: %s', type(e).__name__, e)
+            self._finish(time.monotonic() - started, e)
+            raise LLMUnavailable('error') from e
+        self._finish(time.monotonic() - started)
+        return text
+
+    def stream(self, prompt):
+        """Iterator over the pieces of the model's answer to `prompt`.
+
+        Raises LLMUnavailable up front when the call is refused, and while
+        iterating when a piece takes longer than the deadline or the
+        backend fails. Closing the iterator, or dropping it unread, stops
+        the call at its next piece.
+        """
+        return LLMStream(self, self._admit(), prompt)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.metrics,
+                backend=self.backend.name,
+                running=self._running,
+                queued=self._queued,
+                max_workers=self.max_workers,
+                max_queued=self.max_queued,
+                breaker=self.breaker.state,
+                consecutive_failures=self.breaker.consecutive_failures,
+                last_latency=self.last_latency
+            )
+
+llm = LLMService()
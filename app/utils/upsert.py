@@ -0,0 +1,60 @@
+"""
+Dialect-aware INSERT ... ON CONFLICT helpers
+
+SQLite (3.24+) and PostgreSQL share the same upsert syntax, which SQLAlchemy
+exposes through each dialect's own insert() construct.
+"""
+
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+
+_DIALECT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert
+}
+
+def dialect_insert(model):
+    """Return an insert() for `model` that supports on_conflict_* clauses.
+
+    The statement targets the model's table, so bulk rows go straight to
+    the driver instead of through the ORM's bulk insert handling.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _DIALECT_INSERTS:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return _DIALECT_INSERTS[dialect](model.__table__)
+
+def upsert(model, rows, index_elements, update_columns=(), where=None, merge=None, returning=None):
+    """Insert rows, updating `update_columns` from the new row on conflict.
+
+    `where` and `merge` receive the insert statement, so they can refer to
+    the incoming row as `stmt.excluded`. `merge` returns extra SET
+    expressions, for columns that combine the stored and incoming values.
+    With `returning` columns, returns the rows that were inserted or
+    updated; rows skipped by `where` are left out.
+    """
+    if not rows:
+        return [] if returning else None
+    stmt = dialect_insert(model)
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    if merge is not None:
+        set_.update(merge(stmt))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_=set_,
+        where=where(stmt) if where is not None else None
+    )
+    if returning:
+        return db.session.execute(stmt.returning(*returning), rows).all()
+    db.session.execute(stmt, rows)
+
+def insert_new(model, rows, index_elements, returning):
+    """Insert rows, skipping any that conflict with a stored row.
+
+    Returns the `returning` columns of the rows actually inserted, as dicts,
+    so replayed rows can be told apart from new ones.
+    """
+    if not rows:
+        return []
+    stmt = dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    return [dict(row) for row in db.session.execute(stmt.returning(*returning), rows).mappings()]
@@ -1,143 +1,360 @@
 import requests
 import os
 from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select
 from app import db
-from app.models.weather import WeatherData, WeatherAlert
+from app.models.weather import WeatherData, WeatherForecastSlot, WeatherForecast, WeatherDailyStats, WeatherAlert
+from app.utils.cache import ResponseCache
+from app.utils.geo import cell_center, location_key, parse_cell
+from app.utils.upsert import insert_new, upsert
 
-def get_weather_data(location):
-    """Get current weather data from API and save to database"""
+# Current conditions and forecasts per location, shared by every request
+weather_cache = ResponseCache(
+    'weather',
+    ttl_setting='WEATHER_CACHE_TTL_SECONDS',
+    stale_setting='WEATHER_CACHE_STALE_SECONDS'
+)
+
+def _location_params(location):
+    """Query parameters naming a station: a cell's center, or a place name"""
+    if parse_cell(location):
+        latitude, longitude = cell_center(location)
+        return {'lat': latitude, 'lon': longitude}
+    return {'q': location}
+
+def fetch_current_weather(location):
+    """Fetch a station's current conditions from OpenWeatherMap as a dict of WeatherData fields.
+
+    The station is a grid cell or a place name. Returns mock conditions if
+    no API key is configured; raises on API errors.
+    """
     api_key = os.environ.get('WEATHER_API_KEY')
     if not api_key:
-        # Return mock data if no API key
-        return create_mock_weather_data(location)
+        return mock_weather_fields(location)
     
-    try:
-        # Using OpenWeatherMap API
-        url = f"http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            'q': location,
-            'appid': api_key,
-            'units': 'metric'
+    # Using OpenWeatherMap API
+    url = f"http://api.openweathermap.org/data/2.5/weather"
+    params = dict(
+        _location_params(location),
+        appid=api_key,
+        units='metric'
+    )
+    
+    response = requests.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    
+    return {
+        'location': location,
+        'latitude': data['coord']['lat'],
+        'longitude': data['coord']['lon'],
+        'temperature': data['main']['temp'],
+        'humidity': data['main']['humidity'],
+        'pressure': data['main']['pressure'],
+        'wind_speed': data['wind']['speed'],
+        'wind_direction': data['wind'].get('deg', 0),
+        'precipitation': data['rain'].get('1h', 0) if 'rain' in data else 0,
+        'uv_index': 0,  # Not available in basic API
+        'visibility': data.get('visibility', 0) / 1000,  # Convert to km
+        'cloud_cover': data['clouds']['all'],
+        'weather_condition': data['weather'][0]['main'].lower(),
+        'weather_description': data['weather'][0]['description'],
+        'recorded_at': datetime.utcnow().isoformat()
+    }
+
+def save_weather_data(fields):
+    """Store fetched conditions once; later calls with the same fetch reuse the row.
+
+    The unique (location, recorded_at) index lets the refresher and requests
+    save one fetch concurrently: only the save that inserts the row folds it
+    into the daily stats.
+    """
+    row = dict(fields, recorded_at=datetime.fromisoformat(fields['recorded_at']))
+    inserted = insert_new(WeatherData, [row], ['location', 'recorded_at'], [WeatherData.id])
+    if inserted:
+        update_daily_stats([daily_stats_row(row)])
+    db.session.commit()
+    
+    if inserted:
+        return db.session.get(WeatherData, inserted[0]['id'])
+    return WeatherData.query.filter_by(location=row['location'], recorded_at=row['recorded_at']).one()
+
+def daily_stats_row(fields):
+    """One observation's WeatherData fields as a WeatherDailyStats row covering just itself"""
+    return {
+        'location': fields['location'],
+        'date': fields['recorded_at'].date(),
+        'count': 1,
+        'temperature_sum': fields['temperature'],
+        'temperature_min': fields['temperature'],
+        'temperature_max': fields['temperature'],
+        'humidity_sum': fields['humidity'],
+        'precipitation_sum': fields.get('precipitation') or 0.0
+    }
+
+def _merge_daily_stats(stmt):
+    """SET expressions that fold an incoming day's totals into the stored ones"""
+    new = stmt.excluded
+    return {
+        'count': WeatherDailyStats.count + new.count,
+        'temperature_sum': WeatherDailyStats.temperature_sum + new.temperature_sum,
+        'temperature_min': case(
+            (new.temperature_min < WeatherDailyStats.temperature_min, new.temperature_min),
+            else_=WeatherDailyStats.temperature_min
+        ),
+        'temperature_max': case(
+            (new.temperature_max > WeatherDailyStats.temperature_max, new.temperature_max),
+            else_=WeatherDailyStats.temperature_max
+        ),
+        'humidity_sum': WeatherDailyStats.humidity_sum + new.humidity_sum,
+        'precipitation_sum': WeatherDailyStats.precipitation_sum + new.precipitation_sum
+    }
+
+def update_daily_stats(rows):
+    """Fold WeatherDailyStats row dicts into the stored daily totals"""
+    upsert(WeatherDailyStats, rows, index_elements=['location', 'date'], merge=_merge_daily_stats)
+
+def weather_history(location, days):
+    """Summary and per-day chart series of a location's last `days` days.
+
+    Both come from the daily rollups: the summary from one aggregate query,
+    the series as parallel lists (one entry per day with observations).
+    The summary is None when there are none.
+    """
+    start_date = (datetime.utcnow() - timedelta(days=days)).date()
+    window = (WeatherDailyStats.location == location, WeatherDailyStats.date >= start_date)
+    
+    totals = db.session.execute(
+        select(
+            func.sum(WeatherDailyStats.count),
+            func.sum(WeatherDailyStats.temperature_sum),
+            func.max(WeatherDailyStats.temperature_max),
+            func.min(WeatherDailyStats.temperature_min),
+            func.sum(WeatherDailyStats.humidity_sum),
+            func.sum(WeatherDailyStats.precipitation_sum)
+        ).where(*window)
+    ).one()
+    count, temperature_sum, temperature_max, temperature_min, humidity_sum, precipitation_sum = totals
+    stats = None
+    if count:
+        stats = {
+            'avg_temperature': temperature_sum / count,
+            'max_temperature': temperature_max,
+            'min_temperature': temperature_min,
+            'avg_humidity': humidity_sum / count,
+            'total_precipitation': precipitation_sum,
+            'data_points': count
         }
-        
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        if response.status_code == 200:
-            weather_data = WeatherData(
-                location=location,
-                latitude=data['coord']['lat'],
-                longitude=data['coord']['lon'],
-                temperature=data['main']['temp'],
-                humidity=data['main']['humidity'],
-                pressure=data['main']['pressure'],
-                wind_speed=data['wind']['speed'],
-                wind_direction=data['wind'].get('deg', 0),
-                precipitation=data['rain'].get('1h', 0) if 'rain' in data else 0,
-                uv_index=0,  # Not available in basic API
-                visibility=data.get('visibility', 0) / 1000,  # Convert to km
-                cloud_cover=data['clouds']['all'],
-                weather_condition=data['weather'][0]['main'].lower(),
-                weather_description=data['weather'][0]['description']
-            )
-            
-            db.session.add(weather_data)
-            db.session.commit()
-            
-            return weather_data
-        else:
-            return create_mock_weather_data(location)
-            
+    
+    rows = db.session.execute(
+        select(
+            WeatherDailyStats.date,
+            WeatherDailyStats.temperature_sum / WeatherDailyStats.count,
+            WeatherDailyStats.temperature_min,
+            WeatherDailyStats.temperature_max,
+            WeatherDailyStats.humidity_sum / WeatherDailyStats.count,
+            WeatherDailyStats.precipitation_sum,
+            WeatherDailyStats.count
+        ).where(*window).order_by(WeatherDailyStats.date)
+    ).all()
+    dates, avg_temperature, min_temperature, max_temperature, avg_humidity, precipitation, data_points = (
+        [list(column) for column in zip(*rows)] if rows else [[] for _ in range(7)]
+    )
+    series = {
+        'dates': [date.isoformat() for date in dates],
+        'avg_temperature': avg_temperature,
+        'min_temperature': min_temperature,
+        'max_temperature': max_temperature,
+        'avg_humidity': avg_humidity,
+        'precipitation': precipitation,
+        'data_points': data_points
+    }
+    
+    return stats, series
+
+def _current_key(location):
+    return f'current:{location_key(location)}'
+
+def _forecast_key(location):
+    return f'forecast:{location_key(location)}'
+
+def get_weather_data(location):
+    """Get current weather data, from the cache or the API, and save it to the database"""
+    try:
+        fields = weather_cache.get_or_load(_current_key(location), lambda: fetch_current_weather(location))
     except Exception as e:
         print(f"Weather API error: {e}")
         return create_mock_weather_data(location)
+    
+    return save_weather_data(fields)
 
-def get_weather_forecast(location, days=7):
-    """Get weather forecast for the next few days"""
+# Days of forecast fetched and stored per refresh (the free API stops at 5)
+FORECAST_DAYS = 7
+
+def fetch_forecast_slots(location, days=FORECAST_DAYS):
+    """Fetch 3-hourly forecast slots from OpenWeatherMap as dicts of WeatherForecastSlot fields.
+
+    Returns mock slots if no API key is configured; raises on API errors.
+    """
     api_key = os.environ.get('WEATHER_API_KEY')
     if not api_key:
-        return create_mock_forecast(location, days)
+        return mock_forecast_slots(location, days)
     
-    try:
-        url = f"http://api.openweathermap.org/data/2.5/forecast"
-        params = {
-            'q': location,
-            'appid': api_key,
-            'units': 'metric',
-            'cnt': days * 8  # 8 forecasts per day (every 3 hours)
+    url = f"http://api.openweathermap.org/data/2.5/forecast"
+    params = dict(
+        _location_params(location),
+        appid=api_key,
+        units='metric',
+        cnt=days * 8  # 8 forecasts per day (every 3 hours)
+    )
+    
+    response = requests.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    
+    return [
+        {
+            'forecast_time': datetime.utcfromtimestamp(item['dt']).isoformat(),
+            'temperature': item['main']['temp'],
+            'humidity': item['main']['humidity'],
+            'precipitation': item.get('rain', {}).get('3h', 0),
+            'weather_condition': item['weather'][0]['main'].lower(),
+            'weather_description': item['weather'][0]['description']
         }
+        for item in data['list']
+    ]
+
+def daily_forecast(slots):
+    """Roll 3-hourly slot dicts up into one WeatherForecast field dict per day"""
+    daily_data = {}
+    for slot in slots:
+        date = datetime.fromisoformat(slot['forecast_time']).date()
+        if date not in daily_data:
+            daily_data[date] = {
+                'temperatures': [],
+                'humidity': [],
+                'precipitation': 0,
+                'weather_condition': slot['weather_condition'],
+                'weather_description': slot['weather_description']
+            }
         
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        if response.status_code == 200:
-            forecast = []
-            daily_data = {}
-            
-            for item in data['list']:
-                date = datetime.fromtimestamp(item['dt']).date()
-                if date not in daily_data:
-                    daily_data[date] = {
-                        'date': date.isoformat(),
-                        'temperatures': [],
-                        'humidity': [],
-                        'precipitation': 0,
-                        'weather_condition': item['weather'][0]['main'].lower(),
-                        'weather_description': item['weather'][0]['description']
-                    }
-                
-                daily_data[date]['temperatures'].append(item['main']['temp'])
-                daily_data[date]['humidity'].append(item['main']['humidity'])
-                daily_data[date]['precipitation'] += item.get('rain', {}).get('3h', 0)
-            
-            # Calculate daily averages
-            for date, data in daily_data.items():
-                forecast.append({
-                    'date': data['date'],
-                    'temperature': {
-                        'min': min(data['temperatures']),
-                        'max': max(data['temperatures']),
-                        'avg': sum(data['temperatures']) / len(data['temperatures'])
-                    },
-                    'humidity': sum(data['humidity']) / len(data['humidity']),
-                    'precipitation': data['precipitation'],
-                    'weather_condition': data['weather_condition'],
-                    'weather_description': data['weather_description']
-                })
-            
-            return forecast
-        else:
+        daily_data[date]['temperatures'].append(slot['temperature'])
+        daily_data[date]['humidity'].append(slot['humidity'])
+        daily_data[date]['precipitation'] += slot['precipitation']
+    
+    return [
+        {
+            'forecast_date': date,
+            'temp_min': min(data['temperatures']),
+            'temp_max': max(data['temperatures']),
+            'temp_avg': sum(data['temperatures']) / len(data['temperatures']),
+            'humidity': sum(data['humidity']) / len(data['humidity']),
+            'precipitation': data['precipitation'],
+            'weather_condition': data['weather_condition'],
+            'weather_description': data['weather_description']
+        }
+        for date, data in sorted(daily_data.items())
+    ]
+
+def store_forecast(location, slots):
+    """Upsert a refresh's slots and their daily rollups for a location, and commit"""
+    now = datetime.utcnow()
+    slot_rows = [
+        dict(slot, location=location, forecast_time=datetime.fromisoformat(slot['forecast_time']), fetched_at=now)
+        for slot in slots
+    ]
+    upsert(
+        WeatherForecastSlot, slot_rows,
+        index_elements=['location', 'forecast_time'],
+        update_columns=['temperature', 'humidity', 'precipitation', 'weather_condition', 'weather_description', 'fetched_at']
+    )
+    upsert(
+        WeatherForecast,
+        [dict(day, location=location, fetched_at=now) for day in daily_forecast(slots)],
+        index_elements=['location', 'forecast_date'],
+        update_columns=[
+            'temp_min', 'temp_max', 'temp_avg', 'humidity', 'precipitation',
+            'weather_condition', 'weather_description', 'fetched_at'
+        ]
+    )
+    db.session.commit()
+
+def stored_forecast(location, days=7):
+    """Up to `days` stored forecast days from today on, in one indexed query"""
+    return WeatherForecast.query.filter(
+        WeatherForecast.location == location,
+        WeatherForecast.forecast_date >= datetime.utcnow().date()
+    ).order_by(WeatherForecast.forecast_date).limit(days).all()
+
+def refresh_forecast(location):
+    """Fetch (coalesced with concurrent refreshes) and store a location's forecast"""
+    slots = weather_cache.refresh(
+        _forecast_key(location),
+        lambda: fetch_forecast_slots(location),
+        ttl=current_app.config['WEATHER_FORECAST_TTL_SECONDS']
+    )
+    store_forecast(location, slots)
+
+def get_weather_forecast(location, days=7):
+    """Get weather forecast for the next few days.
+
+    Served from the stored forecast; a location with none is fetched once.
+    """
+    forecast = stored_forecast(location, days)
+    if not forecast:
+        try:
+            slots = weather_cache.get_or_load(
+                _forecast_key(location),
+                lambda: fetch_forecast_slots(location),
+                ttl=current_app.config['WEATHER_FORECAST_TTL_SECONDS']
+            )
+            store_forecast(location, slots)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Weather forecast API error: {e}")
             return create_mock_forecast(location, days)
-            
-    except Exception as e:
-        print(f"Weather forecast API error: {e}")
-        return create_mock_forecast(location, days)
+        forecast = stored_forecast(location, days)
+    
+    return [day.to_dict() for day in forecast]
 
-def create_mock_weather_data(location):
-    """Create mock weather data for testing"""
+def refresh_weather(location):
+    """Fetch current conditions and the forecast for a location ahead of requests.
+
+    Updates the cache and stores both; raises on API errors, so the cached
+    values are kept.
+    """
+    fields = weather_cache.refresh(_current_key(location), lambda: fetch_current_weather(location))
+    save_weather_data(fields)
+    refresh_forecast(location)
+
+def mock_weather_fields(location):
+    """Random WeatherData fields for testing"""
     import random
     
-    weather_data = WeatherData(
-        location=location,
-        latitude=36.8065 + random.uniform(-0.1, 0.1),  # Tunisia coordinates
-        longitude=10.1815 + random.uniform(-0.1, 0.1),
-        temperature=random.uniform(15, 35),
-        humidity=random.uniform(30, 80),
-        pressure=random.uniform(1000, 1020),
-        wind_speed=random.uniform(0, 15),
-        wind_direction=random.uniform(0, 360),
-        precipitation=random.uniform(0, 5),
-        uv_index=random.uniform(0, 10),
-        visibility=random.uniform(5, 15),
-        cloud_cover=random.uniform(0, 100),
-        weather_condition=random.choice(['clear', 'cloudy', 'rain', 'sunny']),
-        weather_description=random.choice(['Clear sky', 'Partly cloudy', 'Light rain', 'Sunny'])
-    )
-    
-    db.session.add(weather_data)
-    db.session.commit()
+    latitude, longitude = cell_center(location) if parse_cell(location) else (36.8065, 10.1815)  # Tunisia coordinates
     
-    return weather_data
+    return {
+        'location': location,
+        'latitude': latitude + random.uniform(-0.1, 0.1),
+        'longitude': longitude + random.uniform(-0.1, 0.1),
+        'temperature': random.uniform(15, 35),
+        'humidity': random.uniform(30, 80),
+        'pressure': random.uniform(1000, 1020),
+        'wind_speed': random.uniform(0, 15),
+        'wind_direction': random.uniform(0, 360),
+        'precipitation': random.uniform(0, 5),
+        'uv_index': random.uniform(0, 10),
+        'visibility': random.uniform(5, 15),
+        'cloud_cover': random.uniform(0, 100),
+        'weather_condition': random.choice(['clear', 'cloudy', 'rain', 'sunny']),
+        'weather_description': random.choice(['Clear sky', 'Partly cloudy', 'Light rain', 'Sunny']),
+        'recorded_at': datetime.utcnow().isoformat()
+    }
+
+def create_mock_weather_data(location):
+    """Create mock weather data for testing"""
+    return save_weather_data(mock_weather_fields(location))
 
 def create_mock_forecast(location, days):
     """Create mock weather forecast for testing"""
@@ -167,6 +384,29 @@ def create_mock_forecast(location, days):
     
     return forecast
 
+def mock_forecast_slots(location, days):
+    """Random 3-hourly forecast slots for testing, starting at the next slot"""
+    import random
+    
+    now = datetime.utcnow()
+    first = now.replace(hour=now.hour // 3 * 3, minute=0, second=0, microsecond=0) + timedelta(hours=3)
+    condition = random.choice(['clear', 'cloudy', 'rain', 'sunny'])
+    slots = []
+    for i in range(days * 8):
+        forecast_time = first + timedelta(hours=3 * i)
+        if forecast_time.hour == 0:
+            condition = random.choice(['clear', 'cloudy', 'rain', 'sunny'])
+        slots.append({
+            'forecast_time': forecast_time.isoformat(),
+            'temperature': round(random.uniform(10, 35), 1),
+            'humidity': round(random.uniform(30, 80), 1),
+            'precipitation': round(random.uniform(0, 2), 1) if condition == 'rain' else 0,
+            'weather_condition': condition,
+            'weather_description': condition.capitalize()
+        })
+    
+    return slots
+
 def check_weather_alerts(location):
     """Check for weather alerts and create them if needed"""
     weather_data = WeatherData.query.filter_by(location=location).order_by(WeatherData.recorded_at.desc()).first()
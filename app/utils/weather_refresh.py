@@ -0,0 +1,127 @@
+"""
+Background weather refresher for AgriConnect
+
+Keeps current conditions and forecasts for the locations people actually
+look at up to date, so weather pages and APIs only read local data. The
+active set is the weather station (see app.utils.geo) of every user's
+profile location plus stations requested in the last
+WEATHER_ACTIVE_LOCATION_HOURS, capped at WEATHER_MAX_TRACKED_LOCATIONS.
+Every WEATHER_REFRESH_INTERVAL_SECONDS a scheduler thread fetches them all
+through a pool of WEATHER_REFRESH_WORKERS threads.
+
+The scheduler starts on the first tracked request. Recently requested
+locations are per process; profile locations come from the database.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models.user import User
+from app.utils.geo import location_key, weather_station
+from app.utils.weather import refresh_weather
+
+class WeatherRefresher:
+    """Recently requested locations plus a scheduler thread refreshing them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._app = None
+        self._thread = None
+        self._executor = None
+        self.last_run = None
+
+    def track(self, location):
+        """Note a requested location and make sure the scheduler is running"""
+        location = (location or '').strip()
+        if location:
+            limit = current_app.config['WEATHER_MAX_TRACKED_LOCATIONS']
+            key = location_key(location)
+            with self._lock:
+                # Keep the first spelling seen, which the cached weather uses too
+                spelling = self._recent[key][0] if key in self._recent else location
+                self._recent[key] = (spelling, time.monotonic())
+                self._recent.move_to_end(key)
+                while len(self._recent) > limit:
+                    self._recent.popitem(last=False)
+        self.start(current_app._get_current_object())
+
+    def active_locations(self):
+        """Locations to refresh, one spelling per location"""
+        max_age = current_app.config['WEATHER_ACTIVE_LOCATION_HOURS'] * 3600
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, seen) in self._recent.items() if now - seen > max_age]:
+                del self._recent[key]
+            locations = {key: location for key, (location, _) in self._recent.items()}
+
+        profile_locations = db.session.execute(
+            select(User.location).where(User.location.isnot(None), User.is_active.is_(True)).distinct()
+        ).scalars()
+        for location in profile_locations:
+            station = weather_station(location)
+            if station:
+                locations.setdefault(location_key(station), station)
+        return list(locations.values())
+
+    def _refresh_one(self, app, location):
+        with app.app_context():
+            try:
+                refresh_weather(location)
+                return True
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Weather refresh failed for %s', location)
+                return False
+            finally:
+                db.session.remove()
+
+    def refresh_all(self):
+        """Refresh every active location in parallel; returns (refreshed, failed)"""
+        app = current_app._get_current_object()
+        locations = self.active_locations()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=app.config['WEATHER_REFRESH_WORKERS'],
+                thread_name_prefix='weather-refresh'
+            )
+        results = list(self._executor.map(lambda location: self._refresh_one(app, location), locations))
+        self.last_run = time.time()
+        return results.count(True), results.count(False)
+
+    def start(self, app):
+        """Start the scheduler thread once per process"""
+        if self._thread is not None or not app.config['WEATHER_REFRESHER']:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='weather-refresher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        app = self._app
+        while True:
+            with app.app_context():
+                try:
+                    self.refresh_all()
+                except Exception:
+                    app.logger.exception('Weather refresh cycle failed')
+                finally:
+                    db.session.remove()
+            time.sleep(app.config['WEATHER_REFRESH_INTERVAL_SECONDS'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'recent_locations': len(self._recent),
+                'last_run': self.last_run,
+                'scheduler_running': self._thread is not None and self._thread.is_alive()
+            }
+
+weather_refresher = WeatherRefresher()
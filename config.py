@@ -19,12 +19,105 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # IoT ingestion configuration
+    IOT_MAX_BATCH_SIZE = int(os.environ.get('IOT_MAX_BATCH_SIZE') or 5000)
+    IOT_DEVICE_CACHE_SIZE = int(os.environ.get('IOT_DEVICE_CACHE_SIZE') or 10000)
+    IOT_STREAM_BATCH_SIZE = int(os.environ.get('IOT_STREAM_BATCH_SIZE') or 500)
+    IOT_STREAM_FLUSH_SECONDS = float(os.environ.get('IOT_STREAM_FLUSH_SECONDS') or 1.0)
+    IOT_LIVE_QUEUE_SIZE = int(os.environ.get('IOT_LIVE_QUEUE_SIZE') or 100)
+    IOT_LIVE_KEEPALIVE_SECONDS = int(os.environ.get('IOT_LIVE_KEEPALIVE_SECONDS') or 15)
+    IOT_LIVE_MAX_SUBSCRIBERS = int(os.environ.get('IOT_LIVE_MAX_SUBSCRIBERS') or 16)
+    
+    # Device liveness: offline after this long without readings; last_seen
+    # writes are batched and the sweeper runs every interval
+    IOT_DEVICE_OFFLINE_SECONDS = int(os.environ.get('IOT_DEVICE_OFFLINE_SECONDS') or 300)
+    IOT_LIVENESS_INTERVAL_SECONDS = int(os.environ.get('IOT_LIVENESS_INTERVAL_SECONDS') or 30)
+    IOT_LIVENESS_SWEEPER = os.environ.get('IOT_LIVENESS_SWEEPER', 'true').lower() in ['true', 'on', '1']
+    
+    # Actuator command long-polling
+    IOT_COMMAND_POLL_TIMEOUT = int(os.environ.get('IOT_COMMAND_POLL_TIMEOUT') or 25)
+    IOT_COMMAND_RECHECK_SECONDS = int(os.environ.get('IOT_COMMAND_RECHECK_SECONDS') or 60)
+    
+    # Alert rules evaluated on ingest
+    IOT_ALERTS_ENABLED = os.environ.get('IOT_ALERTS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    IOT_ALERT_WINDOW_SIZE = int(os.environ.get('IOT_ALERT_WINDOW_SIZE') or 60)
+    IOT_ALERT_MIN_SAMPLES = int(os.environ.get('IOT_ALERT_MIN_SAMPLES') or 10)
+    IOT_ALERT_RULES_RELOAD_SECONDS = int(os.environ.get('IOT_ALERT_RULES_RELOAD_SECONDS') or 30)
+    
+    # IoT history retention in days per storage tier (0 keeps forever)
+    IOT_RAW_RETENTION_DAYS = int(os.environ.get('IOT_RAW_RETENTION_DAYS') or 30)
+    IOT_MINUTE_RETENTION_DAYS = int(os.environ.get('IOT_MINUTE_RETENTION_DAYS') or 90)
+    IOT_HOURLY_RETENTION_DAYS = int(os.environ.get('IOT_HOURLY_RETENTION_DAYS') or 730)
+    IOT_DAILY_RETENTION_DAYS = int(os.environ.get('IOT_DAILY_RETENTION_DAYS') or 0)
+    
+    # Columnar archive of closed IoT history windows
+    IOT_ARCHIVE_ENABLED = os.environ.get('IOT_ARCHIVE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    IOT_ARCHIVE_DIR = os.environ.get('IOT_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'iot_archive')
+    IOT_ARCHIVE_DELAY_HOURS = int(os.environ.get('IOT_ARCHIVE_DELAY_HOURS') or 2)
+    
+    # Resampled multi-device series (/api/iot/series)
+    IOT_SERIES_MAX_DEVICES = int(os.environ.get('IOT_SERIES_MAX_DEVICES') or 20)
+    IOT_SERIES_MAX_BUCKETS = int(os.environ.get('IOT_SERIES_MAX_BUCKETS') or 5000)
+    IOT_SERIES_DEFAULT_POINTS = int(os.environ.get('IOT_SERIES_DEFAULT_POINTS') or 500)
+    
     # API Keys
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY')
     
     # Redis configuration
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # Shared cache for upstream API responses: 'memory' (per process) or 'redis'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 1024)
+    
+    # Weather responses are fresh for the TTL, then served stale while refreshed
+    WEATHER_CACHE_TTL_SECONDS = int(os.environ.get('WEATHER_CACHE_TTL_SECONDS') or 600)
+    WEATHER_FORECAST_TTL_SECONDS = int(os.environ.get('WEATHER_FORECAST_TTL_SECONDS') or 3600)
+    WEATHER_CACHE_STALE_SECONDS = int(os.environ.get('WEATHER_CACHE_STALE_SECONDS') or 3600)
+    
+    # Background refresh of the weather locations users look at
+    WEATHER_REFRESHER = os.environ.get('WEATHER_REFRESHER', 'true').lower() in ['true', 'on', '1']
+    WEATHER_REFRESH_INTERVAL_SECONDS = int(os.environ.get('WEATHER_REFRESH_INTERVAL_SECONDS') or 600)
+    WEATHER_REFRESH_WORKERS = int(os.environ.get('WEATHER_REFRESH_WORKERS') or 4)
+    WEATHER_ACTIVE_LOCATION_HOURS = int(os.environ.get('WEATHER_ACTIVE_LOCATION_HOURS') or 24)
+    WEATHER_MAX_TRACKED_LOCATIONS = int(os.environ.get('WEATHER_MAX_TRACKED_LOCATIONS') or 500)
+    
+    # Nearby locations share weather per grid cell of WEATHER_GRID_DEGREES
+    WEATHER_GRID_DEGREES = float(os.environ.get('WEATHER_GRID_DEGREES') or 0.1)
+    GEOCODE_RETRY_HOURS = int(os.environ.get('GEOCODE_RETRY_HOURS') or 24)
+    
+    # Gemini is initialized on first use (or by a warm-up thread), never at startup
+    GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL')
+    GEMINI_WARMUP = os.environ.get('GEMINI_WARMUP', 'true').lower() in ['true', 'on', '1']
+    GEMINI_MODEL_CACHE_FILE = os.environ.get('GEMINI_MODEL_CACHE_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'gemini_model.json')
+    GEMINI_MODEL_CACHE_TTL_SECONDS = int(os.environ.get('GEMINI_MODEL_CACHE_TTL_SECONDS') or 86400)
+    GEMINI_RETRY_SECONDS = int(os.environ.get('GEMINI_RETRY_SECONDS') or 300)
+    
+    # Chatbot answers reused for the same or a similar question (cosine similarity)
+    CHAT_CACHE_ENABLED = os.environ.get('CHAT_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES') or 2000)
+    CHAT_CACHE_TTL_SECONDS = int(os.environ.get('CHAT_CACHE_TTL_SECONDS') or 86400)
+    CHAT_CACHE_SIMILARITY = float(os.environ.get('CHAT_CACHE_SIMILARITY') or 0.85)
+    
+    # Recent turns and a rolling summary per chat session, fitted into each prompt's token budget
+    CHAT_CONTEXT_ENABLED = os.environ.get('CHAT_CONTEXT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    CHAT_CONTEXT_TURNS = int(os.environ.get('CHAT_CONTEXT_TURNS') or 6)
+    CHAT_CONTEXT_TOKEN_BUDGET = int(os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET') or 2000)
+    CHAT_CONTEXT_SUMMARY_TOKENS = int(os.environ.get('CHAT_CONTEXT_SUMMARY_TOKENS') or 300)
+    CHAT_CONTEXT_MAX_SESSIONS = int(os.environ.get('CHAT_CONTEXT_MAX_SESSIONS') or 5000)
+    CHAT_CONTEXT_TTL_SECONDS = int(os.environ.get('CHAT_CONTEXT_TTL_SECONDS') or 86400)
+    
+    # LLM calls run on a bounded pool with a deadline and a circuit breaker (see app.utils.llm)
+    LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini').lower()
+    LLM_HTTP_URL = os.environ.get('LLM_HTTP_URL')
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY') or 8)
+    LLM_MAX_QUEUED = int(os.environ.get('LLM_MAX_QUEUED') or 32)
+    LLM_DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS') or 20)
+    LLM_SLOW_CALL_SECONDS = float(os.environ.get('LLM_SLOW_CALL_SECONDS') or 10)
+    LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES') or 5)
+    LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS') or 30)
 
 class DevelopmentConfig(Config):
     DEBUG = True
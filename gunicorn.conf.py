@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for AgriConnect
+
+The live IoT feed (/iot/api/live), actuator command long-polls and streamed
+ingestion hold their request open for a long time. Gunicorn's default sync
+worker serves one request at a time, so a single open feed would stall the
+whole worker. Each worker here serves requests on GUNICORN_THREADS threads,
+and the app caps live feeds at IOT_LIVE_MAX_SUBSCRIBERS per process, which
+must stay well below that.
+
+Run more than one worker (GUNICORN_WORKERS) only with CACHE_BACKEND=redis,
+so every worker's live feed sees readings ingested by the others.
+
+Usage:
+    gunicorn --config gunicorn.conf.py run:app
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or 1)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 32)
@@ -0,0 +1,51 @@
+"""Unique IoT device per MAC address and sensor type
+
+Revision ID: 39ec4b45728f
+Revises: 449034b2f340
+Create Date: 2026-10-16 09:12:41.208113
+
+NULLs never collide in a unique constraint, so (mac_address, sensor_type)
+alone would let a gateway collect several base devices (sensor_type NULL);
+a partial index keeps one base device per MAC address.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '39ec4b45728f'
+down_revision = '449034b2f340'
+branch_labels = None
+depends_on = None
+
+# SQLite creates the original UNIQUE(mac_address) constraint without a name,
+# so give it one while the table is being rebuilt in batch mode
+naming_convention = {
+    'uq': 'uq_%(table_name)s_%(column_0_name)s',
+}
+
+
+def _mac_constraint_name():
+    if op.get_bind().dialect.name == 'postgresql':
+        return 'iot_devices_mac_address_key'
+    return 'uq_iot_devices_mac_address'
+
+
+_BASE_DEVICE = sa.text('sensor_type IS NULL')
+
+
+def upgrade():
+    with op.batch_alter_table('iot_devices', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(_mac_constraint_name(), type_='unique')
+        batch_op.create_unique_constraint('uq_iot_devices_mac_sensor', ['mac_address', 'sensor_type'])
+
+    op.create_index('uq_iot_devices_mac_base', 'iot_devices', ['mac_address'], unique=True,
+                    sqlite_where=_BASE_DEVICE, postgresql_where=_BASE_DEVICE)
+
+
+def downgrade():
+    op.drop_index('uq_iot_devices_mac_base', table_name='iot_devices')
+    with op.batch_alter_table('iot_devices', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_iot_devices_mac_sensor', type_='unique')
+        batch_op.create_unique_constraint(_mac_constraint_name(), ['mac_address'])
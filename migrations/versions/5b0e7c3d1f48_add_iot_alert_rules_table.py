@@ -0,0 +1,38 @@
+"""Add iot_alert_rules table
+
+Revision ID: 5b0e7c3d1f48
+Revises: e81b5f0c2a94
+Create Date: 2026-10-16 23:02:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7c3d1f48'
+down_revision = 'e81b5f0c2a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('iot_alert_rules',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=True),
+    sa.Column('max_value', sa.Float(), nullable=True),
+    sa.Column('max_rate', sa.Float(), nullable=True),
+    sa.Column('zscore_threshold', sa.Float(), nullable=True),
+    sa.Column('severity', sa.Enum('low', 'medium', 'high', 'critical'), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['device_id'], ['iot_devices.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('device_id')
+    )
+
+
+def downgrade():
+    op.drop_table('iot_alert_rules')
@@ -0,0 +1,37 @@
+"""Unique IoT reading per device and timestamp
+
+Revision ID: 9c4e1a7b3d25
+Revises: 5b0e7c3d1f48
+Create Date: 2026-10-17 09:41:12.503318
+
+The unique index replaces ix_iot_data_device_timestamp, which covered the
+same columns. Duplicate readings already stored are removed first, keeping
+the earliest row of each pair.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1a7b3d25'
+down_revision = '5b0e7c3d1f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        'DELETE FROM iot_data WHERE timestamp IS NOT NULL AND id NOT IN ('
+        'SELECT MIN(id) FROM iot_data WHERE timestamp IS NOT NULL GROUP BY device_id, timestamp)'
+    )
+
+    with op.batch_alter_table('iot_data', schema=None) as batch_op:
+        batch_op.drop_index('ix_iot_data_device_timestamp')
+        batch_op.create_index('uq_iot_data_device_timestamp', ['device_id', 'timestamp'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('iot_data', schema=None) as batch_op:
+        batch_op.drop_index('uq_iot_data_device_timestamp')
+        batch_op.create_index('ix_iot_data_device_timestamp', ['device_id', sa.text('timestamp DESC')], unique=False)
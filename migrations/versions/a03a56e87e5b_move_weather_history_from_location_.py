@@ -0,0 +1,168 @@
+"""Move weather history from location names to cells
+
+Revision ID: a03a56e87e5b
+Revises: 2112a915f3d8
+Create Date: 2026-10-16 23:48:22.368109
+
+Observations and daily stats stored before 92b3bba80f73 are keyed by the
+typed location name, while weather is now read per grid cell. Every name
+is resolved the way app.utils.geo does it without the geocoder ("lat,lon"
+strings, then geocoded_locations, then land and device coordinates, then
+the name's newest observation), remembered in geocoded_locations, and its
+rows are moved to the cell, merging daily stats that already exist there.
+Names that cannot be resolved keep their rows. The move is not undone on
+downgrade.
+
+"""
+import math
+import re
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'a03a56e87e5b'
+down_revision = '2112a915f3d8'
+branch_labels = None
+depends_on = None
+
+_COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def _cell(latitude, longitude, size):
+    row = math.floor(round(latitude / size, 9))
+    col = math.floor(round(longitude / size, 9))
+    return f'cell:{size:g}:{row}:{col}'
+
+
+def _coordinates(conn, name, key):
+    match = _COORDINATES.match(name)
+    if match:
+        latitude, longitude = float(match.group(1)), float(match.group(2))
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return (latitude, longitude), None
+
+    stored = conn.execute(
+        sa.text('SELECT latitude, longitude FROM geocoded_locations WHERE location_key = :key'),
+        {'key': key}
+    ).first()
+    if stored is not None and stored[0] is not None:
+        return tuple(stored), None
+
+    for table in ('lands', 'iot_devices'):
+        latitude, longitude = conn.execute(
+            sa.text(
+                f'SELECT AVG(latitude), AVG(longitude) FROM {table} '
+                'WHERE lower(trim(location)) = :key AND latitude IS NOT NULL AND longitude IS NOT NULL'
+            ),
+            {'key': key}
+        ).one()
+        if latitude is not None:
+            return (latitude, longitude), 'local'
+
+    newest = conn.execute(
+        sa.text(
+            'SELECT latitude, longitude FROM weather_data WHERE lower(trim(location)) = :key '
+            'ORDER BY recorded_at DESC LIMIT 1'
+        ),
+        {'key': key}
+    ).first()
+    return (tuple(newest), 'local') if newest else (None, None)
+
+
+def _remember(conn, key, coordinates, source):
+    values = {
+        'key': key, 'latitude': coordinates[0], 'longitude': coordinates[1],
+        'source': source, 'resolved_at': datetime.utcnow()
+    }
+    updated = conn.execute(
+        sa.text(
+            'UPDATE geocoded_locations SET latitude = :latitude, longitude = :longitude, '
+            'source = :source, resolved_at = :resolved_at WHERE location_key = :key'
+        ),
+        values
+    )
+    if updated.rowcount == 0:
+        conn.execute(
+            sa.text(
+                'INSERT INTO geocoded_locations (location_key, latitude, longitude, source, resolved_at) '
+                'VALUES (:key, :latitude, :longitude, :source, :resolved_at)'
+            ),
+            values
+        )
+
+
+def _move_daily_stats(conn, name, cell):
+    rows = conn.execute(
+        sa.text('SELECT * FROM weather_daily_stats WHERE location = :name'),
+        {'name': name}
+    ).mappings().all()
+    for row in rows:
+        existing = conn.execute(
+            sa.text('SELECT * FROM weather_daily_stats WHERE location = :cell AND date = :date'),
+            {'cell': cell, 'date': row['date']}
+        ).mappings().first()
+        if existing is None:
+            conn.execute(
+                sa.text('UPDATE weather_daily_stats SET location = :cell WHERE id = :id'),
+                {'cell': cell, 'id': row['id']}
+            )
+            continue
+        conn.execute(
+            sa.text(
+                'UPDATE weather_daily_stats SET count = :count, temperature_sum = :temperature_sum, '
+                'temperature_min = :temperature_min, temperature_max = :temperature_max, '
+                'humidity_sum = :humidity_sum, precipitation_sum = :precipitation_sum WHERE id = :id'
+            ),
+            {
+                'id': existing['id'],
+                'count': existing['count'] + row['count'],
+                'temperature_sum': existing['temperature_sum'] + row['temperature_sum'],
+                'temperature_min': min(existing['temperature_min'], row['temperature_min']),
+                'temperature_max': max(existing['temperature_max'], row['temperature_max']),
+                'humidity_sum': existing['humidity_sum'] + row['humidity_sum'],
+                'precipitation_sum': existing['precipitation_sum'] + row['precipitation_sum']
+            }
+        )
+        conn.execute(sa.text('DELETE FROM weather_daily_stats WHERE id = :id'), {'id': row['id']})
+
+
+def upgrade():
+    conn = op.get_bind()
+    size = current_app.config['WEATHER_GRID_DEGREES']
+    names = conn.execute(sa.text(
+        "SELECT location FROM weather_data WHERE location NOT LIKE 'cell:%' "
+        "UNION SELECT location FROM weather_daily_stats WHERE location NOT LIKE 'cell:%'"
+    )).scalars().all()
+
+    for name in names:
+        key = ' '.join(name.lower().split())
+        if not key:
+            continue
+        coordinates, source = _coordinates(conn, name, key)
+        if coordinates is None:
+            continue
+        if source is not None:
+            _remember(conn, key, coordinates, source)
+        cell = _cell(coordinates[0], coordinates[1], size)
+
+        # The unique (location, recorded_at) index allows one row per fetch
+        conn.execute(
+            sa.text(
+                'DELETE FROM weather_data WHERE location = :name AND recorded_at IN '
+                '(SELECT recorded_at FROM weather_data WHERE location = :cell)'
+            ),
+            {'name': name, 'cell': cell}
+        )
+        conn.execute(
+            sa.text('UPDATE weather_data SET location = :cell WHERE location = :name'),
+            {'name': name, 'cell': cell}
+        )
+        _move_daily_stats(conn, name, cell)
+
+
+def downgrade():
+    # Rows moved to a cell cannot be told apart from ones stored there
+    pass
@@ -0,0 +1,33 @@
+"""Add iot_latest_readings table
+
+Revision ID: a7d2c91e4b60
+Revises: 39ec4b45728f
+Create Date: 2026-10-16 10:04:17.552301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2c91e4b60'
+down_revision = '39ec4b45728f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('iot_latest_readings',
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.Column('unit', sa.String(length=20), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('quality_score', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['iot_devices.id'], ),
+    sa.PrimaryKeyConstraint('device_id')
+    )
+
+
+def downgrade():
+    op.drop_table('iot_latest_readings')
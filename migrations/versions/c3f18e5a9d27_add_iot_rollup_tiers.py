@@ -0,0 +1,38 @@
+"""Add 1-minute, 1-hour and 1-day IoT rollup tiers
+
+Revision ID: c3f18e5a9d27
+Revises: a7d2c91e4b60
+Create Date: 2026-10-16 11:20:53.017744
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f18e5a9d27'
+down_revision = 'a7d2c91e4b60'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ['iot_data_1m', 'iot_data_1h', 'iot_data_1d']
+
+
+def upgrade():
+    for table_name in ROLLUP_TABLES:
+        op.create_table(table_name,
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('min_value', sa.Float(), nullable=False),
+        sa.Column('max_value', sa.Float(), nullable=False),
+        sa.Column('avg_value', sa.Float(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('avg_quality', sa.Float(), nullable=True),
+        sa.Column('device_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['device_id'], ['iot_devices.id'], ),
+        sa.PrimaryKeyConstraint('device_id', 'bucket_start')
+        )
+
+
+def downgrade():
+    for table_name in reversed(ROLLUP_TABLES):
+        op.drop_table(table_name)
@@ -0,0 +1,47 @@
+"""Add composite indexes for hot IoT queries
+
+Revision ID: e81b5f0c2a94
+Revises: c3f18e5a9d27
+Create Date: 2026-10-16 13:02:36.870125
+
+iot_devices(mac_address, sensor_type) is already served by the
+uq_iot_devices_mac_sensor unique constraint from 39ec4b45728f.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b5f0c2a94'
+down_revision = 'c3f18e5a9d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('iot_data', schema=None) as batch_op:
+        batch_op.create_index('ix_iot_data_device_timestamp', ['device_id', sa.text('timestamp DESC')], unique=False)
+
+    with op.batch_alter_table('iot_devices', schema=None) as batch_op:
+        batch_op.create_index('ix_iot_devices_owner_sensor', ['owner_id', 'sensor_type'], unique=False)
+
+    with op.batch_alter_table('iot_alerts', schema=None) as batch_op:
+        batch_op.create_index('ix_iot_alerts_device_resolved_created', ['device_id', 'is_resolved', 'created_at'], unique=False)
+
+    with op.batch_alter_table('iot_commands', schema=None) as batch_op:
+        batch_op.create_index('ix_iot_commands_device_created', ['device_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('iot_commands', schema=None) as batch_op:
+        batch_op.drop_index('ix_iot_commands_device_created')
+
+    with op.batch_alter_table('iot_alerts', schema=None) as batch_op:
+        batch_op.drop_index('ix_iot_alerts_device_resolved_created')
+
+    with op.batch_alter_table('iot_devices', schema=None) as batch_op:
+        batch_op.drop_index('ix_iot_devices_owner_sensor')
+
+    with op.batch_alter_table('iot_data', schema=None) as batch_op:
+        batch_op.drop_index('ix_iot_data_device_timestamp')
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Backfill iot_latest_readings from existing iot_data history.
+
+Picks the newest IoTData row per device with a single windowed query and
+upserts it, so it is safe to re-run at any time.
+
+Usage:
+    python scripts/backfill_iot_latest.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select
+from app import create_app, db
+from app.models.iot import IoTData
+from app.utils.iot_ingest import update_latest_readings
+
+
+def backfill_latest_readings():
+    """Upsert the newest reading of every device; returns the device count"""
+    ranked = select(
+        IoTData.device_id,
+        IoTData.value,
+        IoTData.unit,
+        IoTData.timestamp,
+        IoTData.quality_score,
+        func.row_number().over(
+            partition_by=IoTData.device_id,
+            order_by=(IoTData.timestamp.desc(), IoTData.id.desc())
+        ).label('rn')
+    ).subquery()
+
+    rows = db.session.execute(
+        select(
+            ranked.c.device_id,
+            ranked.c.value,
+            ranked.c.unit,
+            ranked.c.timestamp,
+            ranked.c.quality_score
+        ).where(ranked.c.rn == 1)
+    ).mappings().all()
+
+    update_latest_readings([dict(row) for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        print("Backfilling latest IoT readings...")
+        count = backfill_latest_readings()
+        print(f"✓ Latest reading stored for {count} devices")
+
+
+if __name__ == '__main__':
+    main()
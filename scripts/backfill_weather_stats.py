@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Backfill weather_daily_stats from existing weather_data observations.
+
+Totals every (location, day) with a single grouped query and overwrites
+the stored rollups with them, so it is safe to re-run at any time.
+
+Usage:
+    python scripts/backfill_weather_stats.py
+"""
+
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select
+from app import create_app, db
+from app.models.weather import WeatherData, WeatherDailyStats
+from app.utils.upsert import upsert
+
+
+def backfill_daily_stats():
+    """Recompute the daily totals of every location; returns the day count"""
+    day = func.date(WeatherData.recorded_at)
+    rows = db.session.execute(
+        select(
+            WeatherData.location,
+            day.label('date'),
+            func.count(WeatherData.id).label('count'),
+            func.sum(WeatherData.temperature).label('temperature_sum'),
+            func.min(WeatherData.temperature).label('temperature_min'),
+            func.max(WeatherData.temperature).label('temperature_max'),
+            func.sum(WeatherData.humidity).label('humidity_sum'),
+            func.coalesce(func.sum(WeatherData.precipitation), 0.0).label('precipitation_sum')
+        )
+        .where(WeatherData.recorded_at.isnot(None))
+        .group_by(WeatherData.location, day)
+    ).mappings().all()
+
+    # SQLite returns date() as text
+    rows = [dict(row, date=date.fromisoformat(str(row['date']))) for row in rows]
+    upsert(
+        WeatherDailyStats, rows,
+        index_elements=['location', 'date'],
+        update_columns=[
+            'count', 'temperature_sum', 'temperature_min', 'temperature_max',
+            'humidity_sum', 'precipitation_sum'
+        ]
+    )
+    db.session.commit()
+    return len(rows)
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        print("Backfilling daily weather statistics...")
+        count = backfill_daily_stats()
+        print(f"✓ Daily statistics stored for {count} location days")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark IoT ingestion throughput.
+
+Compares the per-request /iot/api/data path against /iot/api/data/batch
+(JSON and binary frames) and the NDJSON /iot/api/data/stream channel on a
+throwaway SQLite database, using Flask's test client so no server
+is needed.
+
+Usage:
+    python scripts/bench_iot_ingest.py [--gateways 200] [--rounds 5] [--batch-size 500]
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_payloads(gateways, rounds):
+    """Generate `rounds` readings for each of `gateways` gateways"""
+    payloads = []
+    for _ in range(rounds):
+        for i in range(gateways):
+            payloads.append({
+                'mac_address': f"AA:BB:CC:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}",
+                'temp': round(random.uniform(18, 35), 1),
+                'humidity': round(random.uniform(30, 90), 1),
+                'soil': random.randint(1500, 2300)
+            })
+    return payloads
+
+
+def fresh_app(db_path):
+    """Create an app bound to an empty database with one owner user"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+
+    from app import create_app, db
+    from app.models.user import User
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', first_name='Bench',
+                    last_name='User', user_type='farmer')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def count_rows(app):
+    from app import db
+    from app.models.iot import IoTData
+
+    with app.app_context():
+        return db.session.query(IoTData).count()
+
+
+def bench_single(app, payloads):
+    client = app.test_client()
+    start = time.perf_counter()
+    for payload in payloads:
+        response = client.post('/iot/api/data', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"/iot/api/data returned {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - start
+
+
+def bench_batch(app, payloads, batch_size):
+    client = app.test_client()
+    start = time.perf_counter()
+    for offset in range(0, len(payloads), batch_size):
+        response = client.post('/iot/api/data/batch', json={'readings': payloads[offset:offset + batch_size]})
+        if response.status_code != 200:
+            raise RuntimeError(f"/iot/api/data/batch returned {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - start
+
+
+def bench_frames(app, payloads, batch_size):
+    from app.utils.iot_frames import encode_frame, FRAME_CONTENT_TYPE
+
+    client = app.test_client()
+    frames = [
+        encode_frame(payload['mac_address'], {
+            'temperature': payload['temp'],
+            'humidity': payload['humidity'],
+            'soil_moisture': payload['soil']
+        })
+        for payload in payloads
+    ]
+    start = time.perf_counter()
+    for offset in range(0, len(frames), batch_size):
+        body = b''.join(frames[offset:offset + batch_size])
+        response = client.post('/iot/api/data/batch', data=body, content_type=FRAME_CONTENT_TYPE)
+        if response.status_code != 200:
+            raise RuntimeError(f"/iot/api/data/batch returned {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - start
+
+
+def bench_stream(app, payloads):
+    client = app.test_client()
+    body = b''.join(json.dumps(payload).encode() + b'\n' for payload in payloads)
+    start = time.perf_counter()
+    response = client.post('/iot/api/data/stream', input_stream=io.BytesIO(body), content_type='application/x-ndjson')
+    if response.status_code != 200:
+        raise RuntimeError(f"/iot/api/data/stream returned {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - start
+
+
+def report(name, elapsed, payloads, rows):
+    print(f"{name:<12} {elapsed:8.2f}s  {len(payloads) / elapsed:10.1f} payloads/s  {rows / elapsed:10.1f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gateways', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.gateways, args.rounds)
+    print(f"IoT ingestion benchmark: {args.gateways} gateways x {args.rounds} rounds = {len(payloads)} payloads")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = fresh_app(os.path.join(tmp, 'single.db'))
+        elapsed = bench_single(app, payloads)
+        report('per-request', elapsed, payloads, count_rows(app))
+
+        app = fresh_app(os.path.join(tmp, 'batch.db'))
+        elapsed = bench_batch(app, payloads, args.batch_size)
+        report(f'batch({args.batch_size})', elapsed, payloads, count_rows(app))
+
+        app = fresh_app(os.path.join(tmp, 'frames.db'))
+        elapsed = bench_frames(app, payloads, args.batch_size)
+        report(f'frames({args.batch_size})', elapsed, payloads, count_rows(app))
+
+        app = fresh_app(os.path.join(tmp, 'stream.db'))
+        elapsed = bench_stream(app, payloads)
+        report('stream', elapsed, payloads, count_rows(app))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark application startup time.
+
+Times `import app` and `create_app()` in fresh interpreters, which is what
+each gunicorn worker and test run pays, then `create_app()` again within
+one process once imports are cached. Background threads are switched off
+and an empty SQLite database is used, so only startup work is measured.
+With --gemini-key, a (fake) Gemini key is configured to check that it
+adds no startup cost.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--warm-runs 20] [--gemini-key KEY]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Run in a fresh interpreter; prints {"import": seconds, "create_app": seconds}
+COLD_START = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported}))
+"""
+
+
+def bench_env(db_path, gemini_key):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        IOT_LIVENESS_SWEEPER='false',
+        WEATHER_REFRESHER='false'
+    )
+    env.pop('GEMINI_API_KEY', None)
+    if gemini_key:
+        env['GEMINI_API_KEY'] = gemini_key
+    return env
+
+
+def bench_cold(runs, env):
+    """Time import and create_app() in `runs` fresh interpreters"""
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', COLD_START],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        timings.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def bench_warm(runs, env):
+    """Time create_app() `runs` times in this process, after a first untimed call"""
+    os.environ.update(env)
+    if 'GEMINI_API_KEY' not in env:
+        os.environ.pop('GEMINI_API_KEY', None)
+
+    from app import create_app
+    create_app()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        create_app()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, seconds):
+    print(f"{label:<22} median {statistics.median(seconds) * 1000:8.1f} ms   "
+          f"min {min(seconds) * 1000:8.1f} ms   max {max(seconds) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm-runs', type=int, default=20)
+    parser.add_argument('--gemini-key', help='GEMINI_API_KEY to configure; no request is awaited at startup')
+    args = parser.parse_args()
+
+    print(f"Startup benchmark: {args.runs} cold starts, {args.warm_runs} warm create_app() calls"
+          f"{', Gemini key set' if args.gemini_key else ''}")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(os.path.join(tmp, 'startup.db'), args.gemini_key)
+        cold = bench_cold(args.runs, env)
+        report('cold import app', [t['import'] for t in cold])
+        report('cold create_app()', [t['create_app'] for t in cold])
+        report('cold total', [t['import'] + t['create_app'] for t in cold])
+        report('warm create_app()', bench_warm(args.warm_runs, env))
+
+
+if __name__ == '__main__':
+    main()
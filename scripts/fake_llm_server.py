@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the chatbot's language model.
+
+Speaks the JSON API of the 'http' LLM backend: POST {"prompt", "stream"}
+answers {"text": ...}, or with "stream": true one {"text": ...} line per
+word. Latency and failures can be dialled in to watch the LLM layer's
+deadline, fallback and circuit breaker at work (GET /admin/llm).
+
+Usage:
+    python scripts/fake_llm_server.py [--port 8765] [--latency 0.5] [--fail-rate 0.2] [--chunk-delay 0.05]
+
+Then run the app with:
+    LLM_BACKEND=http LLM_HTTP_URL=http://127.0.0.1:8765/generate python run.py
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("For tomatoes in Tunisia, plant in early spring once the soil is above 15°C, "
+          "water deeply two or three times a week at the roots, mulch to keep the soil "
+          "moist, and watch for whitefly and early blight.")
+
+
+def make_handler(args):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            time.sleep(args.latency)
+            if random.random() < args.fail_rate:
+                self.send_error(503, 'Simulated model failure')
+                return
+
+            if not body.get('stream'):
+                payload = json.dumps({'text': ANSWER}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for word in ANSWER.split(' '):
+                    self._write_chunk(json.dumps({'text': word + ' '}).encode() + b'\n')
+                    time.sleep(args.chunk_delay)
+                self._write_chunk(b'')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The app stopped reading
+
+        def _write_chunk(self, data):
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        def log_message(self, format, *log_args):
+            if not args.quiet:
+                super().log_message(format, *log_args)
+
+    return FakeLLMHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before answering')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with a 503')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Seconds between streamed words')
+    parser.add_argument('--quiet', action='store_true', help='Do not log requests')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/generate "
+          f"(latency {args.latency}s, fail rate {args.fail_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Load-test IoT ingestion with thousands of simulated gateways.
+
+Each gateway is an asyncio task that sends readings from
+simulate_sensors.simulate_sensor_data at --rate readings per second, with
+random jitter. Payloads are posted one per request (--mode single), or
+pooled and posted by --senders workers in batches of --batch-size
+(--mode batch).
+
+By default requests go to an in-process app on a throwaway SQLite database,
+through Flask's test client on a thread pool. Pass --target
+http://host:port to load a running server instead (needs httpx), and
+--database-url to count its rows.
+
+Reports p50/p95/p99 request latency, readings/s and IoTData rows/s.
+
+Usage:
+    python scripts/load_test_iot.py --devices 2000 --rate 0.5 --duration 30
+    python scripts/load_test_iot.py --mode batch --batch-size 500 --new-mac-ratio 0.05
+    python scripts/load_test_iot.py --target http://localhost:5000 --mix temp=1,humidity=0.5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulate_sensors import simulate_sensor_data
+
+SENSOR_KEYS = ['temp', 'humidity', 'soil']
+
+
+def gateway_mac(prefix, index):
+    return f"{prefix}:{index >> 16 & 0xFF:02X}:{index >> 8 & 0xFF:02X}:{index & 0xFF:02X}"
+
+
+def parse_mix(text):
+    """'temp=1,humidity=0.5' -> chance of each sensor key appearing in a payload"""
+    mix = {key: 0.0 for key in SENSOR_KEYS}
+    for part in text.split(','):
+        key, _, weight = part.partition('=')
+        if key.strip() not in mix:
+            raise argparse.ArgumentTypeError(f"Unknown sensor '{key}' (expected one of {', '.join(SENSOR_KEYS)})")
+        mix[key.strip()] = float(weight or 1)
+    return mix
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.readings = 0
+        self.first_error = None
+
+    def record(self, latency, readings, error=None):
+        self.latencies.append(latency)
+        self.requests += 1
+        if error:
+            self.errors += 1
+            self.first_error = self.first_error or error
+        else:
+            self.readings += readings
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class InProcessTarget:
+    """Flask test client on a thread pool, bound to a fresh SQLite database"""
+
+    def __init__(self, db_path, workers):
+        from scripts.bench_iot_ingest import fresh_app
+
+        self.app = fresh_app(db_path)
+        self.app.logger.disabled = True
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def _post(self, path, payload):
+        response = self.app.test_client().post(path, json=payload)
+        return response.status_code, response.get_data(as_text=True)
+
+    async def post(self, path, payload):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._post, path, payload)
+
+    def count_rows(self):
+        from app import db
+        from app.models.iot import IoTData
+
+        with self.app.app_context():
+            return db.session.query(IoTData).count()
+
+    async def close(self):
+        self.pool.shutdown()
+
+
+class ServerTarget:
+    """A running server, reached with httpx"""
+
+    def __init__(self, base_url, workers, database_url=None):
+        try:
+            import httpx
+        except ImportError:
+            sys.exit("--target needs httpx: pip install httpx")
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url, timeout=30,
+            limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+        )
+        self.engine = None
+        if database_url:
+            from sqlalchemy import create_engine
+            self.engine = create_engine(database_url)
+
+    async def post(self, path, payload):
+        response = await self.client.post(path, json=payload)
+        return response.status_code, response.text
+
+    def count_rows(self):
+        if self.engine is None:
+            return None
+        from sqlalchemy import text
+        with self.engine.connect() as conn:
+            return conn.execute(text('SELECT COUNT(*) FROM iot_data')).scalar()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def make_payload(mac, mix):
+    data = simulate_sensor_data(mac)
+    payload = {'mac_address': mac}
+    for key in SENSOR_KEYS:
+        if random.random() < mix[key]:
+            payload[key] = data[key]
+    # Never send an empty reading
+    if len(payload) == 1:
+        payload['temp'] = data['temp']
+    return payload
+
+
+async def send(target, stats, semaphore, path, payload, readings):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            status, body = await target.post(path, payload)
+            error = None if status == 200 else f"HTTP {status}: {body[:200]}"
+        except Exception as e:
+            error = str(e)
+        stats.record(time.perf_counter() - start, readings, error)
+
+
+async def gateway(index, args, deadline, emit):
+    """One simulated gateway, emitting payloads at --rate with jitter"""
+    interval = 1 / args.rate
+    # Spread the gateways' first readings over one interval
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.perf_counter() < deadline:
+        if random.random() < args.new_mac_ratio:
+            mac = gateway_mac('EE:EE:EE', random.randrange(1 << 24))
+        else:
+            mac = gateway_mac('AA:BB:CC', index)
+        await emit(make_payload(mac, args.mix))
+        await asyncio.sleep(random.expovariate(1 / interval) if args.jitter else interval)
+
+
+async def run_load(target, args):
+    stats = Stats()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    deadline = time.perf_counter() + args.duration
+    pending = set()
+
+    if args.mode == 'single':
+        async def emit(payload):
+            task = asyncio.create_task(send(target, stats, semaphore, '/iot/api/data', payload, len(payload) - 1))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        senders = []
+    else:
+        queue = asyncio.Queue()
+
+        async def emit(payload):
+            queue.put_nowait(payload)
+
+        async def sender():
+            while True:
+                batch = [await queue.get()]
+                try:
+                    await asyncio.wait_for(_fill(queue, batch, args.batch_size), args.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                readings = sum(len(payload) - 1 for payload in batch)
+                await send(target, stats, semaphore, '/iot/api/data/batch', batch, readings)
+                for _ in batch:
+                    queue.task_done()
+
+        senders = [asyncio.create_task(sender()) for _ in range(args.senders)]
+
+    gateways = [asyncio.create_task(gateway(i, args, deadline, emit)) for i in range(args.devices)]
+    await asyncio.gather(*gateways)
+    if args.mode == 'batch':
+        await queue.join()
+        for task in senders:
+            task.cancel()
+    if pending:
+        await asyncio.gather(*pending)
+    return stats
+
+
+async def _fill(queue, batch, size):
+    while len(batch) < size:
+        batch.append(await queue.get())
+
+
+async def warm_up(target, args):
+    """Register every known gateway so the run measures steady-state ingestion"""
+    payloads = [
+        {'mac_address': gateway_mac('AA:BB:CC', i), 'temp': 20, 'humidity': 50, 'soil': 1800}
+        for i in range(args.devices)
+    ]
+    for offset in range(0, len(payloads), 500):
+        status, body = await target.post('/iot/api/data/batch', payloads[offset:offset + 500])
+        if status != 200:
+            sys.exit(f"Warm-up failed: HTTP {status}: {body[:200]}")
+
+
+async def main_async(args):
+    if args.target == 'inprocess':
+        tmp = tempfile.TemporaryDirectory()
+        target = InProcessTarget(os.path.join(tmp.name, 'load.db'), args.concurrency)
+    else:
+        tmp = None
+        target = ServerTarget(args.target, args.concurrency, args.database_url)
+
+    try:
+        if not args.no_warmup:
+            await warm_up(target, args)
+
+        rows_before = target.count_rows()
+        start = time.perf_counter()
+        stats = await run_load(target, args)
+        elapsed = time.perf_counter() - start
+        rows_after = target.count_rows()
+    finally:
+        await target.close()
+        if tmp:
+            tmp.cleanup()
+
+    print("=" * 60)
+    print(f"requests     {stats.requests:10d}   errors {stats.errors}")
+    print(f"latency p50  {stats.percentile(50) * 1000:10.1f} ms")
+    print(f"latency p95  {stats.percentile(95) * 1000:10.1f} ms")
+    print(f"latency p99  {stats.percentile(99) * 1000:10.1f} ms")
+    print(f"readings/s   {stats.readings / elapsed:10.1f}")
+    if rows_before is not None:
+        print(f"DB rows/s    {(rows_after - rows_before) / elapsed:10.1f}")
+    else:
+        print("DB rows/s           n/a   (pass --database-url to count)")
+    if stats.first_error:
+        print(f"first error: {stats.first_error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default='inprocess', help="'inprocess' or a server URL")
+    parser.add_argument('--database-url', help="database of a --target server, to count rows")
+    parser.add_argument('--devices', type=int, default=1000, help="simulated gateways")
+    parser.add_argument('--rate', type=float, default=0.2, help="readings per second per gateway")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to generate load")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('temp=1,humidity=1,soil=1'),
+                        help="chance of each sensor key per payload, e.g. temp=1,humidity=0.5")
+    parser.add_argument('--new-mac-ratio', type=float, default=0.0, help="share of payloads from never-seen MACs")
+    parser.add_argument('--mode', choices=['single', 'batch'], default='single')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--flush-interval', type=float, default=0.5, help="max seconds a batch waits to fill")
+    parser.add_argument('--senders', type=int, default=4, help="batch mode: concurrent batch posters")
+    parser.add_argument('--concurrency', type=int, default=8, help="max requests in flight")
+    parser.add_argument('--no-jitter', dest='jitter', action='store_false', help="send at exact intervals")
+    parser.add_argument('--no-warmup', action='store_true', help="skip pre-registering the known gateways")
+    args = parser.parse_args()
+
+    print(f"IoT load test: {args.devices} gateways x {args.rate}/s for {args.duration}s, "
+          f"mode={args.mode}, target={args.target}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Apply the IoT history retention policy.
+
+Compacts closed windows into the columnar archive (when IOT_ARCHIVE_ENABLED),
+then deletes raw readings and rollup buckets older than the configured
+IOT_*_RETENTION_DAYS. Run it from cron, e.g. hourly.
+
+Usage:
+    python scripts/prune_iot_data.py                    # archive, then prune expired rows
+    python scripts/prune_iot_data.py --archive-only     # only compact closed windows
+    python scripts/prune_iot_data.py --rebuild-rollups  # recompute rollups still covered by raw data first
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.utils.iot_archive import compact_archive
+from app.utils.iot_rollups import prune_history, rebuild_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='recompute the 1m/1h/1d buckets still covered by iot_data before pruning')
+    parser.add_argument('--archive-only', action='store_true',
+                        help='compact closed windows into the archive without pruning')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.rebuild_rollups:
+            print("Rebuilding IoT rollups from raw data...")
+            count = rebuild_rollups()
+            print(f"✓ Folded {count} raw readings into rollups")
+
+        if app.config['IOT_ARCHIVE_ENABLED']:
+            print("Compacting closed IoT windows into the archive...")
+            written = compact_archive()
+            print(f"✓ Archived {sum(written.values())} readings for {len(written)} devices")
+        elif args.archive_only:
+            print("✗ IOT_ARCHIVE_ENABLED is off; nothing to do")
+
+        if args.archive_only:
+            return
+
+        print("Pruning IoT history...")
+        for tier, count in prune_history().items():
+            print(f"✓ {tier}: deleted {count} rows")
+
+
+if __name__ == '__main__':
+    main()
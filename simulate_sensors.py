@@ -2,7 +2,13 @@
 """
 IoT Sensor Data Simulator
 Sends fake sensor data to test the IoT monitoring system
+
+Usage:
+    python simulate_sensors.py                 # one request per reading
+    python simulate_sensors.py --stream        # one long-lived NDJSON stream
+    python simulate_sensors.py --stream --interval 1
 """
+import argparse
 import requests
 import json
 import random
@@ -13,7 +19,7 @@ from datetime import datetime
 SERVER_URL = "http://localhost:5000"
 DEVICE_MAC = "AA:BB:CC:DD:EE:FF"
 
-def simulate_sensor_data():
+def simulate_sensor_data(mac_address=DEVICE_MAC):
     """Generate realistic sensor data"""
     
     # Base values that fluctuate realistically
@@ -36,7 +42,7 @@ def simulate_sensor_data():
         humidity_variation += 8
     
     return {
-        'mac_address': DEVICE_MAC,
+        'mac_address': mac_address,
         'temp': round(base_temp + temp_variation, 1),
         'humidity': round(base_humidity + humidity_variation, 1),
         'soil': int(base_soil + soil_variation)
@@ -63,17 +69,52 @@ def send_data_to_server(data):
         print(f"✗ Connection error: {e}")
         return False
 
+def stream_readings(interval):
+    """Yield one NDJSON line per reading, forever"""
+    while True:
+        sensor_data = simulate_sensor_data()
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] Streamed: {sensor_data}")
+        yield (json.dumps(sensor_data) + "\n").encode()
+        time.sleep(interval)
+
+def stream_to_server(interval):
+    """Keep one chunked request open and write readings into it"""
+    while True:
+        try:
+            # A generator body makes requests use chunked transfer encoding
+            response = requests.post(
+                f"{SERVER_URL}/iot/api/data/stream",
+                data=stream_readings(interval),
+                headers={'Content-Type': 'application/x-ndjson'}
+            )
+            print(f"Stream closed by server ({response.status_code}): {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"✗ Connection error: {e}")
+        
+        print("Reconnecting in 5 seconds...")
+        time.sleep(5)
+
 def main():
     """Main simulation loop"""
+    parser = argparse.ArgumentParser(description="IoT Sensor Data Simulator")
+    parser.add_argument('--stream', action='store_true', help="send readings over one NDJSON stream")
+    parser.add_argument('--interval', type=float, default=30, help="seconds between readings")
+    args = parser.parse_args()
+    
     print("🌱 IoT Sensor Data Simulator")
     print("=" * 40)
     print(f"Target Server: {SERVER_URL}")
     print(f"Device MAC: {DEVICE_MAC}")
+    print(f"Mode: {'stream' if args.stream else 'request per reading'}")
     print("=" * 40)
     print("Press Ctrl+C to stop")
     print()
     
     try:
+        if args.stream:
+            stream_to_server(args.interval)
+        
         while True:
             # Generate and send sensor data
             sensor_data = simulate_sensor_data()
@@ -90,7 +131,7 @@ def main():
             print("-" * 30)
             
             # Wait before next reading (simulate sensor interval)
-            time.sleep(30)  # Send data every 30 seconds
+            time.sleep(args.interval)  # Send data every 30 seconds by default
             
     except KeyboardInterrupt:
         print("\n👋 Simulator stopped by user")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+AgriConnect IoT alert engine test
+
+Feeds readings through AlertEngine.evaluate() and checks the alerts it
+raises for threshold, rate and z-score rules, how late readings and
+batches larger than the window treat the ring buffers, that readings are
+only buffered once their transaction commits, and that rule changes made
+by another process are picked up after the reload interval.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+def make_engine(window_size=60, min_samples=10, **rule):
+    """An engine holding one rule, for device 1, without touching the database"""
+    from app.utils.iot_alerts import AlertEngine
+
+    engine = AlertEngine(window_size=window_size, min_samples=min_samples, reload_seconds=3600)
+    engine._reset_rules([dict({
+        'device_id': 1, 'min_value': None, 'max_value': None, 'max_rate': None,
+        'zscore_threshold': None, 'severity': 'high', 'sensor_type': 'temperature'
+    }, **rule)])
+    engine._rules_loaded = True
+    engine._loaded_at = time.monotonic()
+    return engine
+
+def readings(values, start=START, step=60, device_id=1):
+    """IoTData row dicts, `step` seconds apart"""
+    return [
+        {'device_id': device_id, 'value': value, 'unit': '°C', 'timestamp': start + timedelta(seconds=step * i)}
+        for i, value in enumerate(values)
+    ]
+
+def evaluate(engine, rows):
+    """Evaluate a batch and buffer it, as a committed ingest transaction does"""
+    alerts = engine.evaluate(rows)
+    engine.push(rows)
+    return alerts
+
+def make_app():
+    """An app on a fresh database with one temperature probe limited to 30; returns (app, device id)"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'alerts.db')}"
+
+    from app import create_app, db
+    from app.models.iot import IoTDevice, IoTAlertRule
+    from app.models.user import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='alerts', email='alerts@example.com', first_name='Alert',
+                    last_name='Rules', user_type='farmer')
+        user.set_password('alerts')
+        db.session.add(user)
+        db.session.flush()
+        device = IoTDevice(name='Probe', device_type='sensor', sensor_type='temperature',
+                           location='Farm', owner_id=user.id)
+        db.session.add(device)
+        db.session.flush()
+        db.session.add(IoTAlertRule(device_id=device.id, max_value=30))
+        db.session.commit()
+        return app, device.id
+
+def test_threshold():
+    """Readings outside min_value/max_value raise threshold alerts"""
+    engine = make_engine(min_value=10, max_value=30)
+
+    assert evaluate(engine, readings([20, 25])) == []
+
+    alerts = evaluate(engine, readings([35, 5], start=START + timedelta(minutes=5)))
+    assert [alert['alert_type'] for alert in alerts] == ['threshold_exceeded', 'threshold_exceeded']
+    assert [alert['threshold_value'] for alert in alerts] == [30.0, 10.0]
+    assert 'above maximum' in alerts[0]['message'] and 'below minimum' in alerts[1]['message']
+    assert alerts[0]['severity'] == 'high' and alerts[0]['actual_value'] == 35.0
+    assert evaluate(engine, readings([7], device_id=2)) == []
+    print("✅ Threshold alerts raised above the maximum and below the minimum")
+
+def test_rate():
+    """A change faster than max_rate per second is an anomaly, across batches too"""
+    engine = make_engine(max_rate=0.5)
+
+    # 20 -> 25 over 60 s is 0.083/s
+    assert evaluate(engine, readings([20, 25])) == []
+
+    # 25 (buffered, 60 s in) -> 85 at 120 s is 1/s
+    alerts = evaluate(engine, readings([85], start=START + timedelta(seconds=120)))
+    assert len(alerts) == 1
+    assert alerts[0]['alert_type'] == 'data_anomaly' and 'too fast' in alerts[0]['title']
+    assert alerts[0]['threshold_value'] == 0.5
+
+    # Within one batch, each reading is compared with the one before it
+    alerts = evaluate(engine, readings([85, 86, 20], start=START + timedelta(seconds=180), step=10))
+    assert [alert['actual_value'] for alert in alerts] == [20.0]
+    print("✅ Rate alerts compare each reading with the previous one")
+
+def test_zscore():
+    """Readings far from the rolling mean are anomalies once enough samples are buffered"""
+    engine = make_engine(min_samples=10, zscore_threshold=3)
+    steady = [20 + (i % 3 - 1) * 0.5 for i in range(9)]
+
+    # Nine samples are not enough to judge a spike
+    assert evaluate(engine, readings(steady + [40])) == []
+    assert engine._fill[0] == 10
+
+    alerts = evaluate(engine, readings([20.5, 60], start=START + timedelta(minutes=10)))
+    assert len(alerts) == 1
+    assert alerts[0]['actual_value'] == 60.0 and 'out of pattern' in alerts[0]['title']
+    assert alerts[0]['threshold_value'] == 3.0
+    print("✅ Z-score alerts wait for min_samples and flag outliers")
+
+def test_late_reading():
+    """A reading older than the last buffered one is threshold-checked but not buffered"""
+    engine = make_engine(max_value=30, max_rate=0.01)
+    evaluate(engine, readings([20], start=START + timedelta(minutes=10)))
+    fill, head, last_time = engine._fill[0], engine._head[0], engine._last_time[0]
+
+    # A jump that would be far too fast, but it arrived late: no rate alert
+    assert evaluate(engine, readings([29], start=START)) == []
+    assert (engine._fill[0], engine._head[0], engine._last_time[0]) == (fill, head, last_time)
+    assert engine._last_value[0] == 20
+
+    # Thresholds still apply to late readings
+    alerts = evaluate(engine, readings([31], start=START + timedelta(minutes=1)))
+    assert [alert['alert_type'] for alert in alerts] == ['threshold_exceeded']
+    assert engine._fill[0] == fill
+    print("✅ Late readings skip the rate check and the ring buffer")
+
+def test_window_overflow():
+    """A batch longer than the window keeps only its newest readings"""
+    engine = make_engine(window_size=5)
+
+    evaluate(engine, readings([1, 2, 3]))
+    evaluate(engine, readings(list(range(10, 22)), start=START + timedelta(hours=1)))
+    assert engine._fill[0] == 5
+    assert sorted(engine._values[0].tolist()) == [17, 18, 19, 20, 21]
+    assert engine._last_value[0] == 21
+
+    # The head points past the newest value, so the next one replaces the oldest
+    evaluate(engine, readings([99], start=START + timedelta(hours=2)))
+    assert sorted(engine._values[0].tolist()) == [18, 19, 20, 21, 99]
+    assert not np.isnan(engine._values[0]).any()
+    print("✅ Oversized batches keep the newest window of readings")
+
+def test_rules_reload():
+    """Rule changes made outside this process are picked up after the reload interval"""
+    from app import db
+    from app.utils.iot_alerts import AlertEngine
+
+    app, device_id = make_app()
+    with app.app_context():
+        engine = AlertEngine(reload_seconds=0.2)
+        assert len(evaluate(engine, readings([35], device_id=device_id))) == 1
+
+        # Another worker raises the limit; no mapper event reaches this engine
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('UPDATE iot_alert_rules SET max_value = 40')
+        assert len(evaluate(engine, readings([35], start=START + timedelta(minutes=1), device_id=device_id))) == 1
+
+        time.sleep(0.25)
+        assert evaluate(engine, readings([35], start=START + timedelta(minutes=2), device_id=device_id)) == []
+    print("✅ Rules edited elsewhere are reloaded within the interval")
+
+def test_buffered_on_commit():
+    """Readings enter the ring buffers when their transaction commits, never on rollback"""
+    from app import db
+    from app.utils.iot_alerts import alert_engine, raise_alerts
+
+    app, device_id = make_app()
+    with app.app_context():
+        batch = readings([20, 21], device_id=device_id)
+
+        # A rolled back batch, retried and committed, is buffered once
+        raise_alerts(batch)
+        assert alert_engine._fill[alert_engine._slots[device_id]] == 0
+        db.session.rollback()
+        raise_alerts(batch)
+        db.session.commit()
+        slot = alert_engine._slots[device_id]
+        assert alert_engine._fill[slot] == 2
+        assert alert_engine._last_value[slot] == 21
+    print("✅ Ring buffers only take committed readings")
+
+def main():
+    """Main test function"""
+    print("🧪 IoT Alert Engine Test")
+    print("=" * 40)
+
+    passed = 0
+    tests = [test_threshold, test_rate, test_zscore, test_late_reading, test_window_overflow,
+             test_rules_reload, test_buffered_on_commit]
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+
+    print("=" * 40)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+AgriConnect IoT query-plan regression test
+
+Drives the hot IoT endpoints through the test client, records every SELECT
+they issue, and runs EXPLAIN on each one. Fails if any endpoint does not
+answer 200, or if any IoT table is read with a full table scan instead of
+an index.
+
+SQLite always runs against a scratch database. PostgreSQL runs only when
+TEST_POSTGRES_URL points at an empty database that may be wiped, and is
+reported as skipped otherwise, e.g.
+    TEST_POSTGRES_URL=postgresql://localhost/agriconnect_plans python test_query_plans.py
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+IOT_TABLES = (
+    'iot_devices', 'iot_data', 'iot_latest_readings', 'iot_alerts', 'iot_commands',
+    'iot_data_1m', 'iot_data_1h', 'iot_data_1d'
+)
+
+def hot_requests(device_id):
+    """(method, url, json) for every IoT endpoint whose queries must stay indexed"""
+    return [
+        ('POST', '/iot/api/data/batch', [{'mac_address': 'AA:BB:CC:00:00:02', 'temp': 21.5, 'humidity': 55}]),
+        ('GET', '/iot/', None),
+        ('GET', '/iot/monitoring', None),
+        ('GET', '/iot/api/data/latest', None),
+        ('GET', f'/iot/api/command?device_id={device_id}', None),
+        ('GET', '/api/iot/devices', None),
+        ('GET', f'/api/iot/device/{device_id}/data?hours=24', None),
+        ('GET', f'/api/iot/device/{device_id}/data?hours=168&resolution=3600', None),
+        ('GET', f'/api/iot/series?device_id={device_id}&hours=24&bucket=90&agg=avg,max', None),
+        ('GET', f'/api/iot/series?device_id={device_id}&hours=168&bucket=3600&agg=avg,min,max,count', None),
+        ('GET', '/api/notifications', None),
+        ('GET', '/dashboard/', None),
+    ]
+
+def record_hot_queries(database_url):
+    """Seed a fresh database, hit the hot endpoints and return their SELECTs"""
+    os.environ['DATABASE_URL'] = database_url
+
+    from sqlalchemy import event
+    from app import create_app, db
+    from app.models.user import User
+    from app.models.iot import IoTDevice, IoTAlert, IoTCommand
+    from app.utils.iot_registry import device_registry
+
+    app = create_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        user = User(username='plans', email='plans@example.com', first_name='Query',
+                    last_name='Plans', user_type='farmer')
+        user.set_password('plans')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    client.post('/iot/api/data/batch', json=[{'mac_address': 'AA:BB:CC:00:00:01', 'temp': 20, 'humidity': 50, 'soil': 1800}])
+
+    with app.app_context():
+        device = IoTDevice.query.filter_by(sensor_type='temperature').first()
+        device_id = device.id
+        db.session.add(IoTAlert(title='Hot', message='Too hot', alert_type='threshold_exceeded', device_id=device_id))
+        db.session.add(IoTCommand(command='pump_on', device_id=device_id, user_id=user_id))
+        db.session.commit()
+
+    device_registry.clear()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    statements = []
+    errors = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            for method, url, payload in hot_requests(device_id):
+                response = client.open(url, method=method, json=payload)
+                if response.status_code != 200:
+                    errors.append(f'{method} {url} -> {response.status_code}')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+    # A failing endpoint skips the queries it should have run
+    assert not errors, 'Hot endpoints failed:\n' + '\n'.join(errors)
+    return app, statements
+
+def sqlite_full_scans(conn, statement, parameters):
+    """Tables an SQLite plan reads with a full scan"""
+    plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        # "SCAN t" is a full table scan; "SCAN t USING INDEX" walks a whole index
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and match.group(1) in IOT_TABLES:
+            scans.append(detail)
+    return scans
+
+def postgres_full_scans(conn, statement, parameters):
+    """Tables a PostgreSQL plan reads with a sequential scan"""
+    # Tiny test tables always look cheaper to seq-scan, so make the planner
+    # show whether an index could be used at all
+    conn.exec_driver_sql('SET enable_seqscan = off')
+    plan = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+    scans = []
+    for (line,) in plan:
+        match = re.search(r'Seq Scan on (\w+)', line)
+        if match and match.group(1) in IOT_TABLES:
+            scans.append(line.strip())
+    return scans
+
+def check_query_plans(database_url, full_scans):
+    from app import db
+
+    app, statements = record_hot_queries(database_url)
+    assert statements, 'No queries were recorded'
+
+    failures = []
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                scans = full_scans(conn, statement, parameters)
+                if scans:
+                    failures.append(f"{' '.join(statement.split())}\n    -> {'; '.join(scans)}")
+
+    assert not failures, 'Full table scans on hot IoT queries:\n' + '\n'.join(failures)
+    return len(statements)
+
+def test_sqlite_query_plans():
+    """Every hot IoT query is index-backed on SQLite"""
+    with tempfile.TemporaryDirectory() as tmp:
+        count = check_query_plans(f"sqlite:///{os.path.join(tmp, 'plans.db')}", sqlite_full_scans)
+    print(f"✅ SQLite: {count} hot queries use indexes")
+
+def test_postgres_query_plans():
+    """Every hot IoT query is index-backed on PostgreSQL (needs TEST_POSTGRES_URL)"""
+    database_url = os.environ.get('TEST_POSTGRES_URL')
+    if not database_url:
+        pytest.skip('TEST_POSTGRES_URL not set')
+    count = check_query_plans(database_url, postgres_full_scans)
+    print(f"✅ PostgreSQL: {count} hot queries use indexes")
+
+def main():
+    """Main test function"""
+    print("🧪 IoT Query Plan Test")
+    print("=" * 40)
+
+    passed = 0
+    skipped = 0
+    tests = [test_sqlite_query_plans, test_postgres_query_plans]
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except pytest.skip.Exception as e:
+            skipped += 1
+            print(f"⚠️ {test.__name__} skipped: {e.msg}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+
+    print("=" * 40)
+    print(f"Test Results: {passed}/{len(tests)} tests passed, {skipped} skipped")
+    return passed + skipped == len(tests)
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)